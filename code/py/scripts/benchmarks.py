@@ -0,0 +1,197 @@
+"""Benchmarks of the hot paths of the pipeline on synthetic data.
+
+Run from `code/py`, e.g.
+
+  python -m scripts.benchmarks --outfile baseline.json
+  python -m scripts.benchmarks --baseline baseline.json --tolerance 0.25
+
+to print the time and peak memory of each benchmark. Save the results of a
+known good version with `--outfile` and pass them as `--baseline` to later
+runs to flag regressions (the script exits with status 1 if any).
+"""
+import argparse, os, shutil, sys, tempfile
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from typing import Dict
+
+from src.Benchmarks import (
+  compare, load, make_county_names, make_direct_requirements, make_extract,
+  make_industry_crosswalk, make_io_names, make_tract_file, run, save
+)
+from src.Benchmarks.harness import TOLERANCE
+from src.Benchmarks.synthetic import IO_CODES, acs_industries, io_industries
+from src.Crosswalks import PumaCountyCrosswalk
+from src.IpumsExtract import IpumsExtract
+from scripts.downstream_tariff_exposure import DownstreamTariffExposure
+
+
+def make_data(
+  directory: str, rows: int = 200000, n: int = 400, seed: int = 0
+) -> Dict[str, object]:
+  """Synthetic inputs of the benchmarks.
+
+  Args:
+      directory (str): Where to write the synthetic files.
+      rows (int, optional): Records in the IPUMS extract.
+      n (int, optional): Industries in the IO table.
+      seed (int, optional): Random seed.
+
+  Returns:
+      dict: Paths to the extract ('dat', 'do') and tract file ('tracts'),
+        the direct requirements ('DR'), the ACS <- IO crosswalk ('cw') and
+        the names of the IO industries ('io_ind') and counties
+        ('county_names').
+  """
+  acs_codes = acs_industries()
+  dat, do = make_extract(
+    directory, rows=rows, seed=seed, industries=acs_codes
+  )
+
+  return {
+    'dat': dat,
+    'do': do,
+    'tracts': make_tract_file(
+      os.path.join(directory, 'tract_to_puma.txt'), seed=seed
+    ),
+    'DR': make_direct_requirements(n, seed=seed),
+    'cw': make_industry_crosswalk(io_industries(n), acs_codes, seed=seed),
+    'io_ind': make_io_names(n),
+    'county_names': make_county_names()
+  }
+
+
+def make_dte(data: dict) -> DownstreamTariffExposure:
+  """`DownstreamTariffExposure` holding the synthetic inputs (none of the
+  files under `data/` are read and nothing is cached)."""
+  return DownstreamTariffExposure(
+    cache_dir=None,
+    io_ind=data['io_ind'],
+    county_names=data['county_names'],
+    DR=data['DR'],
+    acs_io_cw=data['cw'],
+    puma_county_crosswalk=PumaCountyCrosswalk.from_tract_file(
+      data['tracts']
+    )
+  )
+
+
+def benchmarks(data: dict, directory: str) -> dict:
+  """Name -> (setup, func) of each benchmark (see `src.Benchmarks.run`)."""
+
+  def extract(db: bool = False):
+    if not db:
+      return lambda: IpumsExtract(data['dat'], data['do'])
+
+    def setup():
+      fn = os.path.join(directory, 'synthetic.db')
+      if os.path.exists(fn):
+        os.remove(fn)
+      return IpumsExtract(data['dat'], data['do'], db_filename=fn)
+
+    return setup
+
+  def load_chunks(ie):
+    return pd.concat(list(ie.load(chunksize=50000)()), ignore_index=True)
+
+  def exposed(dte):
+    return dte.what_industries_are_most_exposed(IO_CODES)
+
+  dte = make_dte(data)
+  exp = dte.what_industries_are_most_exposed(IO_CODES)
+
+  pumas = dte.puma_county_crosswalk.pumas
+  ped = pd.DataFrame(
+    np.random.default_rng(0).random((len(pumas), 5)),
+    index=pumas,
+    columns=['tariff_exp_{}'.format(ii) for ii in range(5)]
+  )
+
+  return {
+    'ipums.load': (extract(), lambda ie: ie.load()),
+    'ipums.load_chunks': (extract(), load_chunks),
+    'ipums.to_sql': (
+      extract(db=True),
+      lambda ie: ie.to_sql(chunksize=50000, verbose=False)
+    ),
+    'ipums.aggregate': (
+      extract(),
+      lambda ie: ie.aggregate(
+        ['indnaics', 'puma', 'statefip'], scale=0.01, verbose=False
+      )
+    ),
+    'io.most_exposed': (lambda: make_dte(data), exposed),
+    'crosswalk.io_to_acs': (
+      lambda: make_dte(data),
+      lambda dte: dte.convert_io_result_to_acs_result(exp)
+    ),
+    'crosswalk.puma_to_county': (
+      lambda: make_dte(data), lambda dte: dte.puma_to_county_conversion(ped)
+    ),
+  }
+
+
+def main(
+  rows: int = 200000,
+  n: int = 400,
+  repeat: int = 3,
+  outfile: [str, None] = None,
+  baseline: [str, None] = None,
+  tolerance: float = TOLERANCE,
+  directory: [str, None] = None
+) -> pd.DataFrame:
+  """Run the benchmarks.
+
+  Args:
+      rows (int, optional): Records in the synthetic IPUMS extract.
+      n (int, optional): Industries in the synthetic IO table.
+      repeat (int, optional): Timed runs of each benchmark.
+      outfile (str, None, optional): Save the results to this JSON file.
+      baseline (str, None, optional): Compare with results saved earlier.
+      tolerance (float, optional): Relative slowdown/extra memory that counts as a regression.
+      directory (str, None, optional): Where to write the synthetic data. Defaults to a temporary directory that is removed afterwards.
+
+  Returns:
+      pd.DataFrame: Time (seconds) and peak memory (MB) of each benchmark (and the ratios to the baseline).
+  """
+  tmp = directory or tempfile.mkdtemp(prefix='benchmarks_')
+
+  try:
+    data = make_data(tmp, rows=rows, n=n)
+    results = run(benchmarks(data, tmp), repeat=repeat)
+  finally:
+    if directory is None:
+      shutil.rmtree(tmp, ignore_errors=True)
+
+  if outfile is not None:
+    save(results, outfile)
+
+  if baseline is not None:
+    results = compare(results, load(baseline), tolerance=tolerance)
+
+  print(tabulate(results.round(4), headers='keys', tablefmt='pipe'))
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--rows', type=int, default=200000,
+                      help='records in the synthetic IPUMS extract')
+  parser.add_argument('--n', type=int, default=400,
+                      help='industries in the synthetic IO table')
+  parser.add_argument('--repeat', type=int, default=3,
+                      help='timed runs of each benchmark')
+  parser.add_argument('--outfile', help='save the results to this JSON file')
+  parser.add_argument('--baseline', help='compare with results saved earlier')
+  parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                      help='relative slowdown/extra memory that counts as a '
+                      'regression (default: %(default)s)')
+  parser.add_argument('--directory',
+                      help='where to write (and keep) the synthetic data')
+  args = parser.parse_args()
+
+  results = main(**vars(args))
+  regressed = results.get('regressed', pd.Series(False, dtype=bool))
+  if regressed.any():
+    print('Regressed: {}'.format(', '.join(results.index[regressed])))
+  sys.exit(int(regressed.any()))
@@ -7,7 +7,32 @@ from tabulate import tabulate
 from typing import Tuple, Dict, List
 import statsmodels.formula.api as sm
 
+from src.Crosswalks import (
+  EmploymentMatrix, IndustryCrosswalk, PumaCountyCrosswalk
+)
+from src.Crosswalks.geokeys import encode_county, encode_puma, format_county
+from src.IOTables import BeaWorkbook, ExposureEngine, IOPanel
 from src.IpumsExtract import IpumsExtract
+from src.Profiling import instrumented, profiling
+from src.ResultCache import ResultCache, cached
+
+IO_IND_FILE = '../data/raw/CxI_DR_1997-2016_Summary.xlsx'
+IO_IND_STORE = '../data/int/CxI_DR_1997-2016_Summary.npz'
+COUNTY_NAMES_FILE = '../data/raw/national_county.txt'
+DR_FILE = '../data/int/DR_io_table.pkl'
+ACS_FILE = '../data/raw/usa_00022.dat.gz'
+ACS_DO_FILE = '../data/raw/usa_00022.do'
+ACS_DB_FILE = '../data/int/acs_2016.db'
+ACS_IO_CROSSWALK_FILE = '../data/int/acs_to_io_crosswalk.pkl'
+TRACT_PUMA_FILE = '../data/raw/2010_Census_Tract_to_2010_PUMA.txt'
+
+# Files read by the results that are cached (see `src.ResultCache.cached`).
+ACS_INPUTS = (ACS_FILE, ACS_DO_FILE, ACS_DB_FILE)
+PUMA_EXPOSURE_INPUTS = (DR_FILE, ACS_IO_CROSSWALK_FILE) + ACS_INPUTS
+
+# Attributes that the cached results depend on besides their input files:
+# the settings, and the data given instead of being read from the files.
+STATE = ('sparse', 'solver', 'injected')
 
 
 class DownstreamTariffExposure(object):
@@ -18,16 +43,89 @@ class DownstreamTariffExposure(object):
       io_ind (TYPE): Description
   """
 
-  def __init__(self):
+  def __init__(
+    self,
+    sparse: bool = False,
+    solver: str = 'direct',
+    cache_dir: [str, None] = '../data/int/dte_cache',
+    cache_size: int = 2**30,
+    io_ind: [pd.DataFrame, None] = None,
+    county_names: [pd.DataFrame, None] = None,
+    DR: [pd.DataFrame, None] = None,
+    acs: [pd.DataFrame, None] = None,
+    acs_io_cw: [Dict[str, List[str]], None] = None,
+    puma_county_crosswalk: [PumaCountyCrosswalk, None] = None
+  ):
     """Init/Main Script
+
+    The data is read from the files under `data/` as it is needed, unless it is given here (e.g. synthetic data for benchmarks).
+
+    Args:
+        sparse (bool, optional): Hold the direct requirements matrix as a sparse (CSR) matrix. Use for large detailed or multi-region IO tables.
+        solver (str, optional): 'direct' (cached LU factorisation) or 'iterative' (GMRES) solves for infinite-order requirements. See `ExposureEngine`.
+        cache_dir (str, None, optional): Where to cache the results of the `get_*` and `what_*` methods between runs (keyed on their arguments, input files, code, settings and the data given here; see `injected`). None to disable. Use `self.cache.invalidate()` to clear.
+        cache_size (int, optional): Maximum size of the cache in bytes. The least recently used results are evicted beyond this.
+        io_ind (pd.DataFrame, None, optional): IO industries, as returned by `get_io_ind`.
+        county_names (pd.DataFrame, None, optional): County names, as returned by `get_county_names`.
+        DR (pd.DataFrame, None, optional): Direct requirements matrix, as returned by `get_io_data`.
+        acs (pd.DataFrame, None, optional): Workers by industry in each PUMA, as returned by `get_acs_data`.
+        acs_io_cw (dict, None, optional): ACS industry code -> list of the IO industry codes it contains (see `get_acs_io_crosswalk`).
+        puma_county_crosswalk (PumaCountyCrosswalk, None, optional): Crosswalk used by `puma_to_county_conversion` (see `get_county_to_puma_crosswalk`).
     """
+    self.sparse = sparse
+    self.solver = solver
+    self.cache = None if cache_dir is None else ResultCache(
+      cache_dir, max_bytes=cache_size
+    )
+
+    # Data given rather than read from the files (see `injected`).
+    self._given = {
+      name: value for name, value in [
+        ('DR', DR), ('acs', acs), ('acs_io_cw', acs_io_cw),
+        ('puma_county_crosswalk', puma_county_crosswalk)
+      ] if value is not None
+    }
+
+    if DR is not None:
+      self._set_io_data(DR)
+    if acs is not None:
+      self.acs = acs
+    if acs_io_cw is not None:
+      self.acs_io_cw = acs_io_cw
+      self.acs_io_crosswalk = IndustryCrosswalk(acs_io_cw)
+    if puma_county_crosswalk is not None:
+      self.puma_county_crosswalk = puma_county_crosswalk
+      self.county_to_puma_cw = puma_county_crosswalk.to_dict()
 
     # Retrieve IO Industries
-    self.get_io_ind()
+    if io_ind is None:
+      self.get_io_ind()
+    else:
+      self.io_ind = io_ind
 
     # Get the names of the counties
-    self.get_county_names()
+    if county_names is None:
+      self.get_county_names()
+    else:
+      self.county_names = county_names
+
+  @property
+  def injected(self) -> Dict[str, object]:
+    """Data in use that was given (to the constructor, or the tract
+    populations of `get_county_to_puma_crosswalk`) rather than read from the
+    files. The cached results are keyed on it, together with the settings
+    and the files.
+
+    Returns:
+        dict: Attribute name -> value.
+    """
+    return {
+      name: value for name, value in self._given.items()
+      if getattr(self, name, None) is value
+    }
 
+  @instrumented(IO_IND_FILE)
+  @cached(IO_IND_FILE, attr='io_ind')
   def get_io_ind(self, inplace: bool = True) -> pd.DataFrame:
     """Retrieves and formats industries for IO tables.
 
@@ -38,72 +136,32 @@ class DownstreamTariffExposure(object):
           naics6 (str) - 6-digit/"Detailed" NAICS code
           *_name (str) - Descriptions of each code
     """
-    io_ind = pd.read_excel(
-      '../data/raw/CxI_DR_1997-2016_Summary.xlsx',
-      sheetname='NAICS codes',
-      names=['naics2', 'naics3', 'naics6', 'naics6_name', 'notes', 'related'],
-      skiprows=3,
-      skipfooter=6
-    )
-
-    io_ind = io_ind[['naics2', 'naics3', 'naics6', 'naics6_name']]
-
-    for vv in ['naics2', 'naics3', 'naics6']:
-      io_ind[vv] = io_ind[vv].apply(str)
-
-    io_ind['naics2_name'] = io_ind.apply(
-      lambda d: d['naics3'] if d['naics2'] != 'nan' else np.nan, axis=1
-    )
-    io_ind['naics3_name'] = io_ind.apply(
-      lambda d: d['naics6'] if d['naics3'] != 'nan' else np.nan, axis=1
-    )
-
-    io_ind['naics3'] = io_ind.apply(
-      lambda d: d['naics3'] if d['naics2'] == 'nan' else np.nan, axis=1
-    )
-    io_ind['naics6'] = io_ind.apply(
-      lambda d: d['naics6'] if d['naics3'] == 'nan' else np.nan, axis=1
-    )
-
-    for vv in ['naics2', 'naics3', 'naics6']:
-      io_ind[vv] = io_ind[vv].apply(lambda d: d if (d != 'nan') else np.nan)
-      io_ind[vv + '_name'] = io_ind[vv + '_name'].apply(
-        lambda d: d if (d != 'nan') else np.nan
-      )
-
-      if vv != 'naics6':
-        io_ind[vv] = io_ind[vv].fillna(method='ffill')
-        io_ind[vv + '_name'] = io_ind[vv + '_name'].fillna(method='ffill')
-
-    io_ind.dropna(how='any', inplace=True)
-    io_ind = io_ind[[
-      'naics2', 'naics3', 'naics6', 'naics2_name', 'naics3_name', 'naics6_name'
-    ]]
+    io_ind = BeaWorkbook.load(
+      IO_IND_FILE, cache_file=IO_IND_STORE
+    ).naics_codes()
 
     if inplace:
       self.io_ind = io_ind
 
     return io_ind
 
+  @instrumented(COUNTY_NAMES_FILE)
+  @cached(COUNTY_NAMES_FILE, attr='county_names')
   def get_county_names(self, inplace: bool = True):
     cty = pd.read_csv(
-      '../data/raw/national_county.txt',
+      COUNTY_NAMES_FILE,
       names=['state_name', 'state', 'county', 'county_name', 'type']
     )
 
-    cty['county_id'] = cty.apply(
-      lambda d: '{:02d}{:03d}'.format(d['state'], d['county']), axis=1
-    )
-
-    cty['county_state'] = cty.apply(
-      lambda d: '{}, {}'.format(d['county_name'], d['state_name']), axis=1
-    )
+    cty['county_id'] = encode_county(cty['state'], cty['county'])
+    cty['county_state'] = cty['county_name'] + ', ' + cty['state_name']
 
     if inplace:
       self.county_names = cty
 
     return cty
 
+  @instrumented(DR_FILE)
   def get_io_data(self, inplace: bool = True) -> pd.DataFrame:
     """Retrieve data for IO tables.
 
@@ -111,26 +169,54 @@ class DownstreamTariffExposure(object):
         pd.DataFrame: The direct requirements matrix
     """
     # The Direct Requirements Matrix
-    DR = pd.read_pickle('../data/int/DR_io_table.pkl')
+    DR = pd.read_pickle(DR_FILE)
 
     if inplace:
-      self.DR = DR
+      self._set_io_data(DR)
 
     return DR
 
-  def get_acs_data(self, inplace: bool = True) -> pd.DataFrame:
+  def _set_io_data(self, DR: pd.DataFrame) -> None:
+    self.DR = DR
+    self.exposure_engine = ExposureEngine(
+      DR, sparse=self.sparse, solver=self.solver
+    )
+
+  @instrumented(ACS_DB_FILE)
+  @cached(*ACS_INPUTS, attr='acs')
+  def get_acs_data(
+    self, inplace: bool = True, source: str = 'sql'
+  ) -> pd.DataFrame:
     """Get ACS data from SQL.
 
+    Args:
+        inplace (bool, optional): Save the data to the object.
+        source (str, optional): 'sql' to query the database built by `import_ipums_data.py`, or 'raw' to aggregate the raw extract in a single streaming pass (no database needed). See `IpumsExtract.aggregate`.
+
     Returns:
         pd.DataFrame: Estimates of workers by industry in each PUMA from the 5-year ACS
     """
+    if source == 'raw':
+      ie = IpumsExtract(ACS_FILE, ACS_DO_FILE)
+      acs = ie.aggregate(
+        ['indnaics', 'puma', 'statefip'],
+        weight='perwt',
+        scale=0.01,
+        stats=['sum'],
+        processes=None
+      )
+      acs = acs.rename(columns={'perwt': 'count'}).reset_index().rename(
+        columns={'indnaics': 'ind', 'statefip': 'state'}
+      )[['count', 'ind', 'puma', 'state']]
+
+      if inplace:
+        self.acs = acs
+
+      return acs
+
     # Employment across PUMAs in ACS.
     # Initiate IpumsExtract Object
-    ie = IpumsExtract(
-      '../data/raw/usa_00022.dat.gz',
-      '../data/raw/usa_00022.do',
-      db_filename='../data/int/acs_2016.db'
-    )
+    ie = IpumsExtract(ACS_FILE, ACS_DO_FILE, db_filename=ACS_DB_FILE)
 
     # Get the number of workers in each county-industry
     script = """
@@ -155,6 +241,8 @@ class DownstreamTariffExposure(object):
 
     return acs
 
+  @instrumented()
+  @cached(DR_FILE, state=STATE)
   def what_industries_are_most_exposed(
     self,
     inds: [list],
@@ -177,86 +265,173 @@ class DownstreamTariffExposure(object):
     if not hasattr(self, 'DR'):
       self.get_io_data()
 
-    ie = pd.DataFrame(index=self.DR.index)
+    return self.exposure_engine.exposure(
+      inds, inputsOnly=inputsOnly, mxR=mxR, toKeep=toKeep
+    )
 
-    # Useful identity matrix
-    II = np.eye(self.DR.shape[0])
+  def scenario_weights(self, baskets: Dict[str, list]) -> pd.DataFrame:
+    """Indicator weights for baskets of IO industries.
 
-    # Find requirements in finite order.
+    Args:
+        baskets (dict): Scenario name -> list of IO industry codes (e.g.
+          `{'steel': ['331110'], 'alum': ['33131A']}`).
 
-    rmi = pd.DataFrame(II, index=self.DR.index, columns=self.DR.columns)
+    Returns:
+        pd.DataFrame: Scenarios x IO industries, 1 for industries in the
+          basket and 0 otherwise. See `what_industries_are_exposed_to_scenarios`.
+    """
+    if not hasattr(self, 'DR'):
+      self.get_io_data()
 
-    rm = pd.DataFrame(
-      np.zeros_like(self.DR), index=self.DR.index, columns=self.DR.columns
-    ) if inputsOnly else rmi.copy()
-    for ii in range(1, mxR + 1):
+    return pd.DataFrame(
+      [self.exposure_engine.selector(inds) for inds in baskets.values()],
+      index=pd.Index(list(baskets.keys()), name='scenario'),
+      columns=self.DR.index
+    )
 
-      # Compute requirements at order ii
-      rmi = rmi.dot(self.DR)
-      rm = rm + rmi
+  @instrumented()
+  @cached(DR_FILE, state=STATE)
+  def what_industries_are_exposed_to_scenarios(
+    self,
+    weights: pd.DataFrame,
+    inputsOnly: bool = True,
+    mxR: int = 10,
+    toKeep: list = [1, 2, 5, 10, 'Infinite']
+  ) -> pd.DataFrame:
+    """Batched version of `what_industries_are_most_exposed`.
 
-      # Save requirements for selected industries
-      ie[ii] = rm.loc[inds].sum()
+    Args:
+        weights (pd.DataFrame): Scenarios x IO industries. Each row weights the industries whose requirements are summed, e.g. from `scenario_weights`.
+        inputsOnly (bool, optional): See `what_industries_are_most_exposed`.
+        mxR (int, optional): See `what_industries_are_most_exposed`.
+        toKeep (list, optional): See `what_industries_are_most_exposed`.
 
-    # Infinite-Order Requirements
-    TR = pd.DataFrame(
-      np.linalg.solve(II - self.DR, II),
-      index=self.DR.index,
-      columns=self.DR.columns
+    Returns:
+        pd.DataFrame: Exposure indexed by (scenario, order) with IO industries as columns. `.loc[scenario].T` is what `what_industries_are_most_exposed` returns for that scenario.
+    """
+    if not hasattr(self, 'DR'):
+      self.get_io_data()
+
+    return self.exposure_engine.exposure_batch(
+      weights, inputsOnly=inputsOnly, mxR=mxR, toKeep=toKeep
     )
 
-    ie['Infinite'] = TR.loc[inds].sum()
+  @instrumented(IO_IND_STORE)
+  def get_io_panel(self, inplace: bool = True) -> IOPanel:
+    """Retrieve the (summary) direct requirements matrices of every year.
+
+    Returns:
+        IOPanel: Direct requirements, 1997-2016.
+    """
+    panel = IOPanel.from_workbook(
+      BeaWorkbook.load(IO_IND_FILE, cache_file=IO_IND_STORE)
+    )
 
-    ie = ie[toKeep]
+    if inplace:
+      self.io_panel = panel
 
-    return ie
+    return panel
 
-  def convert_io_result_to_acs_result(self, ior: [pd.DataFrame, pd.Series]
-                                      ) -> [pd.DataFrame, pd.Series]:
+  @instrumented()
+  @cached(IO_IND_FILE)
+  def what_industries_were_exposed_over_time(
+    self,
+    inds: list = ['331'],
+    inputsOnly: bool = True,
+    mxR: int = 10,
+    toKeep: list = [1, 2, 5, 10, 'Infinite']
+  ) -> pd.DataFrame:
+    """Exposure of each (summary) IO industry to the given industries in every year of the BEA tables, computed for all years in one batch.
+
+    Args:
+        inds (list, optional): Summary-level industry codes. Defaults to primary metals (which contains steel and aluminum).
+        inputsOnly (bool, optional): See `what_industries_are_most_exposed`.
+        mxR (int, optional): See `what_industries_are_most_exposed`.
+        toKeep (list, optional): See `what_industries_are_most_exposed`.
+
+    Returns:
+        pd.DataFrame: Exposure indexed by (year, order) with summary IO industries as columns, e.g. `.xs('Infinite', level='order')` is years x industries.
+    """
+    if not hasattr(self, 'io_panel'):
+      self.get_io_panel()
+
+    return self.io_panel.exposure(
+      inds, inputsOnly=inputsOnly, mxR=mxR, toKeep=toKeep
+    )
+
+  @instrumented(ACS_IO_CROSSWALK_FILE)
+  def get_acs_io_crosswalk(self, inplace: bool = True) -> IndustryCrosswalk:
+    """Crosswalk from ACS industries to the IO industries they contain.
+
+    Returns:
+        IndustryCrosswalk: Compiled ACS <- IO crosswalk.
+    """
+    cw = pd.read_pickle(ACS_IO_CROSSWALK_FILE)[[
+      'ind', 'io_ind'
+    ]].set_index('ind').to_dict()['io_ind']
+
+    if inplace:
+      self.acs_io_cw = cw
+      self.acs_io_crosswalk = IndustryCrosswalk(cw)
+
+    return IndustryCrosswalk(cw)
+
+  @instrumented()
+  def convert_io_result_to_acs_result(
+    self,
+    ior: [pd.DataFrame, pd.Series],
+    how: str = 'median',
+    weights: [pd.Series, None] = None,
+    axis: int = 0
+  ) -> [pd.DataFrame, pd.Series]:
     """Convert a result stated in terms of IO industries to a result stated
       in terms of ACS industries.
 
     Args:
         ior (pd.DataFrame, pd.Series): Frame or series with IO industries (6-digit) as the index.
+        how (str, optional): How to combine the values of the IO industries that make up an ACS industry: 'median', 'mean' or 'wmean' (mean weighted by `weights`).
+        weights (pd.Series, None, optional): Weight of each IO industry (for `how='wmean'`).
+        axis (int, optional): 1 if the IO industries are the columns of `ior` instead (e.g. the output of `what_industries_are_exposed_to_scenarios`).
 
     Returns:
-        pd.DataFrame, pd.Series: Frame or series with results from ior converted to have ACS industry codes (and industry code as index). In cases where more than one IO industry code is applicable, takes the median of the values from the applicable industries in `ior`
+        pd.DataFrame, pd.Series: Frame or series with results from ior converted to have ACS industry codes (and industry code as index). In cases where more than one IO industry code is applicable, takes the median (by default) of the values from the applicable industries in `ior`
     """
-    if not hasattr(self, 'acs_io_cw'):
-      self.acs_io_cw = pd.read_pickle('../data/int/acs_to_io_crosswalk.pkl')[[
-        'ind', 'io_ind'
-      ]].set_index('ind').to_dict()['io_ind']
-    cw = self.acs_io_cw
-
-    if isinstance(ior, pd.Series):
-      out = pd.Series(index=cw.keys(), name=ior.name)
-    else:
-      out = pd.DataFrame(index=cw.keys(), columns=ior.columns)
+    if not hasattr(self, 'acs_io_crosswalk'):
+      self.get_acs_io_crosswalk()
 
-    for k, v in cw.items():
-      out.at[k] = ior.loc[v].median()
+    return self.acs_io_crosswalk.convert(
+      ior, how=how, weights=weights, axis=axis
+    )
 
-    return out
+  @instrumented()
+  def get_employment_matrix(self, inplace: bool = True) -> EmploymentMatrix:
+    """Workers by PUMA and ACS industry as a sparse matrix.
 
-  def get_wgt_mean(
-    self, df: pd.DataFrame, wgt: str, columns: [list, None] = None
-  ):
+    Returns:
+        EmploymentMatrix: Built from `get_acs_data`.
+    """
+    if not hasattr(self, 'acs'):
+      self.get_acs_data()
 
-    if columns is None:
-      columns = [
-        col for col in df.columns
-        if col != wgt and isinstance(df[col].values[0], (float, int))
-      ]
+    em = EmploymentMatrix.from_frame(self.acs)
 
-    return pd.Series(
-      [(df[col] * df[wgt] / df[wgt].sum()).sum() for col in columns],
-      index=columns
-    )
+    if inplace:
+      self.employment_matrix = em
+
+    return em
+
+  def _puma_index(self, index: pd.Index) -> pd.MultiIndex:
+    # Integer PUMA ids -> the (puma, state) index of the SQL-based results.
+    sp = self.employment_matrix.state_puma(index)
+    return pd.MultiIndex.from_arrays([sp['puma'], sp['state']],
+                                     names=['puma', 'state'])
 
+  @instrumented()
+  @cached(*PUMA_EXPOSURE_INPUTS, state=STATE)
   def what_pumas_are_exposed_downstream(self):
 
-    if not hasattr(self, 'acs'):
-      self.get_acs_data()
+    if not hasattr(self, 'employment_matrix'):
+      self.get_employment_matrix()
 
     ie = self.what_industries_are_most_exposed(['331110', '33131A'])
 
@@ -267,132 +442,115 @@ class DownstreamTariffExposure(object):
                for col in iec.columns},
       inplace=True
     )
-    iec.index.name = 'ind'
-    iec.reset_index(inplace=True)
-
-    acs = self.acs.merge(iec, on='ind')
-
-    vars_to_agg = [col for col in iec.columns if col != 'ind']
-    wm = lambda g: self.get_wgt_mean(g, wgt='count', columns=vars_to_agg)
-    psg = acs.groupby(['puma', 'state']).apply(wm)
 
-    return psg
+    psg = self.employment_matrix.weighted_mean(iec)
+    psg.index = self._puma_index(psg.index)
 
-  def what_pumas_have_steel_and_alum(self):
+    return psg.sort_index()
 
-    if not hasattr(self, 'acs'):
-      self.get_acs_data()
-    df = self.acs.copy()
-
-    # Get total number of workers: overall, steel, aluminum
-    emp_inds = {
-      'emp': df['ind'].unique(),
-      'emp_steel': ['331M'],
-      'emp_alum': ['3313'],
-      'emp_tariff': ['331M', '3313']
-    }
+  @instrumented()
+  @cached(*ACS_INPUTS, state=STATE)
+  def what_pumas_have_industries(
+    self, baskets: Dict[str, List[str]]
+  ) -> pd.DataFrame:
+    """Share of workers in each PUMA employed in baskets of ACS industries.
 
-    emp = []
+    Args:
+        baskets (dict): Name -> list of ACS industry codes, e.g. `{'emp_steel': ['331M']}`.
 
-    for name, codes in emp_inds.items():
-      dd = df.loc[df['ind'].isin(codes)].groupby(
-        ['state', 'puma']
-      )['count'].sum().to_frame('value')
-      dd['variable'] = name
-      emp.append(dd)
+    Returns:
+        pd.DataFrame: Frame with 'state' and 'puma' columns and the percent of the PUMA's workers in each basket.
+    """
+    if not hasattr(self, 'employment_matrix'):
+      self.get_employment_matrix()
 
-    emp = pd.concat(emp).reset_index()
-    emp = emp.pivot_table(
-      index=['state', 'puma'], columns='variable', values='value'
+    em = self.employment_matrix
+    emp = pd.concat(
+      [em.state_puma(), em.shares(baskets).reset_index(drop=True)], axis=1
     )
-    emp.reset_index(inplace=True)
-    emp = emp.fillna(0)
+    emp.columns.name = 'variable'
 
-    for vv in ['emp_alum', 'emp_steel', 'emp_tariff']:
-      emp[vv] = 100 * emp[vv] / emp['emp']
+    return emp.sort_values(['state', 'puma']).reset_index(drop=True)
 
-    emp.drop('emp', axis=1, inplace=True)
-
-    return emp
+  def what_pumas_have_steel_and_alum(self):
 
-  def get_county_to_puma_crosswalk(self, inplace: bool = True) -> dict:
+    return self.what_pumas_have_industries({
+      'emp_alum': ['3313'],
+      'emp_steel': ['331M'],
+      'emp_tariff': ['331M', '3313']
+    })
 
-    cw = pd.read_csv(
-      '../data/raw/2010_Census_Tract_to_2010_PUMA.txt',
-      skiprows=1,
-      names=['state', 'county', 'tract', 'puma']
-    )[['state', 'county', 'puma']]
+  @instrumented(TRACT_PUMA_FILE)
+  def get_county_to_puma_crosswalk(
+    self,
+    inplace: bool = True,
+    populations: [pd.Series, None] = None,
+    cache_file: [str, None] = '../data/int/county_puma_crosswalk.npz'
+  ) -> dict:
+    """Crosswalk from counties to the PUMAs that overlap them.
 
-    cw = cw.loc[~cw.duplicated()].reset_index(drop=True)
+    Args:
+        inplace (bool, optional): Save the crosswalk (dict and compiled `PumaCountyCrosswalk`) to the object.
+        populations (pd.Series, None, optional): Population of each Census tract, indexed by (state, county, tract) fips codes. If given, `puma_to_county_conversion` weights each PUMA by the county's population living in it rather than equally.
+        cache_file (str, None, optional): Where to cache the compiled crosswalk. See `PumaCountyCrosswalk.load`.
 
-    cw['county_id'] = cw.apply(
-      lambda d: '{:02d}{:03d}'.format(d['state'], d['county']), axis=1
-    )
-    cw['puma_id'] = cw.apply(
-      lambda d: '{:02d}{:05d}'.format(d['state'], d['puma']), axis=1
+    Returns:
+        dict: County id -> list of PUMA ids (integer ids, see `src.Crosswalks.geokeys`).
+    """
+    pcw = PumaCountyCrosswalk.load(
+      TRACT_PUMA_FILE,
+      cache_file=cache_file if populations is None else None,
+      populations=populations
     )
-
-    cw.set_index('county_id', inplace=True)
-
-    cwd = {pid: cw.at[pid, 'puma_id'] for pid in cw.index.unique()}
-    cwd = {k: [v] if isinstance(v, str) else list(v) for k, v in cwd.items()}
+    cwd = pcw.to_dict()
 
     if inplace:
       self.county_to_puma_cw = cwd
+      self.puma_county_crosswalk = pcw
+      if populations is not None:
+        self._given['puma_county_crosswalk'] = pcw
 
     return cwd
 
+  @instrumented()
   def puma_to_county_conversion(self, df: pd.DataFrame) -> pd.DataFrame:
     """Converts results in terms of PUMAs as results in terms of counties.
 
     NOTE: This is a very rough way of doing this. For more discussion see the script '../scripts/puma_to_county_crosswalk_exploration.py'
 
     Args:
-        df (pd.DataFrame): A frame with numeric values and a 'puma_id' index that is a 7-digit string where the first 2 digits are the state fips code while the latter five are the state-dependent PUMA identifier.
+        df (pd.DataFrame): A frame with numeric values and a 'puma_id' index of integer PUMA ids (state fips * 100000 + the state-dependent PUMA identifier; see `src.Crosswalks.geokeys`).
 
     Returns:
-        pd.DataFrame: A frame with numeric values and a 'county_id' index that is a 5-digit string where the first 2 digits are the state fips code while the latter three are the state-dependent County fips code. This frame is compiled by finding all PUMAs that overlap with a given county. This is an inexact procedure. Please see the previously-mentioned script for more details.
+        pd.DataFrame: A frame with numeric values and a 'county_id' index of integer county ids (state fips * 1000 + the state-dependent County fips code). This frame is compiled by finding all PUMAs that overlap with a given county (weighted equally unless the crosswalk was built with tract populations). This is an inexact procedure. Please see the previously-mentioned script for more details.
     """
-    if not hasattr(self, 'puma_to_county_cw'):
+    if not hasattr(self, 'puma_county_crosswalk'):
       self.get_county_to_puma_crosswalk()
-    cw = self.county_to_puma_cw
-
-    out = pd.DataFrame(index=cw.keys(), columns=df.columns)
-    for k, v in cw.items():
 
-      # KeyError will be passed for territories (e.g. USVI) that are not
-      # in data.
-      try:
-        out.at[k] = df.loc[v].mean()
-      except KeyError as e:
-        pass
-
-    out.dropna(how='all', inplace=True)
-    out = out.apply(lambda d: d.apply(float))
-    return out
+    return self.puma_county_crosswalk.convert(df)
 
+  @instrumented()
+  @cached(TRACT_PUMA_FILE, *PUMA_EXPOSURE_INPUTS, state=STATE)
   def what_counties_are_exposed_downstream(self):
 
     ped = self.what_pumas_are_exposed_downstream()
 
     ped.reset_index(inplace=True)
-    ped['puma_id'] = ped.apply(
-      lambda d: '{:02d}{:05d}'.format(int(d['state']), int(d['puma'])), axis=1
-    )
+    ped['puma_id'] = encode_puma(ped['state'], ped['puma'])
 
     ped.drop(['puma', 'state'], axis=1, inplace=True)
     ped.set_index('puma_id', inplace=True)
 
     return self.puma_to_county_conversion(ped)
 
+  @instrumented()
+  @cached(TRACT_PUMA_FILE, *ACS_INPUTS, state=STATE)
   def what_counties_have_steel_and_alum(self):
 
     ped = self.what_pumas_have_steel_and_alum()
 
     ped.reset_index(drop=True, inplace=True)
-    ped['puma_id'] = ped.apply(
-      lambda d: '{:02d}{:05d}'.format(int(d['state']), int(d['puma'])), axis=1
-    )
+    ped['puma_id'] = encode_puma(ped['state'], ped['puma'])
 
     ped.drop(['puma', 'state'], axis=1, inplace=True)
     ped.set_index('puma_id', inplace=True)
@@ -400,11 +558,38 @@ class DownstreamTariffExposure(object):
     return self.puma_to_county_conversion(ped)
 
 
-def main(outfile: str = '../data/int/county_emp_tariffs_data.csv'):
+def main(
+  outfile: str = '../data/int/county_emp_tariffs_data.csv',
+  cache_dir: [str, None] = '../data/int/dte_cache',
+  report_file: [str, None] = None,
+  trace_file: [str, None] = None
+):
+  """Print the tables and save the county data.
+
+  Args:
+      outfile (str, optional): Where to save the county data.
+      cache_dir (str, None, optional): See `DownstreamTariffExposure`.
+      report_file (str, None, optional): Profile the run and write the time, memory and throughput of each step as a JSON report here. See `src.Profiling`.
+      trace_file (str, None, optional): Profile the run and write a Chrome trace (chrome://tracing) of the steps here.
+  """
+  if report_file is None and trace_file is None:
+    return _main(outfile, cache_dir)
+
+  with profiling(report=report_file, trace=trace_file) as prof:
+    dte = _main(outfile, cache_dir)
+
+  print(tabulate(
+    prof.summary()[['calls', 'wall', 'cpu', 'traced_peak_mb', 'rows']],
+    headers='keys', tablefmt='pipe', floatfmt='.3f'
+  ))
+  return dte
+
+
+def _main(outfile: str, cache_dir: [str, None]):
 
   splitter = '\n' + '%~' * 45 + '\n'
 
-  dte = DownstreamTariffExposure()
+  dte = DownstreamTariffExposure(cache_dir=cache_dir)
 
   # Get the IO data
   dte.get_io_data()
@@ -469,7 +654,7 @@ def main(outfile: str = '../data/int/county_emp_tariffs_data.csv'):
   emp = emp.merge(cme, left_index=True, right_index=True, how='outer')
   emp['state_name'] = dte.county_names['state_name']
   emp['county_state'] = dte.county_names['county_state']
-  emp.index.name = 'id'
+  emp.index = pd.Index(format_county(emp.index), name='id')
   emp.to_csv(outfile)
   print(splitter)
   print('Saved county employment data to `{}`'.format(outfile))
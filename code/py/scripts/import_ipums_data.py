@@ -6,4 +6,4 @@ ie = IpumsExtract(
   db_filename='../data/int/acs_2016.db'
 )
 
-ie.to_sql(compression='gzip')
+ie.to_sql(compression='gzip', chunksize=100000, processes=None)
@@ -3,21 +3,17 @@
 import pandas as pd
 import numpy as np
 
+from src.IOTables import BeaWorkbook
+
 # Use table
-ut = pd.read_excel(
+use = BeaWorkbook.load(
   '../data/raw/IOUse_Before_Redefinitions_PRO_1997-2016_Summary.xlsx',
-  sheetname='2016',
-  skiprows=5,
-  skipfooter=4,
-  index_col=0,
-  na_values='...'
+  cache_file='../data/int/IOUse_Before_Redefinitions_PRO_1997-2016_Summary.npz'
 )
+ut = use.table('2016')
 
-ind_rows = ut.loc['IOCode']
-ind_cols = ut['Commodities/Industries']
-
-ut.drop('IOCode', axis=0, inplace=True)
-ut.drop('Commodities/Industries', axis=1, inplace=True)
+# Names of the commodities (rows) and industries (columns).
+ind_cols, ind_rows = use.names('2016')
 
 # Compute direct requirements of each industry
 # This is the
@@ -1,7 +1,95 @@
-from scripts.make_naics_crosswalk import *
+"""Build everything under `data/int` from `data/raw`.
 
-# 1. Make the NAICS Crosswalks
-aps_naics_labels()
-# 2. Import the data into a sql database.
-# 3. Make the IO Tables
-#
+Run from `code/py`:
+
+  python -m scripts.main
+
+Stages run as soon as the stages writing their inputs are done, in parallel
+where possible, and are skipped if their inputs and code are unchanged since
+they last succeeded. See `src.Pipeline`.
+"""
+from src.Pipeline import Pipeline, Stage
+from scripts.downstream_tariff_exposure import (
+  ACS_DB_FILE, ACS_DO_FILE, ACS_FILE, ACS_IO_CROSSWALK_FILE,
+  COUNTY_NAMES_FILE, DR_FILE, IO_IND_FILE, TRACT_PUMA_FILE
+)
+from scripts.make_naics_crosswalk import NAICS_FILE
+
+STATE_DIR = '../data/int/pipeline'
+
+STAGES = [
+  # 1. Make the NAICS Crosswalks
+  Stage(
+    'naics_labels',
+    'scripts.make_naics_crosswalk:aps_naics_labels',
+    inputs=[NAICS_FILE],
+    outputs=['../data/int/aps_naics_labels.pkl']
+  ),
+  Stage(
+    'county_names',
+    'scripts.make_naics_crosswalk:format_county_name_file',
+    inputs=['../data/raw/fips_national_county.csv'],
+    outputs=['../data/int/county_names.pkl']
+  ),
+  # 2. Import the data into a sql database.
+  Stage(
+    'import_ipums_data',
+    'scripts.import_ipums_data',
+    inputs=[ACS_FILE, ACS_DO_FILE],
+    outputs=[ACS_DB_FILE]
+  ),
+  # 3. Make the IO Tables
+  Stage(
+    'io_tables',
+    'scripts.io_tables',
+    inputs=[
+      '../data/raw/IOUse_Before_Redefinitions_PRO_1997-2016_Summary.xlsx'
+    ],
+    outputs=[
+      '../data/int/IOUse_Before_Redefinitions_PRO_1997-2016_Summary.npz'
+    ]
+  ),
+  # 4. Results
+  Stage(
+    'steel_and_aluminum_workers',
+    'scripts.steel_and_aluminum_workers',
+    inputs=[
+      ACS_DB_FILE, '../data/raw/2010_PUMA_Names.csv',
+      '../data/raw/statefips_labels.txt'
+    ],
+    outputs=['../data/int/tariff_ind_emp.csv']
+  ),
+  Stage(
+    'downstream_tariff_exposure',
+    'scripts.downstream_tariff_exposure:main',
+    inputs=[
+      IO_IND_FILE, COUNTY_NAMES_FILE, DR_FILE, ACS_IO_CROSSWALK_FILE,
+      TRACT_PUMA_FILE, ACS_DB_FILE
+    ],
+    outputs=['../data/int/county_emp_tariffs_data.csv']
+  ),
+]
+
+
+def main(
+  stages: [list, None] = None,
+  processes: [int, None] = None,
+  force: [bool, list] = False
+) -> dict:
+  """Run the pipeline.
+
+  Args:
+      stages (list, None, optional): Names of the stages to bring up to date (with the stages that they depend on). Defaults to all.
+      processes (int, None, optional): Stages run at once. Defaults to one per CPU.
+      force (bool, list, optional): Rebuild every stage, or the named stages and everything downstream of them, even if up to date.
+
+  Returns:
+      dict: Stage name -> 'done', 'skipped', 'failed' or 'not run'.
+  """
+  return Pipeline(STAGES, STATE_DIR).run(
+    stages=stages, processes=processes, force=force
+  )
+
+
+if __name__ == '__main__':
+  main()
@@ -6,6 +6,8 @@ Attributes:
 import pandas as pd
 import pickle, re
 
+from src.Crosswalks.geokeys import encode_county, format_county
+
 NAICS_FILE = '../data/raw/naics_codes_ipums.xlsx'
 NAICS_SHEET = 'data'
 
@@ -80,12 +82,9 @@ def format_county_name_file(outfile: str = '../data/int/county_names.pkl'):
 
   df.drop('unknown', axis=1, inplace=True)
 
-  df['fips'] = df.apply(
-    lambda d: '{:02d}{:03d}'.format(d['statefips'], d['countyfips']), axis=1
-  )
-
-  df['county-state'] = df.apply(
-    lambda d: '{:s}, {:s}'.format(d['county'], d['state']), axis=1
+  df['fips'] = format_county(
+    encode_county(df['statefips'], df['countyfips'])
   )
+  df['county-state'] = df['county'] + ', ' + df['state']
 
   df.to_pickle(outfile)
@@ -25,9 +25,12 @@ Attributes:
     cwd2 (TYPE): Crosswalk county -> PUMA
     ii (int): Description
 """
+import numpy as np
 import pandas as pd
 import zipfile
 
+from src.Crosswalks.geokeys import encode_county, encode_puma
+
 cw = pd.read_csv(
   '../data/raw/2010_Census_Tract_to_2010_PUMA.txt',
   skiprows=1,
@@ -36,22 +39,18 @@ cw = pd.read_csv(
 
 cw = cw.loc[~cw.duplicated()].reset_index(drop=True)
 
-cw['county_id'] = cw.apply(
-  lambda d: '{:02d}{:03d}'.format(d['state'], d['county']), axis=1
-)
-cw['puma_id'] = cw.apply(
-  lambda d: '{:02d}{:05d}'.format(d['state'], d['puma']), axis=1
-)
+cw['county_id'] = encode_county(cw['state'], cw['county'])
+cw['puma_id'] = encode_puma(cw['state'], cw['puma'])
 
 cw.set_index('puma_id', inplace=True)
 
 cwd = {pid: cw.at[pid, 'county_id'] for pid in cw.index.unique()}
-cwd = {k: [v] if isinstance(v, str) else list(v) for k, v in cwd.items()}
+cwd = {k: [v] if np.isscalar(v) else list(v) for k, v in cwd.items()}
 
 cw2 = cw.reset_index().set_index('county_id')
 
 cwd2 = {pid: cw2.at[pid, 'puma_id'] for pid in cw2.index.unique()}
-cwd2 = {k: [v] if isinstance(v, str) else list(v) for k, v in cwd2.items()}
+cwd2 = {k: [v] if np.isscalar(v) else list(v) for k, v in cwd2.items()}
 
 print(
   'Counties in multiple PUMAs in which other counties with multiple PUMAs exist.'
@@ -83,6 +82,4 @@ with zipfile.ZipFile('../data/raw/BP_2015_00A1.zip', 'r') as archive:
     ],
     encoding="ISO-8859-1"
   )
-bp['county_id'] = bp.apply(
-  lambda d: '{:02d}{:03d}'.format(d['state'], d['county']), axis=1
-)
+bp['county_id'] = encode_county(bp['state'], bp['county'])
@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from src.Crosswalks.geokeys import encode_puma, format_puma
 from src.IpumsExtract import IpumsExtract
 
 # Initiate IpumsExtract Object
@@ -57,14 +58,14 @@ for name in ['emp_steel', 'emp_alum', 'emp_tariff']:
 
 # Merge on Puma name
 puma_names = pd.read_fwf(
-  '../../data/raw/2010_PUMA_Names.csv',
+  '../data/raw/2010_PUMA_Names.csv',
   delimiter=',',
   skiprows=1,
   names=['state', 'puma', 'puma_name']
 )
 
 state_names = pd.read_fwf(
-  '../../data/raw/statefips_labels.txt',
+  '../data/raw/statefips_labels.txt',
   delimiter='|',
   skiprows=1,
   names=['state', 'state_abbrev', 'state_name', 'safasfas']
@@ -75,8 +76,6 @@ emp = emp.merge(
   state_names[['state', 'state_abbrev']], on=['state'], how='left'
 )
 
-emp['id'] = emp.apply(
-  lambda d: '{:02d}{:05d}'.format(d['state'], d['puma']), axis=1
-)
+emp['id'] = format_puma(encode_puma(emp['state'], emp['puma']))
 
 emp.to_csv('../data/int/tariff_ind_emp.csv')
@@ -0,0 +1,5 @@
+from .harness import compare, load, measure, run, save
+from .synthetic import (
+  make_county_names, make_direct_requirements, make_extract,
+  make_industry_crosswalk, make_io_names, make_tract_file
+)
\ No newline at end of file
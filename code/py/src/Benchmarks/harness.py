@@ -0,0 +1,130 @@
+"""Time and peak memory of benchmarks, and comparison with a baseline.
+
+A benchmark is a function of the value returned by its (untimed) setup.
+Each benchmark is timed `repeat` times and then run once more under
+`tracemalloc` for the peak memory allocated while it runs (numpy and pandas
+report their buffers to `tracemalloc`). Memory used in other processes is
+not counted.
+"""
+import gc, json, time, tracemalloc
+import pandas as pd
+from typing import Callable, Dict, Tuple, Union
+
+# Slowdown/extra memory (relative to the baseline) reported as a regression.
+TOLERANCE = 0.25
+# Slowdowns (seconds) too small to tell from timer noise.
+MIN_SLOWDOWN = 0.01
+
+Benchmarks = Dict[str, Tuple[Union[Callable, None], Callable]]
+
+
+def measure(
+  func: Callable, setup: [Callable, None] = None, repeat: int = 3
+) -> dict:
+  """Time and peak memory of `func(setup())`.
+
+  Args:
+      func (Callable): Function to measure.
+      setup (Callable, None, optional): Called (untimed) before each run.
+        Its result is passed to `func`.
+      repeat (int, optional): Number of timed runs.
+
+  Returns:
+      dict: 'time' (fastest run, seconds), 'time_mean' and 'peak_mb'.
+  """
+
+  def run(trace: bool = False) -> float:
+    state = setup() if setup is not None else None
+    gc.collect()
+
+    if trace:
+      tracemalloc.start()
+    t0 = time.perf_counter()
+    if setup is None:
+      func()
+    else:
+      func(state)
+    elapsed = time.perf_counter() - t0
+    if trace:
+      peak = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+      return peak
+    return elapsed
+
+  times = [run() for _ in range(repeat)]
+
+  return {
+    'time': min(times),
+    'time_mean': sum(times) / len(times),
+    'peak_mb': run(trace=True) / 2**20
+  }
+
+
+def run(
+  benchmarks: Benchmarks, repeat: int = 3, verbose: bool = True
+) -> pd.DataFrame:
+  """Measure every benchmark.
+
+  Args:
+      benchmarks (dict): Name -> (setup, func). See `measure`.
+      repeat (int, optional): Timed runs of each benchmark.
+      verbose (bool, optional): Print each benchmark as it finishes.
+
+  Returns:
+      pd.DataFrame: 'time', 'time_mean' and 'peak_mb' of each benchmark.
+  """
+  out = {}
+  for name, (setup, func) in benchmarks.items():
+    out[name] = measure(func, setup, repeat=repeat)
+    if verbose:
+      print(
+        '{:<32} {time:10.4f} s {peak_mb:10.1f} MB'.format(name, **out[name])
+      )
+
+  df = pd.DataFrame.from_dict(out, orient='index')
+  df.index.name = 'benchmark'
+  return df
+
+
+def save(results: pd.DataFrame, filename: str) -> None:
+  """Write results (e.g. as the baseline of later runs) to JSON."""
+  with open(filename, 'w') as f:
+    json.dump(results.to_dict(orient='index'), f, indent=2)
+
+
+def load(filename: str) -> pd.DataFrame:
+  """Read results written by `save`."""
+  with open(filename) as f:
+    df = pd.DataFrame.from_dict(json.load(f), orient='index')
+  df.index.name = 'benchmark'
+  return df
+
+
+def compare(
+  results: pd.DataFrame,
+  baseline: pd.DataFrame,
+  tolerance: float = TOLERANCE
+) -> pd.DataFrame:
+  """Compare results with a baseline.
+
+  Args:
+      results (pd.DataFrame): Output of `run`.
+      baseline (pd.DataFrame): Earlier output of `run` (see `load`).
+      tolerance (float, optional): Relative increase in time or peak memory
+        that counts as a regression. Slowdowns under `MIN_SLOWDOWN` seconds
+        are ignored.
+
+  Returns:
+      pd.DataFrame: `results` with the ratios 'time_ratio' and 'peak_ratio'
+        to the baseline and 'regressed'. Benchmarks missing from the
+        baseline have NaN ratios and do not regress.
+  """
+  base = baseline.reindex(results.index)
+
+  out = results.copy()
+  out['time_ratio'] = results['time'] / base['time']
+  out['peak_ratio'] = results['peak_mb'] / base['peak_mb']
+  slower = (out['time_ratio'] > 1 + tolerance) & \
+    (results['time'] - base['time'] > MIN_SLOWDOWN)
+  out['regressed'] = slower | (out['peak_ratio'] > 1 + tolerance)
+  return out
@@ -0,0 +1,350 @@
+"""Deterministic synthetic inputs.
+
+The licensed IPUMS extract and the BEA/Census files are not in the repo, so
+the benchmarks run on generated stand-ins with the same formats:
+
+- an IPUMS-style fixed-width extract (`.dat.gz`) with its Stata `.do` file,
+- a sparse direct requirements matrix,
+- an ACS <- IO industry crosswalk and
+- a Census tract -> PUMA relationship file.
+
+The same seed always gives the same data, and the geography (states, PUMAs)
+and industries are shared so that the outputs can be chained together.
+"""
+import gzip, os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+from ..Crosswalks.geokeys import encode_county
+
+# IO industries (the steel and aluminum industries) and ACS industries
+# (steel, aluminum) used by the scripts.
+IO_CODES = ['331110', '33131A']
+ACS_CODES = ['331M', '3313']
+
+LEVELS = {
+  'sex': {1: 'Male', 2: 'Female'},
+  'empstat': {
+    0: 'N/A',
+    1: 'Employed',
+    2: 'Unemployed',
+    3: 'Not in labor force'
+  },
+  'labforce': {
+    0: 'N/A',
+    1: 'No, not in the labor force',
+    2: 'Yes, in the labor force'
+  },
+  'educ': {
+    ii: label
+    for ii, label in enumerate([
+      'N/A or no schooling', 'Nursery school to grade 4',
+      'Grade 5, 6, 7, or 8',
+      'Grade 9', 'Grade 10', 'Grade 11', 'Grade 12', '1 year of college',
+      '2 years of college', '3 years of college', '4 years of college',
+      '5+ years of college'
+    ])
+  },
+}
+
+# (name, Stata type, width, label) of the variables of the extract.
+VARIABLES = [
+  ('year', 'int', 4, 'Census year'),
+  ('serial', 'double', 8, 'Household serial number'),
+  ('statefip', 'byte', 2, 'State (FIPS code)'),
+  ('puma', 'long', 5, 'Public Use Microdata Area'),
+  ('perwt', 'double', 10, 'Person weight'),
+  ('sex', 'byte', 1, 'Sex'),
+  ('age', 'int', 3, 'Age'),
+  ('empstat', 'byte', 1, 'Employment status [general version]'),
+  ('labforce', 'byte', 1, 'Labor force status'),
+  ('educ', 'byte', 2, 'Educational attainment [general version]'),
+  ('indnaics', 'str', 8, 'Industry, NAICS classification'),
+]
+
+
+def geography(
+  states: int = 5, pumas_per_state: int = 20, counties_per_state: int = 15
+) -> Dict[str, np.ndarray]:
+  """State, PUMA and county codes of the synthetic geography.
+
+  Returns:
+      dict: 'states' (fips codes), 'pumas' and 'counties' (codes within
+        each state).
+  """
+  return {
+    'states': np.arange(1, states + 1),
+    'pumas': 100 * np.arange(1, pumas_per_state + 1),
+    'counties': 2 * np.arange(counties_per_state) + 1
+  }
+
+
+def acs_industries(n: int = 250) -> List[str]:
+  """ACS industry codes (`ACS_CODES` first)."""
+  return ACS_CODES + ['{:04d}'.format(1000 + ii) for ii in range(n - 2)]
+
+
+def io_industries(n: int = 400) -> List[str]:
+  """IO industry codes (`IO_CODES` first)."""
+  return IO_CODES + ['{:06d}'.format(110000 + ii) for ii in range(n - 2)]
+
+
+def make_io_names(n: int = 400) -> pd.DataFrame:
+  """Names of the IO industries, in the format of
+  `DownstreamTariffExposure.get_io_ind`."""
+  codes = pd.Series(io_industries(n))
+  return pd.DataFrame({
+    'naics2': codes.str[:2],
+    'naics3': codes.str[:3],
+    'naics6': codes,
+    'naics2_name': 'Sector ' + codes.str[:2],
+    'naics3_name': 'Summary ' + codes.str[:3],
+    'naics6_name': 'Industry ' + codes
+  })
+
+
+def make_county_names(**geo) -> pd.DataFrame:
+  """Names of the counties of the synthetic geography, in the format of
+  `DownstreamTariffExposure.get_county_names`.
+
+  Args:
+      **geo: Passed to `geography`.
+  """
+  geo = geography(**geo)
+  state = np.repeat(geo['states'], len(geo['counties']))
+  county = np.tile(geo['counties'], len(geo['states']))
+
+  cty = pd.DataFrame({
+    'state_name': ['S{:02d}'.format(v) for v in state],
+    'state': state,
+    'county': county,
+    'county_name': ['County {}'.format(v) for v in county],
+    'type': 'H1'
+  })
+  cty['county_id'] = encode_county(cty['state'], cty['county'])
+  cty['county_state'] = cty['county_name'] + ', ' + cty['state_name']
+  return cty
+
+
+def make_do_file(filename: str) -> str:
+  """Write the Stata `.do` file describing a synthetic extract.
+
+  Only the lines read by `IpumsExtract.parseDoFile` are written (variable
+  positions, variable labels and value labels).
+
+  Returns:
+      str: `filename`.
+  """
+  lines = ['infix ///']
+  start = 1
+  for name, stype, width, _ in VARIABLES:
+    lines.append(
+      '  {:<7} {:<11} {:<6} ///'.format(
+        stype, name, '{}-{}'.format(start, start + width - 1)
+      )
+    )
+    start += width
+  lines.append('  using `"synthetic.dat"\'')
+  lines.append('')
+
+  for name, _, _, label in VARIABLES:
+    lines.append('label var {:<8} `"{}"\''.format(name, label))
+  lines.append('')
+
+  for name, levels in LEVELS.items():
+    for ii, (code, label) in enumerate(levels.items()):
+      lines.append(
+        'label define {}_lbl {} `"{}"\'{}'.format(
+          name, code, label, ', add' if ii else ''
+        )
+      )
+    lines.append('')
+
+  with open(filename, 'w') as f:
+    f.write('\n'.join(lines) + '\n')
+
+  return filename
+
+
+def make_records(
+  rows: int, seed: int = 0, industries: [List[str], None] = None, **geo
+) -> pd.DataFrame:
+  """Values of the variables of a synthetic extract.
+
+  Args:
+      rows (int): Number of records.
+      seed (int, optional): Random seed.
+      industries (list, None, optional): ACS industry codes. Defaults to
+        `acs_industries()`.
+      **geo: Passed to `geography`.
+
+  Returns:
+      pd.DataFrame: One column per variable of `VARIABLES` (integers, and
+        strings for 'indnaics').
+  """
+  rng = np.random.default_rng(seed)
+  geo = geography(**geo)
+  industries = np.asarray(industries or acs_industries())
+
+  # Industry sizes are heavily skewed, as in the ACS.
+  p = 1. / np.arange(1, len(industries) + 1)
+  ind = industries[rng.choice(len(industries), rows, p=p / p.sum())]
+  # Persons not in the labor force have no industry.
+  empstat = rng.choice(4, rows, p=[0.2, 0.5, 0.05, 0.25])
+  ind[empstat == 0] = ''
+
+  return pd.DataFrame({
+    'year': np.full(rows, 2016),
+    'serial': np.arange(rows) // 2 + 1,
+    'statefip': rng.choice(geo['states'], rows),
+    'puma': rng.choice(geo['pumas'], rows),
+    'perwt': rng.integers(100, 50000, rows) * 100,
+    'sex': rng.integers(1, 3, rows),
+    'age': rng.integers(0, 96, rows),
+    'empstat': empstat,
+    'labforce': np.where(empstat == 0, 0, np.where(empstat == 3, 1, 2)),
+    'educ': rng.integers(0, 12, rows),
+    'indnaics': ind
+  })
+
+
+def make_extract(
+  directory: str,
+  rows: int = 100000,
+  seed: int = 0,
+  name: str = 'synthetic',
+  chunksize: int = 100000,
+  **kwds
+) -> Tuple[str, str]:
+  """Write a synthetic fixed-width extract and its `.do` file.
+
+  Args:
+      directory (str): Where to write the files.
+      rows (int, optional): Number of records.
+      seed (int, optional): Random seed.
+      name (str, optional): Base name of the files.
+      chunksize (int, optional): Records generated at a time.
+      **kwds: Passed to `make_records`.
+
+  Returns:
+      Tuple[str, str]: Paths to the `.dat.gz` and `.do` files.
+  """
+  os.makedirs(directory, exist_ok=True)
+  datFile = os.path.join(directory, name + '.dat.gz')
+  doFile = make_do_file(os.path.join(directory, name + '.do'))
+
+  with gzip.open(datFile, 'wb', compresslevel=1) as f:
+    for ii, start in enumerate(range(0, rows, chunksize)):
+      df = make_records(
+        min(chunksize, rows - start), seed=seed + ii, **kwds
+      )
+
+      line = np.full(len(df), '')
+      for var, stype, width, _ in VARIABLES:
+        values = np.asarray(df[var], dtype=str)
+        if stype == 'str':
+          line = np.char.add(line, np.char.ljust(values, width))
+        else:
+          line = np.char.add(line, np.char.zfill(values, width))
+
+      f.write(('\n'.join(line) + '\n').encode())
+
+  return datFile, doFile
+
+
+def make_direct_requirements(
+  n: int = 400, density: float = 0.05, seed: int = 0
+) -> pd.DataFrame:
+  """A random sparse direct requirements matrix.
+
+  Every column sums to less than one (so that total requirements exist) and
+  the steel and aluminum industries (`IO_CODES`) are inputs to a sizeable
+  share of industries.
+
+  Args:
+      n (int, optional): Number of industries.
+      density (float, optional): Share of non-zero entries.
+      seed (int, optional): Random seed.
+
+  Returns:
+      pd.DataFrame: (n x n) with the codes of `io_industries(n)` as index
+        and columns.
+  """
+  rng = np.random.default_rng(seed)
+
+  A = rng.random((n, n)) * (rng.random((n, n)) < density)
+  A[:len(IO_CODES)] = rng.random((len(IO_CODES), n)) * \
+    (rng.random((len(IO_CODES), n)) < 0.3)
+  A *= rng.uniform(0.2, 0.6, n) / np.maximum(A.sum(axis=0), 1e-12)
+
+  codes = io_industries(n)
+  return pd.DataFrame(A, index=codes, columns=codes)
+
+
+def make_industry_crosswalk(
+  io_codes: List[str], acs_codes: List[str], seed: int = 0
+) -> Dict[str, List[str]]:
+  """A random ACS <- IO industry crosswalk.
+
+  Each IO industry belongs to one ACS industry (and one in ten to a second
+  one), and the steel and aluminum industries are matched up.
+
+  Returns:
+      dict: ACS code -> list of IO codes (as read by
+        `DownstreamTariffExposure.get_acs_io_crosswalk`).
+  """
+  rng = np.random.default_rng(seed)
+
+  owner = rng.integers(0, len(acs_codes), len(io_codes))
+  owner[:min(len(IO_CODES), len(acs_codes))] = np.arange(
+    min(len(IO_CODES), len(acs_codes))
+  )
+
+  cw = {code: [] for code in acs_codes}
+  for io_code, jj in zip(io_codes, owner):
+    cw[acs_codes[jj]].append(io_code)
+    if rng.random() < 0.1:
+      cw[acs_codes[rng.integers(len(acs_codes))]].append(io_code)
+
+  return {code: v for code, v in cw.items() if v}
+
+
+def make_tract_file(
+  filename: str, tracts_per_county: int = 20, seed: int = 0, **geo
+) -> str:
+  """Write a synthetic '2010_Census_Tract_to_2010_PUMA.txt'.
+
+  Each county's tracts fall in a few neighbouring PUMAs of its state.
+
+  Args:
+      filename (str): Where to write the file.
+      tracts_per_county (int, optional): Tracts in each county.
+      seed (int, optional): Random seed.
+      **geo: Passed to `geography`.
+
+  Returns:
+      str: `filename`.
+  """
+  rng = np.random.default_rng(seed)
+  geo = geography(**geo)
+  nS, nC, nP = len(geo['states']), len(geo['counties']), len(geo['pumas'])
+
+  state = np.repeat(geo['states'], nC * tracts_per_county)
+  county = np.tile(np.repeat(geo['counties'], tracts_per_county), nS)
+  tract = np.tile(100 * np.arange(1, tracts_per_county + 1) + 1, nS * nC)
+
+  # PUMAs near the county's position in the state.
+  center = np.tile(np.repeat(np.arange(nC) * nP // nC, tracts_per_county), nS)
+  puma = geo['pumas'][
+    np.clip(center + rng.integers(-1, 3, len(center)), 0, nP - 1)
+  ]
+
+  pd.DataFrame({
+    'STATEFP': ['{:02d}'.format(v) for v in state],
+    'COUNTYFP': ['{:03d}'.format(v) for v in county],
+    'TRACTCE': ['{:06d}'.format(v) for v in tract],
+    'PUMA5CE': ['{:05d}'.format(v) for v in puma]
+  }).to_csv(filename, index=False)
+
+  return filename
@@ -0,0 +1,3 @@
+from .industry import IndustryCrosswalk
+from .geography import PumaCountyCrosswalk
+from .employment import EmploymentMatrix
\ No newline at end of file
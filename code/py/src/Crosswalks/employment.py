@@ -0,0 +1,167 @@
+"""Employment by PUMA and industry as a sparse matrix.
+
+The ACS worker counts (one row per industry and PUMA) are held as a CSR
+matrix of PUMAs x ACS industries, so that employment in a basket of
+industries, industry shares and employment-weighted means over industries
+are all sparse matrix products over every PUMA at once.
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from typing import Dict, List
+
+from .geokeys import decode_puma, encode_puma
+
+
+class EmploymentMatrix(object):
+  """Workers in each PUMA and industry.
+
+  Attributes:
+      M (scipy.sparse.csr_matrix): (PUMA x industry) worker counts.
+      pumas (pd.Index): Integer PUMA ids (rows of `M`). See `geokeys`.
+      industries (pd.Index): ACS industry codes (columns of `M`).
+  """
+
+  def __init__(
+    self, M: scipy.sparse.spmatrix, pumas: pd.Index, industries: pd.Index
+  ):
+    self.M = scipy.sparse.csr_matrix(M, dtype=np.float64)
+    self.pumas = pd.Index(pumas, name='puma_id')
+    self.industries = pd.Index(industries, name='ind')
+    self._totals = None
+
+  @classmethod
+  def from_frame(
+    cls,
+    df: pd.DataFrame,
+    count: str = 'count',
+    ind: str = 'ind',
+    state: str = 'state',
+    puma: str = 'puma'
+  ) -> 'EmploymentMatrix':
+    """Build from a long frame of worker counts (e.g. `get_acs_data`).
+
+    Missing industry codes are kept as an industry of their own so that
+    they count towards the PUMA totals.
+
+    Args:
+        df (pd.DataFrame): Frame with count, industry, state and PUMA
+          columns.
+        count (str, optional): Column of worker counts.
+        ind (str, optional): Column of industry codes.
+        state (str, optional): Column of state fips codes.
+        puma (str, optional): Column of PUMA codes.
+
+    Returns:
+        EmploymentMatrix: The matrix.
+    """
+    rows, pumas = pd.factorize(
+      encode_puma(df[state].values, df[puma].values), sort=True
+    )
+    cols, industries = pd.factorize(
+      df[ind].values, sort=True, use_na_sentinel=False
+    )
+
+    M = scipy.sparse.csr_matrix(
+      (df[count].values.astype(np.float64), (rows, cols)),
+      shape=(len(pumas), len(industries))
+    )
+    M.sum_duplicates()
+
+    return cls(M, pumas, industries)
+
+  @property
+  def totals(self) -> np.ndarray:
+    """Workers in each PUMA."""
+    if self._totals is None:
+      self._totals = np.asarray(self.M.sum(axis=1)).ravel()
+    return self._totals
+
+  def baskets(
+    self, baskets: Dict[str, List[str]]
+  ) -> scipy.sparse.csc_matrix:
+    """(industry x basket) indicators of baskets of industry codes.
+
+    Args:
+        baskets (dict): Name -> list of industry codes. Codes not in the
+          matrix are ignored.
+
+    Returns:
+        scipy.sparse.csc_matrix: Indicators.
+    """
+    rows, cols = [], []
+    for jj, codes in enumerate(baskets.values()):
+      pos = np.unique(self.industries.get_indexer(list(codes)))
+      pos = pos[pos >= 0]
+      rows.append(pos)
+      cols.append(np.full(len(pos), jj))
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+    return scipy.sparse.csc_matrix(
+      (np.ones(len(rows)), (rows, cols)),
+      shape=(len(self.industries), len(baskets))
+    )
+
+  def employment(self, baskets: Dict[str, List[str]]) -> pd.DataFrame:
+    """Workers in each basket of industries in every PUMA.
+
+    Args:
+        baskets (dict): Name -> list of industry codes.
+
+    Returns:
+        pd.DataFrame: PUMAs x baskets.
+    """
+    return pd.DataFrame(
+      (self.M @ self.baskets(baskets)).toarray(),
+      index=self.pumas,
+      columns=list(baskets.keys())
+    )
+
+  def shares(self, baskets: Dict[str, List[str]]) -> pd.DataFrame:
+    """Percent of each PUMA's workers in each basket of industries.
+
+    Args:
+        baskets (dict): Name -> list of industry codes.
+
+    Returns:
+        pd.DataFrame: PUMAs x baskets.
+    """
+    emp = self.employment(baskets)
+    with np.errstate(invalid='ignore', divide='ignore'):
+      return 100 * emp / self.totals[:, None]
+
+  def weighted_mean(self, values: [pd.DataFrame, pd.Series]) -> pd.DataFrame:
+    """Employment-weighted mean of industry-level values in each PUMA.
+
+    Industries missing from `values` are left out. Missing values count as
+    zero while their workers still count in the denominator (as with an
+    inner merge followed by a weighted mean). PUMAs without any of the
+    industries are dropped.
+
+    Args:
+        values (pd.DataFrame, pd.Series): Values indexed by industry code.
+
+    Returns:
+        pd.DataFrame: PUMAs x columns of `values`.
+    """
+    if isinstance(values, pd.Series):
+      values = values.to_frame()
+
+    present = self.industries.isin(values.index).astype(np.float64)
+    X = values.reindex(self.industries).values.astype(np.float64)
+
+    num = self.M @ np.nan_to_num(X)
+    den = self.M @ present
+
+    keep = den > 0
+    return pd.DataFrame(
+      num[keep] / den[keep, None],
+      index=self.pumas[keep],
+      columns=values.columns
+    )
+
+  def state_puma(self, index: [pd.Index, None] = None) -> pd.DataFrame:
+    """(state, puma) codes of PUMA ids (defaults to `self.pumas`)."""
+    state, puma = decode_puma(self.pumas if index is None else index)
+    return pd.DataFrame({'state': state, 'puma': puma})
@@ -0,0 +1,163 @@
+"""Conversion of PUMA-level results to counties.
+
+The Census tract -> PUMA relationship file is compiled once into a sparse
+(county x PUMA) allocation matrix whose entries weight each PUMA within each
+county that it overlaps. Converting a PUMA-level frame (any number of
+columns) to counties is then a single sparse matrix product.
+
+With equal weights a county gets the plain mean of all PUMAs that have a
+tract in it. Given tract populations, each PUMA is instead weighted by the
+number of the county's residents that live in it, which addresses the
+inexactness discussed in `scripts/puma_to_county_crosswalk_exploration.py`.
+"""
+import hashlib, os
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from ..IpumsExtract.utils import file_digest
+from .geokeys import encode_county, encode_puma
+
+# Bump when the cached representation changes.
+CACHE_VERSION = 2
+
+
+class PumaCountyCrosswalk(object):
+  """Sparse allocation of PUMAs to counties.
+
+  Attributes:
+      A (scipy.sparse.csr_matrix): (county x PUMA) weights.
+      counties (pd.Index): Integer county ids (rows of `A`). See `geokeys`.
+      pumas (pd.Index): Integer PUMA ids (columns of `A`).
+  """
+
+  def __init__(
+    self, A: scipy.sparse.spmatrix, counties: pd.Index, pumas: pd.Index
+  ):
+    self.A = scipy.sparse.csr_matrix(A)
+    self.counties = pd.Index(counties, name='county_id')
+    self.pumas = pd.Index(pumas, name='puma_id')
+
+  @classmethod
+  def from_tract_file(
+    cls, filename: str, populations: [pd.Series, None] = None
+  ) -> 'PumaCountyCrosswalk':
+    """Compile the Census tract -> PUMA relationship file.
+
+    Args:
+        filename (str): Path to '2010_Census_Tract_to_2010_PUMA.txt'.
+        populations (pd.Series, None, optional): Population of each tract,
+          indexed by (state, county, tract) fips codes. If None, every PUMA
+          overlapping a county gets equal weight.
+
+    Returns:
+        PumaCountyCrosswalk: The compiled crosswalk.
+    """
+    cw = pd.read_csv(
+      filename, skiprows=1, names=['state', 'county', 'tract', 'puma']
+    )
+
+    if populations is None:
+      cw = cw[['state', 'county', 'puma']].drop_duplicates()
+      cw['weight'] = 1.
+    else:
+      cw['weight'] = populations.reindex(
+        pd.MultiIndex.from_frame(cw[['state', 'county', 'tract']])
+      ).fillna(0.).values
+      cw = cw.groupby(['state', 'county', 'puma'],
+                      as_index=False)['weight'].sum()
+
+    county_id = encode_county(cw['state'], cw['county'])
+    puma_id = encode_puma(cw['state'], cw['puma'])
+
+    rows, counties = pd.factorize(county_id, sort=True)
+    cols, pumas = pd.factorize(puma_id, sort=True)
+
+    A = scipy.sparse.csr_matrix(
+      (cw['weight'].values.astype(np.float64), (rows, cols)),
+      shape=(len(counties), len(pumas))
+    )
+    A.eliminate_zeros()
+
+    return cls(A, counties, pumas)
+
+  @classmethod
+  def load(
+    cls,
+    filename: str,
+    cache_file: [str, None] = None,
+    populations: [pd.Series, None] = None
+  ) -> 'PumaCountyCrosswalk':
+    """Compile the tract file, or load it from `cache_file` if the cached
+    copy was compiled from the same file and populations.
+
+    Args:
+        filename (str): See `from_tract_file`.
+        cache_file (str, None, optional): Path to an `.npz` cache.
+        populations (pd.Series, None, optional): See `from_tract_file`.
+
+    Returns:
+        PumaCountyCrosswalk: The compiled crosswalk.
+    """
+    if cache_file is None:
+      return cls.from_tract_file(filename, populations)
+
+    h = hashlib.sha1(file_digest(filename).encode())
+    h.update(str(CACHE_VERSION).encode())
+    if populations is not None:
+      h.update(pd.util.hash_pandas_object(populations).values.tobytes())
+    key = h.hexdigest()
+
+    if os.path.exists(cache_file):
+      with np.load(cache_file, allow_pickle=False) as f:
+        if str(f['key']) == key:
+          A = scipy.sparse.csr_matrix(
+            (f['data'], f['indices'], f['indptr']), shape=tuple(f['shape'])
+          )
+          return cls(A, f['counties'], f['pumas'])
+
+    cw = cls.from_tract_file(filename, populations)
+    np.savez(
+      cache_file,
+      key=key,
+      data=cw.A.data,
+      indices=cw.A.indices,
+      indptr=cw.A.indptr,
+      shape=np.array(cw.A.shape),
+      counties=cw.counties.values,
+      pumas=cw.pumas.values
+    )
+    return cw
+
+  def to_dict(self) -> dict:
+    """County id -> list of overlapping PUMA ids."""
+    pumas = self.pumas.values[self.A.indices]
+    return dict(
+      zip(
+        self.counties,
+        [list(v) for v in np.split(pumas, self.A.indptr[1:-1])]
+      )
+    )
+
+  def convert(self, df: pd.DataFrame) -> pd.DataFrame:
+    """Convert PUMA-level results to counties.
+
+    PUMAs missing from `df` (or missing values) are left out of the average
+    and counties without any data are dropped.
+
+    Args:
+        df (pd.DataFrame): Numeric frame indexed by integer PUMA id.
+
+    Returns:
+        pd.DataFrame: Weighted mean of the overlapping PUMAs for each county,
+          indexed by integer county id.
+    """
+    X = df.reindex(self.pumas).values.astype(np.float64)
+    valid = ~np.isnan(X)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+      out = (self.A @ np.where(valid, X, 0.)) / \
+        (self.A @ valid.astype(np.float64))
+
+    out = pd.DataFrame(out, index=self.counties, columns=df.columns)
+    return out.dropna(how='all')
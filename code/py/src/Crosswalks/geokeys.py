@@ -0,0 +1,90 @@
+"""Integer geography keys.
+
+PUMAs and counties are identified by packed integers,
+
+  puma_id = state * 100000 + puma
+  county_id = state * 1000 + county
+
+which join and sort like the usual zero-padded fips strings ('SSPPPPP' and
+'SSCCC') but are smaller and much faster to build and compare. The strings
+are only produced (with `format_puma`/`format_county`) when writing output.
+"""
+import numpy as np
+import pandas as pd
+
+PUMA_BASE = 10**5
+COUNTY_BASE = 10**3
+
+PUMA_WIDTH = 7
+COUNTY_WIDTH = 5
+
+
+def _ints(values) -> np.ndarray:
+  # Accepts ints, floats holding integers (e.g. after a groupby) and strings.
+  values = np.asarray(values)
+  if values.dtype.kind in 'OUS':
+    values = pd.to_numeric(values.ravel()).reshape(values.shape)
+  return values.astype(np.int64)
+
+
+def _encode(state, code, base: int) -> np.ndarray:
+  return _ints(state) * base + _ints(code)
+
+
+def _format(ids, width: int) -> np.ndarray:
+  return np.char.zfill(_ints(ids).astype(str), width).astype(object)
+
+
+def encode_puma(state, puma) -> np.ndarray:
+  """Pack state fips and PUMA codes into PUMA ids.
+
+  Args:
+      state (array-like): State fips codes.
+      puma (array-like): State-dependent PUMA codes.
+
+  Returns:
+      np.ndarray: int64 PUMA ids.
+  """
+  return _encode(state, puma, PUMA_BASE)
+
+
+def decode_puma(ids) -> tuple:
+  """Inverse of `encode_puma`.
+
+  Returns:
+      tuple: (state, puma) arrays.
+  """
+  return np.divmod(_ints(ids), PUMA_BASE)
+
+
+def encode_county(state, county) -> np.ndarray:
+  """Pack state and county fips codes into county ids.
+
+  Args:
+      state (array-like): State fips codes.
+      county (array-like): State-dependent county fips codes.
+
+  Returns:
+      np.ndarray: int64 county ids.
+  """
+  return _encode(state, county, COUNTY_BASE)
+
+
+def decode_county(ids) -> tuple:
+  """Inverse of `encode_county`.
+
+  Returns:
+      tuple: (state, county) arrays.
+  """
+  return np.divmod(_ints(ids), COUNTY_BASE)
+
+
+def format_puma(ids) -> np.ndarray:
+  """PUMA ids as 7-digit strings (e.g. 1700100 -> '1700100', 100100 ->
+  '0100100')."""
+  return _format(ids, PUMA_WIDTH)
+
+
+def format_county(ids) -> np.ndarray:
+  """County ids as 5-digit fips strings (e.g. 1001 -> '01001')."""
+  return _format(ids, COUNTY_WIDTH)
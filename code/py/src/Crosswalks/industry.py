@@ -0,0 +1,145 @@
+"""Conversion of results between industry classifications.
+
+A crosswalk from target codes (e.g. ACS industries) to lists of source codes
+(e.g. IO industries) is compiled once into a sparse (target x source)
+membership matrix. Means and weighted means are then sparse matrix products
+and medians a single grouped sort, over every column of the input at once.
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from typing import Dict, List
+
+METHODS = ('median', 'mean', 'wmean')
+
+
+class IndustryCrosswalk(object):
+  """Many-to-many crosswalk from source to target industry codes.
+
+  Attributes:
+      index (pd.Index): Target codes (rows of the result).
+      source (pd.Index): Source codes.
+      M (scipy.sparse.csr_matrix): (target x source) membership matrix.
+  """
+
+  def __init__(self, mapping: Dict[str, List[str]]):
+    """
+    Args:
+        mapping (dict): Target code -> list of source codes. A source code
+          may appear under any number of targets.
+    """
+    self.index = pd.Index(list(mapping.keys()))
+    self.source = pd.Index(
+      pd.unique(np.concatenate([np.asarray(v) for v in mapping.values()]))
+    )
+
+    rows = np.repeat(
+      np.arange(len(mapping)), [len(v) for v in mapping.values()]
+    )
+    cols = self.source.get_indexer(
+      np.concatenate([np.asarray(v) for v in mapping.values()])
+    )
+
+    self.M = scipy.sparse.csr_matrix(
+      (np.ones(len(rows)), (rows, cols)),
+      shape=(len(self.index), len(self.source))
+    )
+    self.M.sum_duplicates()
+    self.M.data[:] = 1.
+    self.M.sort_indices()
+
+  def _values(self, ior: [pd.DataFrame, pd.Series]) -> np.ndarray:
+    # Source-code rows of `ior`, as a 2-D float array. Source codes missing
+    # from `ior` are NaN (and so ignored).
+    values = ior.reindex(self.source).values.astype(np.float64)
+    return values.reshape(len(self.source), -1)
+
+  def median(self, X: np.ndarray) -> np.ndarray:
+    """Median of each target's source rows, ignoring NaNs.
+
+    Args:
+        X (np.ndarray): (source x k) values.
+
+    Returns:
+        np.ndarray: (target x k) medians.
+    """
+    M = self.M
+    rows = np.repeat(np.arange(M.shape[0]), np.diff(M.indptr))
+    V = X[M.indices]
+
+    # Sort each column within each (contiguous) group; NaNs sort last.
+    order = np.lexsort((V, np.broadcast_to(rows[:, None], V.shape)), axis=0)
+    V = np.take_along_axis(V, order, axis=0)
+
+    start = M.indptr[:-1, None]
+    count = np.rint(M @ (~np.isnan(X)).astype(np.float64)).astype(np.int64)
+
+    last = max(M.nnz - 1, 0)
+    lo = np.minimum(start + np.maximum(count - 1, 0) // 2, last)
+    hi = np.minimum(start + count // 2, last)
+    cols = np.arange(X.shape[1])[None, :]
+
+    with np.errstate(invalid='ignore'):
+      out = (V[lo, cols] + V[hi, cols]) / 2
+    out[count == 0] = np.nan
+    return out
+
+  def mean(self, X: np.ndarray, weights: [np.ndarray, None] = None
+           ) -> np.ndarray:
+    """(Weighted) mean of each target's source rows, ignoring NaNs.
+
+    Args:
+        X (np.ndarray): (source x k) values.
+        weights (np.ndarray, None, optional): Weight of each source row.
+
+    Returns:
+        np.ndarray: (target x k) means.
+    """
+    W = self.M if weights is None else self.M @ scipy.sparse.diags(weights)
+    valid = ~np.isnan(X)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+      return (W @ np.where(valid, X, 0.)) / (W @ valid.astype(np.float64))
+
+  def convert(
+    self,
+    ior: [pd.DataFrame, pd.Series],
+    how: str = 'median',
+    weights: [pd.Series, None] = None,
+    axis: int = 0
+  ) -> [pd.DataFrame, pd.Series]:
+    """Convert a result stated in source codes to one in target codes.
+
+    Args:
+        ior (pd.DataFrame, pd.Series): Result with source codes along `axis`.
+        how (str, optional): 'median', 'mean' or 'wmean' (mean weighted by
+          `weights`) of each target's source codes.
+        weights (pd.Series, None, optional): Weight of each source code.
+        axis (int, optional): 0 if source codes are the index, 1 if they are
+          the columns (e.g. a batch of scenarios).
+
+    Returns:
+        pd.DataFrame, pd.Series: Float result with target codes along
+          `axis`.
+    """
+    if how not in METHODS:
+      raise ValueError('how must be one of {}, not {!r}'.format(METHODS, how))
+
+    if axis == 1:
+      return self.convert(ior.T, how=how, weights=weights).T
+
+    X = self._values(ior)
+
+    if how == 'median':
+      out = self.median(X)
+    elif how == 'mean':
+      out = self.mean(X)
+    else:
+      if weights is None:
+        raise ValueError("how='wmean' requires `weights`.")
+      out = self.mean(X, weights.reindex(self.source).fillna(0.).values)
+
+    if isinstance(ior, pd.Series):
+      return pd.Series(out[:, 0], index=self.index, name=ior.name)
+
+    return pd.DataFrame(out, index=self.index, columns=ior.columns)
@@ -0,0 +1,3 @@
+from .bea import BeaWorkbook
+from .engine import ExposureEngine, ExposureState
+from .panel import IOPanel
\ No newline at end of file
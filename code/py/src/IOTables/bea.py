@@ -0,0 +1,259 @@
+"""BEA input-output workbooks without Excel.
+
+Parsing the BEA workbooks with `pd.read_excel` is slow, so each workbook is
+converted once into a compressed `.npz` store holding, for each year sheet,
+the table values with their row and column codes and names, and the text of
+the 'NAICS codes' sheet. Later loads only read the store (keyed by the hash
+of the workbook) and never touch openpyxl/xlrd.
+
+Both layouts used by BEA are understood: the summary tables (codes above a
+row starting with 'IOCode') and the detail/import tables (codes in a row
+starting with 'Code', names above it).
+"""
+import hashlib, os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+from ..IpumsExtract.utils import file_digest
+
+NAICS_SHEET = 'NAICS codes'
+NAICS_HEADER = 'BEA Code and Title'
+HEADER_CELLS = ('IOCode', 'Code')
+
+# Bump when the stored representation changes.
+STORE_VERSION = 1
+
+
+def _text(values) -> np.ndarray:
+  # Cells as strings ('' if empty), with integral numbers written as ints
+  # (e.g. 111200 rather than 111200.0) as in the BEA codes.
+  def fmt(v):
+    if isinstance(v, str):
+      return v.strip()
+    if v is None or (isinstance(v, float) and np.isnan(v)):
+      return ''
+    if isinstance(v, (float, np.floating)) and float(v).is_integer():
+      return str(int(v))
+    return str(v)
+
+  return np.array([fmt(v) for v in np.ravel(values)], dtype=str)
+
+
+def _has_space(cells: np.ndarray) -> int:
+  return int(np.char.count(cells, ' ').astype(bool).sum())
+
+
+def parse_table(grid: pd.DataFrame) -> Dict[str, np.ndarray]:
+  """Split an IO table sheet into values, codes and names.
+
+  Args:
+      grid (pd.DataFrame): Sheet read with `header=None`.
+
+  Returns:
+      dict: 'values' (rows x columns float array, NaN if not a number),
+        'rows'/'row_names' and 'cols'/'col_names' (string arrays).
+  """
+  first = _text(grid.iloc[:, 0].values)
+  hh = int(np.flatnonzero(np.isin(first, HEADER_CELLS))[0])
+
+  # Codes have no spaces; names mostly do.
+  above, below = _text(grid.iloc[hh - 1, 2:].values), \
+    _text(grid.iloc[hh, 2:].values)
+  if _has_space(above) < _has_space(below):
+    cols, col_names = above, below
+  else:
+    cols, col_names = below, above
+
+  body = grid.iloc[hh + 1:]
+  names = _text(body.iloc[:, 1].values)
+  rows = _text(body.iloc[:, 0].values)
+  # Totals in the summary tables have a name but no code.
+  rows = np.where(rows == '', names, rows)
+
+  keep_rows = names != ''
+  keep_cols = (cols != '') | (col_names != '')
+  cols = np.where(cols == '', col_names, cols)
+
+  values = body.iloc[keep_rows, 2:].iloc[:, keep_cols].apply(
+    pd.to_numeric, errors='coerce'
+  ).values.astype(np.float64)
+
+  return {
+    'values': values,
+    'rows': rows[keep_rows],
+    'row_names': names[keep_rows],
+    'cols': cols[keep_cols],
+    'col_names': col_names[keep_cols]
+  }
+
+
+def parse_naics_sheet(grid: pd.DataFrame) -> np.ndarray:
+  """Text of the code and title columns of the 'NAICS codes' sheet.
+
+  Args:
+      grid (pd.DataFrame): Sheet read with `header=None`.
+
+  Returns:
+      np.ndarray: (rows x 6) strings from below the header to the last code.
+  """
+  first = _text(grid.iloc[:, 0].values)
+  start = int(np.flatnonzero(first == NAICS_HEADER)[0]) + 1
+
+  text = _text(grid.iloc[start:, :6].values).reshape(-1, 6)
+  # Footnotes follow the last detail code.
+  stop = np.flatnonzero(text[:, 2] != '')[-1] + 1
+  return text[:stop]
+
+
+class BeaWorkbook(object):
+  """Tables of a BEA input-output workbook.
+
+  Attributes:
+      sheets (dict): Year -> output of `parse_table`.
+      naics (np.ndarray, None): Text of the 'NAICS codes' sheet (see
+        `parse_naics_sheet`), if the workbook has one.
+  """
+
+  def __init__(
+    self, sheets: Dict[str, Dict[str, np.ndarray]],
+    naics: [np.ndarray, None] = None
+  ):
+    self.sheets = sheets
+    self.naics = naics
+
+  @property
+  def years(self) -> List[str]:
+    return sorted(self.sheets)
+
+  @classmethod
+  def from_excel(cls, filename: str) -> 'BeaWorkbook':
+    """Parse a workbook (slow).
+
+    Args:
+        filename (str): Path to the BEA `.xlsx` file.
+
+    Returns:
+        BeaWorkbook: The parsed workbook.
+    """
+    grids = pd.read_excel(filename, sheet_name=None, header=None)
+
+    sheets = {
+      name: parse_table(grid)
+      for name, grid in grids.items() if name.strip().isdigit()
+    }
+    naics = parse_naics_sheet(grids[NAICS_SHEET]) \
+      if NAICS_SHEET in grids else None
+
+    return cls(sheets, naics)
+
+  @classmethod
+  def load(cls, filename: str,
+           cache_file: [str, None] = None) -> 'BeaWorkbook':
+    """Load the workbook from `cache_file`, converting it first if the
+    cached copy is missing or was made from a different file.
+
+    Args:
+        filename (str): Path to the BEA `.xlsx` file.
+        cache_file (str, None, optional): Path to an `.npz` store.
+
+    Returns:
+        BeaWorkbook: The parsed workbook.
+    """
+    if cache_file is None:
+      return cls.from_excel(filename)
+
+    h = hashlib.sha1(file_digest(filename).encode())
+    h.update(str(STORE_VERSION).encode())
+    key = h.hexdigest()
+
+    if os.path.exists(cache_file):
+      with np.load(cache_file, allow_pickle=False) as f:
+        if str(f['key']) == key:
+          return cls._from_store(f)
+
+    wb = cls.from_excel(filename)
+    wb.save(cache_file, key)
+    return wb
+
+  @classmethod
+  def _from_store(cls, f) -> 'BeaWorkbook':
+    sheets = {}
+    for name in f['years']:
+      sheets[str(name)] = {
+        field: f['{}__{}'.format(name, field)]
+        for field in ('values', 'rows', 'row_names', 'cols', 'col_names')
+      }
+    naics = f['naics'] if 'naics' in f.files else None
+    return cls(sheets, naics)
+
+  def save(self, cache_file: str, key: str = '') -> None:
+    """Write the workbook to an `.npz` store (see `load`)."""
+    arrays = {
+      '{}__{}'.format(name, field): value
+      for name, sheet in self.sheets.items()
+      for field, value in sheet.items()
+    }
+    if self.naics is not None:
+      arrays['naics'] = self.naics
+
+    np.savez_compressed(
+      cache_file, key=key, years=np.array(self.years, dtype=str), **arrays
+    )
+
+  def table(self, year: [str, int]) -> pd.DataFrame:
+    """The table for a year, with codes as index and columns."""
+    sheet = self.sheets[str(year)]
+    return pd.DataFrame(
+      sheet['values'],
+      index=pd.Index(sheet['rows'], dtype=object),
+      columns=pd.Index(sheet['cols'], dtype=object)
+    )
+
+  def names(self, year: [str, int]) -> Tuple[pd.Series, pd.Series]:
+    """(row names, column names) of the table for a year, indexed by code."""
+    sheet = self.sheets[str(year)]
+    return (
+      pd.Series(
+        sheet['row_names'], index=pd.Index(sheet['rows'], dtype=object),
+        dtype=object
+      ),
+      pd.Series(
+        sheet['col_names'], index=pd.Index(sheet['cols'], dtype=object),
+        dtype=object
+      )
+    )
+
+  def naics_codes(self) -> pd.DataFrame:
+    """Hierarchy of BEA industries from the 'NAICS codes' sheet.
+
+    Sector rows have their code and title in the first two columns, summary
+    rows in the second and third and detail rows in the third and fourth.
+
+    Returns:
+        pd.DataFrame: One row per detail industry with columns:
+          naics2 (str) - 2-digit NAICS code (sector)
+          naics3 (str) - 3-digit NAICS code (summary)
+          naics6 (str) - 6-digit/"Detailed" NAICS code
+          *_name (str) - Descriptions of each code
+    """
+    c0, c1, c2, c3 = (self.naics[:, jj] for jj in range(4))
+    sector = c0 != ''
+    blank = np.full(len(c0), '', dtype=c0.dtype)
+
+    df = pd.DataFrame({
+      'naics2': np.where(sector, c0, blank),
+      'naics3': np.where(sector, blank, c1),
+      'naics6': np.where(sector | (c1 != ''), blank, c2),
+      'naics2_name': np.where(sector, c1, blank),
+      'naics3_name': np.where(c1 != '', c2, blank),
+      'naics6_name': c3
+    }, dtype=object).replace('', np.nan)
+
+    for vv in ['naics2', 'naics3']:
+      df[vv] = df[vv].ffill()
+      df[vv + '_name'] = df[vv + '_name'].ffill()
+
+    return df.dropna(how='any')[[
+      'naics2', 'naics3', 'naics6', 'naics2_name', 'naics3_name', 'naics6_name'
+    ]]
@@ -0,0 +1,390 @@
+"""Requirements of selected industries in an input-output table.
+
+Only the rows of the requirements matrices that belong to the selected
+industries are ever needed, so rather than forming matrix powers of the
+direct requirements matrix `DR` the engine propagates the selected rows,
+`e^T DR^k`, and finds the infinite-order (Leontief) requirements
+`e^T (I - DR)^-1` by solving against a cached LU factorisation of `I - DR`.
+
+For large (detailed or multi-region) tables `DR` can be held as a
+`scipy.sparse` CSR matrix, in which case the powers are sparse
+matrix-vector products and `I - DR` is either factorised with SuperLU or
+solved iteratively (GMRES) without ever being formed densely.
+
+The propagated rows are kept in an `ExposureState` per selector, so asking
+for higher orders later (e.g. 10, then 25, then 100) only computes the
+additional orders. A state only holds the cumulative requirements of the
+orders that were asked for, and the engine keeps a bounded number (and
+size) of states.
+"""
+import collections
+import numpy as np
+import pandas as pd
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+from typing import List
+
+SOLVERS = ('direct', 'iterative')
+
+# Number of selectors whose `ExposureState` is kept by an engine, and their
+# largest total size (bytes). The most recently used state is always kept.
+MAX_STATES = 16
+MAX_STATE_BYTES = 2**28
+
+
+class ExposureState(object):
+  """Requirements of a (batch of) selector(s), extended order by order.
+
+  Attributes:
+      engine (ExposureEngine): Engine holding `DR`.
+      E (np.ndarray): (scenarios x n) selectors/weights.
+      inputsOnly (bool): Whether the order-0 term (`E` itself) is excluded.
+      totals (dict): Order k -> (scenarios x n) cumulative requirements of
+        orders 1 through k, for the orders that were asked for (see
+        `retain`).
+      order (int): Highest order computed so far.
+  """
+
+  def __init__(self, engine, E: np.ndarray, inputsOnly: bool = True):
+    self.engine = engine
+    self.E = E
+    self.inputsOnly = inputsOnly
+    self._infinite = None
+    self._retained = set()
+    self._restart()
+
+  def _restart(self) -> None:
+    # Back to order 0 (keeping the infinite order).
+    self.totals = {}
+    self.order = 0
+    self._vk = self.E
+    self._total = np.zeros_like(self.E) if self.inputsOnly else self.E.copy()
+
+  @property
+  def nbytes(self) -> int:
+    arrays = list(self.totals.values()) + [self.E, self._vk, self._total]
+    if self._infinite is not None:
+      arrays.append(self._infinite)
+    return sum(a.nbytes for a in arrays)
+
+  def retain(self, orders: list) -> 'ExposureState':
+    """Keep the cumulative requirements of these orders (ints; others,
+    e.g. 'Infinite', are ignored) as they are computed. Orders already
+    passed without being kept are recomputed from order 1 when asked for."""
+    orders = {_check_order(kk) for kk in orders if kk != 'Infinite'}
+    if any(kk <= self.order and kk not in self.totals for kk in orders):
+      self._restart()
+    self._retained |= orders
+    return self
+
+  def extend(self, mxR: int) -> 'ExposureState':
+    """Compute orders up to `mxR` (if not already done)."""
+    for kk in range(self.order + 1, mxR + 1):
+      self._vk = self.engine._step(self._vk)
+      self._total = self._total + self._vk
+      self.order = kk
+      if kk in self._retained:
+        self.totals[kk] = self._total
+    return self
+
+  def finite(self, mxR: int) -> np.ndarray:
+    """(scenarios x mxR x n) cumulative requirements of orders 1..mxR."""
+    if mxR == 0:
+      return np.empty((self.E.shape[0], 0, self.E.shape[1]))
+    self.retain(range(1, mxR + 1)).extend(mxR)
+    return np.stack([self.totals[kk] for kk in range(1, mxR + 1)], axis=1)
+
+  def infinite(self) -> np.ndarray:
+    """(scenarios x n) total requirements (cached)."""
+    if self._infinite is None:
+      self._infinite = self.engine.infinite(self.E)
+    return self._infinite
+
+  def get(self, order: [int, str]) -> np.ndarray:
+    """(scenarios x n) requirements of an order in `toKeep` (an int or
+    'Infinite')."""
+    if order == 'Infinite':
+      return self.infinite()
+    self.retain([order]).extend(order)
+    return self.totals[order]
+
+
+class ExposureEngine(object):
+  """Computes multi-order requirements from a direct requirements matrix.
+
+  Attributes:
+      DR (pd.DataFrame, scipy.sparse.spmatrix): Direct requirements matrix
+        (industry x industry).
+      A (np.ndarray, scipy.sparse.csr_matrix): `DR` as a float array (or
+        CSR matrix if `sparse`).
+      index (pd.Index): Industry codes.
+      sparse (bool): Whether `A` is sparse.
+      solver (str): 'direct' or 'iterative' solves for the infinite order.
+  """
+
+  def __init__(
+    self,
+    DR: [pd.DataFrame, scipy.sparse.spmatrix],
+    sparse: [bool, None] = None,
+    solver: str = 'direct',
+    index: [pd.Index, None] = None,
+    rtol: float = 1e-10
+  ):
+    """
+    Args:
+        DR (pd.DataFrame, scipy.sparse.spmatrix): Direct requirements matrix
+          with the same industry codes as index and columns, or a sparse
+          matrix whose industry codes are given by `index`.
+        sparse (bool, None, optional): Hold `DR` as a CSR matrix. Defaults
+          to True if `DR` is already sparse.
+        solver (str, optional): 'direct' (LU/SuperLU factorisation, cached)
+          or 'iterative' (GMRES) solves for the infinite order. SuperLU can
+          fill in badly on very large tables, so prefer 'iterative' there.
+        index (pd.Index, None, optional): Industry codes if `DR` is sparse.
+        rtol (float, optional): Relative tolerance of iterative solves.
+    """
+    if solver not in SOLVERS:
+      raise ValueError(
+        'solver must be one of {}, not {!r}'.format(SOLVERS, solver)
+      )
+
+    if scipy.sparse.issparse(DR):
+      if index is None:
+        raise ValueError('`index` is required when `DR` is sparse.')
+      values = DR
+    else:
+      index = DR.index
+      values = DR.values
+
+    if sparse is None:
+      sparse = scipy.sparse.issparse(DR)
+
+    self.DR = DR
+    self.index = pd.Index(index)
+    self.sparse = sparse
+    self.solver = solver
+    self.rtol = rtol
+
+    if sparse:
+      self.A = scipy.sparse.csr_matrix(values, dtype=np.float64)
+    elif scipy.sparse.issparse(values):
+      self.A = values.toarray().astype(np.float64)
+    else:
+      self.A = np.ascontiguousarray(values, dtype=np.float64)
+
+    self._lu = None
+    self._states = collections.OrderedDict()
+
+  def selector(self, inds: List[str]) -> np.ndarray:
+    """Indicator vector of the industries in `inds`.
+
+    Industries listed more than once are counted more than once (as with
+    `DR.loc[inds].sum()`).
+
+    Args:
+        inds (list): Industry codes.
+
+    Returns:
+        np.ndarray: Vector of length n.
+    """
+    pos = self.index.get_indexer(inds)
+    if (pos < 0).any():
+      raise KeyError(
+        'Not in the IO table: {}'.format(list(np.asarray(inds)[pos < 0]))
+      )
+
+    e = np.zeros(len(self.index))
+    np.add.at(e, pos, 1.)
+    return e
+
+  def lu(self):
+    """Cached LU factorisation of `I - DR` (SuperLU object if sparse)."""
+    if self._lu is None:
+      if self.sparse:
+        II = scipy.sparse.identity(len(self.index), format='csc')
+        self._lu = scipy.sparse.linalg.splu((II - self.A).tocsc())
+      else:
+        self._lu = scipy.linalg.lu_factor(np.eye(len(self.index)) - self.A)
+    return self._lu
+
+  def state(self, e: np.ndarray, inputsOnly: bool = True) -> ExposureState:
+    """Incremental requirements of `e`.
+
+    States of the most recently used selectors are kept, so that repeated
+    queries (e.g. with a higher `mxR`) reuse the orders already computed.
+
+    Args:
+        e (np.ndarray): Selector (see `selector`), or a (scenarios x n)
+          matrix of selectors/weights.
+        inputsOnly (bool, optional): Exclude the order-0 term (`e` itself).
+
+    Returns:
+        ExposureState: State for `e`.
+    """
+    E = np.atleast_2d(e).astype(np.float64)
+    key = (E.shape, E.tobytes(), inputsOnly)
+
+    if key in self._states:
+      self._states.move_to_end(key)
+    else:
+      self._states[key] = ExposureState(self, E, inputsOnly)
+
+    # Drop the least recently used states (states grow as they are used).
+    while len(self._states) > 1 and (
+      len(self._states) > MAX_STATES or
+      sum(st.nbytes for st in self._states.values()) > MAX_STATE_BYTES
+    ):
+      self._states.popitem(last=False)
+
+    return self._states[key]
+
+  def finite(self, e: np.ndarray, mxR: int,
+             inputsOnly: bool = True) -> np.ndarray:
+    """Cumulative requirements of orders 1 through `mxR`.
+
+    Args:
+        e (np.ndarray): Selector (see `selector`), or a (scenarios x n)
+          matrix of selectors/weights.
+        mxR (int): Highest order.
+        inputsOnly (bool, optional): Exclude the order-0 term (`e` itself).
+
+    Returns:
+        np.ndarray: (mxR x n) array whose row k-1 is
+          `e^T (DR + ... + DR^k)` (plus `e` if not `inputsOnly`), or a
+          (scenarios x mxR x n) array if `e` is a matrix.
+    """
+    out = self.state(e, inputsOnly).finite(mxR)
+    return out if np.ndim(e) == 2 else out[0]
+
+  def _step(self, V: np.ndarray) -> np.ndarray:
+    # V DR for a (scenarios x n) dense V.
+    if self.sparse:
+      return np.asarray((self.A.T @ V.T).T)
+    return V @ self.A
+
+  def infinite(self, e: np.ndarray) -> np.ndarray:
+    """Total requirements `e^T (I - DR)^-1`.
+
+    Args:
+        e (np.ndarray): Selector (see `selector`), or a (scenarios x n)
+          matrix of selectors/weights.
+
+    Returns:
+        np.ndarray: Vector of length n, or (scenarios x n) array.
+    """
+    if self.solver == 'iterative':
+      return self._iterative_solve(e)
+
+    if self.sparse:
+      return self.lu().solve(np.transpose(e), trans='T').T
+
+    return scipy.linalg.lu_solve(self.lu(), np.transpose(e), trans=1).T
+
+  def _iterative_solve(self, e: np.ndarray) -> np.ndarray:
+    # Solve (I - DR)^T x = e with GMRES, without forming I - DR.
+    n = len(self.index)
+    At = self.A.T
+    op = scipy.sparse.linalg.LinearOperator(
+      (n, n), matvec=lambda x: x - At @ x, dtype=np.float64
+    )
+
+    E = np.atleast_2d(e)
+    out = np.empty(E.shape)
+    for ii, b in enumerate(E):
+      x, info = scipy.sparse.linalg.gmres(op, b, x0=b, rtol=self.rtol)
+      if info != 0:
+        raise RuntimeError(
+          'GMRES did not converge for scenario {} (info={}).'.format(ii, info)
+        )
+      out[ii] = x
+
+    return out if np.ndim(e) == 2 else out[0]
+
+  def exposure(
+    self,
+    inds: List[str],
+    inputsOnly: bool = True,
+    mxR: int = 10,
+    toKeep: list = [1, 2, 5, 10, 'Infinite']
+  ) -> pd.DataFrame:
+    """Requirements of every industry for the industries in `inds`.
+
+    See `DownstreamTariffExposure.what_industries_are_most_exposed`.
+
+    Returns:
+        pd.DataFrame: Industries x orders in `toKeep`.
+    """
+    _check_orders(toKeep, mxR)
+    st = self.state(self.selector(inds), inputsOnly).retain(toKeep)
+
+    return pd.DataFrame(
+      np.column_stack([st.get(kk)[0] for kk in toKeep]),
+      index=self.index,
+      columns=pd.Index(toKeep, dtype=object)
+    )
+
+  def exposure_batch(
+    self,
+    weights: pd.DataFrame,
+    inputsOnly: bool = True,
+    mxR: int = 10,
+    toKeep: list = [1, 2, 5, 10, 'Infinite']
+  ) -> pd.DataFrame:
+    """Requirements of every industry for many scenarios at once.
+
+    Each order costs one (scenarios x n) by (n x n) matrix product and the
+    infinite order one multi-right-hand-side solve. Orders already computed
+    for the same weights are reused.
+
+    Args:
+        weights (pd.DataFrame): Scenarios x industries. Each row weights
+          the industries whose requirements are summed (an indicator row
+          reproduces `exposure`). Industries not given get zero weight.
+        inputsOnly (bool, optional): See `exposure`.
+        mxR (int, optional): See `exposure`.
+        toKeep (list, optional): See `exposure`.
+
+    Returns:
+        pd.DataFrame: (scenario, order) x industries. Row-major, so
+          `.values.reshape(len(weights), len(toKeep), -1)` is the
+          scenario x order x industry array.
+    """
+    missing = weights.columns.difference(self.index)
+    if len(missing) > 0:
+      raise KeyError('Not in the IO table: {}'.format(list(missing)))
+
+    E = weights.reindex(columns=self.index, fill_value=0.).values.astype(
+      np.float64
+    )
+
+    _check_orders(toKeep, mxR)
+    st = self.state(E, inputsOnly).retain(toKeep)
+
+    out = np.empty((E.shape[0], len(toKeep), E.shape[1]))
+    for jj, kk in enumerate(toKeep):
+      out[:, jj] = st.get(kk)
+
+    return pd.DataFrame(
+      out.reshape(-1, E.shape[1]),
+      index=pd.MultiIndex.from_product(
+        [weights.index, toKeep], names=['scenario', 'order']
+      ),
+      columns=self.index
+    )
+
+
+def _check_order(order) -> int:
+  # Finite orders start at 1 (order 0 is `E` itself, see `inputsOnly`).
+  if isinstance(order, bool) or not isinstance(order, (int, np.integer)) \
+    or order < 1:
+    raise ValueError(
+      "Orders must be integers >= 1 or 'Infinite', not {!r}".format(order)
+    )
+  return int(order)
+
+
+def _check_orders(toKeep: list, mxR: int) -> None:
+  keep = [kk for kk in toKeep if kk != 'Infinite']
+  if keep and max(keep) > mxR:
+    raise KeyError('Orders above mxR={}: {}'.format(mxR, keep))
@@ -0,0 +1,122 @@
+"""Direct requirements matrices for many years at once.
+
+The matrices are stacked into one contiguous (years x n x n) array so that
+the requirements of every year are found together: each order is a single
+batched matrix product and the infinite order a single batched solve of
+`(I - DR_t)^T x_t = e` over all years.
+"""
+import numpy as np
+import pandas as pd
+from typing import List
+
+from .bea import BeaWorkbook
+from .engine import ExposureEngine, _check_orders
+
+
+class IOPanel(object):
+  """Panel of direct requirements matrices.
+
+  Attributes:
+      A (np.ndarray): (years x n x n) direct requirements.
+      years (pd.Index): Years (first axis of `A`).
+      index (pd.Index): Industry codes (second and third axes of `A`).
+  """
+
+  def __init__(self, A: np.ndarray, years: List[str], index: pd.Index):
+    self.A = np.ascontiguousarray(A, dtype=np.float64)
+    self.years = pd.Index(years, name='year')
+    self.index = pd.Index(index)
+
+  @classmethod
+  def from_workbook(
+    cls, wb: BeaWorkbook, years: [List[str], None] = None
+  ) -> 'IOPanel':
+    """Stack the tables of a BEA workbook.
+
+    The industries are those that appear as both a row and a column in every
+    year (i.e. value added and totals are dropped). Missing values are zero.
+
+    Args:
+        wb (BeaWorkbook): Workbook of direct requirements tables.
+        years (list, None, optional): Years to use. Defaults to all.
+
+    Returns:
+        IOPanel: The panel.
+    """
+    years = wb.years if years is None else [str(yy) for yy in years]
+    tables = [wb.table(yy) for yy in years]
+
+    index = tables[0].columns
+    for T in tables:
+      index = index[index.isin(T.index) & index.isin(T.columns)]
+
+    A = np.stack([
+      T.reindex(index=index, columns=index).fillna(0.).values
+      for T in tables
+    ])
+    return cls(A, years, index)
+
+  def engine(self, year: [str, int], **kwds) -> ExposureEngine:
+    """`ExposureEngine` for a single year."""
+    return ExposureEngine(
+      pd.DataFrame(
+        self.A[self.years.get_loc(str(year))],
+        index=self.index,
+        columns=self.index
+      ), **kwds
+    )
+
+  def exposure(
+    self,
+    inds: List[str],
+    inputsOnly: bool = True,
+    mxR: int = 10,
+    toKeep: list = [1, 2, 5, 10, 'Infinite']
+  ) -> pd.DataFrame:
+    """Requirements of every industry for the industries in `inds`, in
+    every year.
+
+    See `ExposureEngine.exposure`.
+
+    Returns:
+        pd.DataFrame: (year, order) x industries. E.g.
+          `.xs('Infinite', level='order')` is years x industries.
+    """
+    _check_orders(toKeep, mxR)
+
+    pos = self.index.get_indexer(inds)
+    if (pos < 0).any():
+      raise KeyError(
+        'Not in the IO table: {}'.format(list(np.asarray(inds)[pos < 0]))
+      )
+
+    nY, n = len(self.years), len(self.index)
+    e = np.zeros(n)
+    np.add.at(e, pos, 1.)
+
+    out = np.empty((nY, len(toKeep), n))
+
+    keep = [kk for kk in toKeep if kk != 'Infinite']
+    if keep:
+      # (years x 1 x n) rows propagated through each year's matrix.
+      vk = np.broadcast_to(e, (nY, 1, n))
+      total = np.zeros((nY, 1, n)) if inputsOnly else vk.copy()
+      for kk in range(1, max(keep) + 1):
+        vk = vk @ self.A
+        total = total + vk
+        for jj in [jj for jj, o in enumerate(toKeep) if o == kk]:
+          out[:, jj] = total[:, 0]
+
+    if 'Infinite' in toKeep:
+      II = np.eye(n)[None, :, :]
+      B = np.broadcast_to(e[:, None], (nY, n, 1))
+      x = np.linalg.solve(np.swapaxes(II - self.A, 1, 2), B)
+      out[:, toKeep.index('Infinite')] = x[:, :, 0]
+
+    return pd.DataFrame(
+      out.reshape(-1, n),
+      index=pd.MultiIndex.from_product(
+        [self.years, toKeep], names=['year', 'order']
+      ),
+      columns=self.index
+    )
@@ -0,0 +1,190 @@
+"""Indexes and materialized aggregates for the SQLite copy of an extract.
+
+An aggregate is a table of `SUM(...)`s and a row count of the 'main' table
+grouped by a set of key columns. `rewrite_query` recognises simple
+`SELECT ... FROM main GROUP BY ...` queries that can be answered by rolling
+up one of these tables and rewrites them to do so.
+"""
+import json, re, sqlite3
+from typing import Dict, List, Tuple, Union
+
+# (name, columns) of indexes created on 'main' after an ingest. The first
+# covers the weighted counts by industry and geography used in the scripts.
+DEFAULT_INDEXES = [
+  ('ix_main_ind_geo', ['indnaics', 'puma', 'statefip', 'perwt']),
+  ('ix_main_geo', ['statefip', 'puma']),
+]
+
+# (keys, summed columns) of aggregates maintained after an ingest.
+DEFAULT_AGGREGATES = [
+  (['indnaics', 'puma', 'statefip'], ['perwt']),
+]
+
+AGGREGATES_TABLE = 'aggregates'
+
+QUERY = re.compile(
+  r'^select (?P<select>.+?) from main group by (?P<group>[\w\s,]+)$',
+  re.IGNORECASE
+)
+KEY_ITEM = re.compile(r'^(\w+)(\s+as\s+\w+)?$', re.IGNORECASE)
+SUM_ITEM = re.compile(
+  r'^sum\((\w+)\)((?:\s*[\*/]\s*[\d\.]+)?(?:\s+as\s+\w+)?)$', re.IGNORECASE
+)
+COUNT_ITEM = re.compile(r'^count\(\*\)((?:\s+as\s+\w+)?)$', re.IGNORECASE)
+
+
+def aggregate_name(keys: List[str]) -> str:
+  return 'agg_' + '_'.join(keys)
+
+
+def create_indexes(
+  db: sqlite3.Connection,
+  indexes: List[Tuple[str, List[str]]] = DEFAULT_INDEXES
+) -> None:
+  """Create indexes on 'main' (skipping any on columns it does not have).
+
+  Args:
+      db (sqlite3.Connection): Database holding the 'main' table.
+      indexes (list, optional): (name, columns) of each index.
+  """
+  cols = {row[1] for row in db.execute('PRAGMA table_info(main);')}
+
+  for name, columns in indexes:
+    if not set(columns) <= cols:
+      continue
+    db.execute(
+      'CREATE INDEX IF NOT EXISTS {} ON main ({});'.format(
+        name, ', '.join(columns)
+      )
+    )
+
+  db.execute('ANALYZE main;')
+  db.commit()
+
+
+def get_aggregates(db: sqlite3.Connection) -> Dict[str, Tuple[list, list]]:
+  """Aggregates declared in the database (read only).
+
+  Returns:
+      dict: name -> (keys, summed columns). Empty if none were ever declared.
+  """
+  exists = db.execute(
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;",
+    (AGGREGATES_TABLE,)
+  ).fetchone()
+  if exists is None:
+    return {}
+
+  return {
+    name: (json.loads(keys), json.loads(sums))
+    for name, keys, sums in db.execute(
+      'SELECT name, keys, sums FROM {};'.format(AGGREGATES_TABLE)
+    )
+  }
+
+
+def build_aggregate(
+  db: sqlite3.Connection, keys: List[str], sums: List[str]
+) -> str:
+  """(Re)build an aggregate table and record it in the database.
+
+  Args:
+      db (sqlite3.Connection): Database holding the 'main' table.
+      keys (list): Columns to group by.
+      sums (list): Columns to sum.
+
+  Returns:
+      str: Name of the aggregate table.
+  """
+  name = aggregate_name(keys)
+  db.execute(
+    'CREATE TABLE IF NOT EXISTS {} '
+    '(name TEXT PRIMARY KEY, keys TEXT, sums TEXT);'.format(AGGREGATES_TABLE)
+  )
+
+  db.execute('DROP TABLE IF EXISTS {};'.format(name))
+  db.execute(
+    'CREATE TABLE {name} AS SELECT {keys}, {sums}, COUNT(*) AS n '
+    'FROM main GROUP BY {keys};'.format(
+      name=name,
+      keys=', '.join(keys),
+      sums=', '.join('SUM({0}) AS sum_{0}'.format(col) for col in sums)
+    )
+  )
+  db.execute(
+    'INSERT OR REPLACE INTO {} VALUES (?, ?, ?);'.format(AGGREGATES_TABLE),
+    (name, json.dumps(keys), json.dumps(sums))
+  )
+  db.commit()
+
+  return name
+
+
+def _keep_name(new: str, item: str) -> str:
+  # Unaliased items are named after their expression in the result.
+  if re.search(r'\s+as\s+\w+$', item, re.IGNORECASE):
+    return new
+  return '{} AS "{}"'.format(new, item)
+
+
+def rewrite_query(script: str, aggregates: Dict[str, Tuple[list, list]]
+                  ) -> Union[str, None]:
+  """Rewrite a query against 'main' to use an aggregate table.
+
+  Only queries of the form
+
+    SELECT <keys and SUM(col)/COUNT(*) items> FROM main GROUP BY <keys>
+
+  are rewritten, and only if an aggregate has all of the group keys and
+  summed columns. SUM items may be scaled by a constant and aliased (e.g.
+  `SUM(perwt) * 0.01 as count`).
+
+  Args:
+      script (str): SQL query.
+      aggregates (dict): See `get_aggregates`.
+
+  Returns:
+      str, None: Rewritten query, or None if no aggregate applies.
+  """
+  m = QUERY.match(' '.join(script.split()).rstrip('; '))
+  if m is None:
+    return None
+
+  group = [key.strip() for key in m.group('group').split(',')]
+
+  items, summed = [], set()
+  for item in m.group('select').split(','):
+    item = item.strip()
+
+    f = KEY_ITEM.match(item)
+    if f is not None:
+      if f.group(1) not in group:
+        return None
+      items.append(item)
+      continue
+
+    f = SUM_ITEM.match(item)
+    if f is not None:
+      summed.add(f.group(1))
+      items.append(
+        _keep_name('SUM(sum_{}){}'.format(f.group(1), f.group(2)), item)
+      )
+      continue
+
+    f = COUNT_ITEM.match(item)
+    if f is not None:
+      items.append(_keep_name('SUM(n){}'.format(f.group(1)), item))
+      continue
+
+    return None
+
+  # Prefer the aggregate with the fewest keys (i.e. the fewest rows).
+  for name, (keys, sums) in sorted(
+    aggregates.items(), key=lambda d: len(d[1][0])
+  ):
+    if set(group) <= set(keys) and summed <= set(sums):
+      return 'SELECT {} FROM {} GROUP BY {};'.format(
+        ', '.join(items), name, ', '.join(group)
+      )
+
+  return None
@@ -0,0 +1,252 @@
+"""Columnar (Parquet) cache of parsed extracts.
+
+The cache lives in `<cache_dir>/<namespace>/<key>/`, where the namespace
+names the extract file (so that extracts can share a `cache_dir`), the key
+combines the hash of the extract file with the schema parsed from the `.do`
+file, and the dataset is
+partitioned on disk (by default by `statefip`) so that reads can skip whole
+partitions as well as unused columns.
+"""
+import hashlib, json, os, shutil
+import pandas as pd
+from typing import Iterator, List, Tuple
+
+from .utils import file_digest
+
+DIGESTS_FILE = 'digests.json'
+COMPLETE_FILE = '_COMPLETE'
+
+
+class ColumnarCache(object):
+  """Partitioned Parquet copy of an `IpumsExtract`.
+
+  Requires `pyarrow`.
+
+  Attributes:
+      extract (IpumsExtract): Extract being cached.
+      cache_dir (str): Root directory for cached extracts.
+      partition_cols (list): Columns (of the extract) to partition the
+        files by.
+  """
+
+  def __init__(
+    self,
+    extract,
+    cache_dir: [str, None] = None,
+    partition_cols: List[str] = ['statefip']
+  ):
+    """
+    Args:
+        extract (IpumsExtract): Extract to cache.
+        cache_dir (str, None, optional): Root directory for cached extracts.
+          Defaults to '<extract name>_parquet' next to the extract.
+        partition_cols (list, optional): Columns to partition the files by.
+    """
+    self.extract = extract
+    if cache_dir is None:
+      cache_dir = os.path.join(
+        os.path.dirname(extract.filename),
+        os.path.basename(extract.filename).split('.')[0] + '_parquet'
+      )
+    self.cache_dir = cache_dir
+    self._partition_cols = partition_cols
+
+  @property
+  def partition_cols(self) -> List[str]:
+    # Looked up lazily so as not to load the extract's schema.
+    return [col for col in self._partition_cols if col in self.extract.names]
+
+  def digest(self) -> str:
+    """Hash of the extract file.
+
+    Digests are remembered (by file size and mtime) in the cache directory so
+    that a multi-GB extract is only hashed once.
+
+    Returns:
+        str: Hex digest of the extract.
+    """
+    fn = os.path.abspath(self.extract.filename)
+    st = os.stat(fn)
+    digests_file = os.path.join(self.cache_dir, DIGESTS_FILE)
+
+    digests = {}
+    if os.path.exists(digests_file):
+      with open(digests_file) as f:
+        digests = json.load(f)
+
+    size, mtime, digest = digests.get(fn, (None, None, None))
+    if (size, mtime) != (st.st_size, st.st_mtime):
+      digest = file_digest(fn)
+      digests[fn] = (st.st_size, st.st_mtime, digest)
+      os.makedirs(self.cache_dir, exist_ok=True)
+      with open(digests_file, 'w') as f:
+        json.dump(digests, f)
+
+    return digest
+
+  def key(self) -> str:
+    """Cache key: the extract's digest plus its parsed schema.
+
+    Returns:
+        str: Hex digest.
+    """
+    schema = [
+      (name, start, stop, str(self.extract.dtypes[name]))
+      for name, (start, stop) in zip(self.extract.names, self.extract.columns)
+    ]
+
+    h = hashlib.sha1(self.digest().encode())
+    h.update(json.dumps([schema, self.partition_cols]).encode())
+    return h.hexdigest()
+
+  @property
+  def namespace(self) -> str:
+    """Directory (in `cache_dir`) of the cached versions of the extract:
+    its base name and a hash of its path."""
+    fn = os.path.abspath(self.extract.filename)
+    return '{}-{}'.format(
+      os.path.basename(fn).split('.')[0],
+      hashlib.sha1(fn.encode()).hexdigest()[:8]
+    )
+
+  @property
+  def path(self) -> str:
+    return os.path.join(self.cache_dir, self.namespace, self.key())
+
+  def exists(self) -> bool:
+    return os.path.exists(os.path.join(self.path, COMPLETE_FILE))
+
+  def build(
+    self, chunksize: int = 500000, verbose: bool = True, **kwds
+  ) -> str:
+    """Parse the extract and write it to the cache.
+
+    Any other cached versions of the extract are removed (other extracts
+    sharing `cache_dir` are left alone).
+
+    Args:
+        chunksize (int, optional): Records parsed at a time.
+        verbose (bool, optional): Report progress with tqdm.
+        **kwds: Passed to `IpumsExtract.read`.
+
+    Returns:
+        str: Path to the cached dataset.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from tqdm import tqdm
+
+    path = self.path
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    chunks = self.extract.read(chunksize=chunksize, **kwds)
+    chunks = iter(tqdm(chunks) if verbose else chunks)
+
+    first = next(chunks, None)
+    if first is None:
+      first = self.extract.read(nrows=0, **kwds)
+
+    schema = pa.Schema.from_pandas(first, preserve_index=False)
+
+    def batches():
+      yield from pa.Table.from_pandas(
+        first, schema=schema, preserve_index=False
+      ).to_batches()
+      for chunk in chunks:
+        yield from pa.Table.from_pandas(
+          chunk, schema=schema, preserve_index=False
+        ).to_batches()
+
+    ds.write_dataset(
+      batches(),
+      tmp,
+      schema=schema,
+      format='parquet',
+      partitioning=ds.partitioning(
+        pa.schema([schema.field(col) for col in self.partition_cols]),
+        flavor='hive'
+      ) if self.partition_cols else None,
+      max_partitions=4096
+    )
+    open(os.path.join(tmp, COMPLETE_FILE), 'w').close()
+
+    # Keep only the current version of the extract.
+    versions = os.path.dirname(path)
+    for name in os.listdir(versions):
+      old = os.path.join(versions, name)
+      if os.path.isdir(old) and old != tmp:
+        shutil.rmtree(old)
+
+    os.rename(tmp, path)
+    return path
+
+  def read(
+    self,
+    columns: [List[str], None] = None,
+    filters: [List[Tuple], None] = None
+  ) -> pd.DataFrame:
+    """Read (a subset of) the cached extract, building the cache if needed.
+
+    Args:
+        columns (list, None, optional): Columns to read. Defaults to all.
+        filters (list, None, optional): Row filters in the `pyarrow.parquet`
+          format, e.g. `[('statefip', 'in', [17, 18])]`. Filters on partition
+          columns skip whole files.
+
+    Returns:
+        pd.DataFrame: Frame with the dtypes of `IpumsExtract.dtypes`.
+    """
+    import pyarrow.parquet as pq
+
+    if not self.exists():
+      self.build()
+
+    df = pq.read_table(
+      self.path,
+      columns=columns,
+      filters=filters,
+      partitioning='hive' if self.partition_cols else None
+    ).to_pandas()
+
+    # Partition columns come back as categories.
+    return self.extract.applySchema(df)
+
+  def read_chunks(
+    self,
+    chunksize: int,
+    columns: [List[str], None] = None,
+    filters: [List[Tuple], None] = None
+  ) -> Iterator[pd.DataFrame]:
+    """Stream (a subset of) the cached extract, building the cache if needed.
+
+    Args:
+        chunksize (int): Maximum number of rows per chunk (chunks may be
+          smaller, e.g. at the end of each file).
+        columns (list, None, optional): See `read`.
+        filters (list, None, optional): See `read`.
+
+    Yields:
+        pd.DataFrame: Frames with the dtypes of `IpumsExtract.dtypes`.
+    """
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    if not self.exists():
+      self.build()
+
+    dataset = ds.dataset(
+      self.path,
+      format='parquet',
+      partitioning='hive' if self.partition_cols else None,
+      exclude_invalid_files=True
+    )
+    batches = dataset.to_batches(
+      columns=columns,
+      filter=None if filters is None else pq.filters_to_expression(filters),
+      batch_size=chunksize
+    )
+
+    for batch in batches:
+      if batch.num_rows:
+        yield self.extract.applySchema(batch.to_pandas())
@@ -0,0 +1,148 @@
+"""Fixed categories of the labelled variables of an extract.
+
+Every labelled variable (value labels in the `.do` file or a recode in
+`getRecodes`) has a single `pd.CategoricalDtype`, compiled once and shared by
+every chunk, so chunks concatenate as categoricals without re-encoding and
+hold one small integer code per value. In the database the codes are stored
+as integers (NULL if missing), with the labels in a lookup table.
+"""
+import sqlite3
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+from .recoder import Recoder, compileRecodes
+
+LOOKUP_TABLE = 'categories'
+
+
+class CategoryRegistry(object):
+  """Recoders (and so categories) of the labelled variables.
+
+  Attributes:
+      levels (dict): Variable -> code -> label, from the `.do` file. Shared
+        with the extract, so variables dropped from it (e.g. 'age' with
+        `ageToInt`) are no longer converted.
+      recodeDict (dict): Source variable -> new variable -> mapping (see
+        `getRecodes`).
+  """
+
+  def __init__(self, levels: dict, recodeDict: dict):
+    self.levels = levels
+    self.recodeDict = recodeDict
+
+    self._recoders = None
+    self._levelRecoders = {}
+
+  @property
+  def recoders(self) -> Dict[str, Dict[str, Recoder]]:
+    """Source variable -> new variable -> `Recoder` (see `compileRecodes`)."""
+    if self._recoders is None:
+      self._recoders = compileRecodes(self.recodeDict)
+    return self._recoders
+
+  def levelRecoder(self, var: str) -> Recoder:
+    """`Recoder` of the value labels of `var`. Unlabelled codes are kept
+    (see `Recoder`)."""
+    if var not in self._levelRecoders:
+      self._levelRecoders[var] = Recoder(
+        self.levels[var], ordered=False, keepUnmapped=True
+      )
+    return self._levelRecoders[var]
+
+  @property
+  def dtypes(self) -> Dict[str, pd.CategoricalDtype]:
+    """Variable -> categories. Recodes take precedence over value labels."""
+    out = {var: self.levelRecoder(var).dtype for var in self.levels}
+    for rc in self.recoders.values():
+      out.update({rvar: recoder.dtype for rvar, recoder in rc.items()})
+    return out
+
+
+def encode(df: pd.DataFrame) -> pd.DataFrame:
+  """Replace categorical columns by their (nullable integer) codes."""
+  out = df.copy(deep=False)
+  for col in df.columns:
+    if isinstance(df[col].dtype, pd.CategoricalDtype):
+      codes = df[col].cat.codes.values
+      out[col] = pd.arrays.IntegerArray(codes, mask=codes < 0)
+  return out
+
+
+def decode(
+  df: pd.DataFrame, dtypes: Dict[str, pd.CategoricalDtype]
+) -> pd.DataFrame:
+  """Inverse of `encode` for the columns of `df` in `dtypes`."""
+  for col in df.columns:
+    if col not in dtypes or isinstance(df[col].dtype, pd.CategoricalDtype):
+      continue
+    codes = pd.to_numeric(df[col]).fillna(-1).values.astype(np.int64)
+    df[col] = pd.Categorical.from_codes(codes, dtype=dtypes[col])
+  return df
+
+
+def lookup_table(df: pd.DataFrame) -> pd.DataFrame:
+  """(variable, code, label, ordered) of the categorical columns of `df`."""
+  parts = [
+    pd.DataFrame({
+      'variable': col,
+      'code': np.arange(len(df[col].cat.categories)),
+      'label': [str(cat) for cat in df[col].cat.categories],
+      'ordered': int(df[col].cat.ordered)
+    }) for col in df.columns
+    if isinstance(df[col].dtype, pd.CategoricalDtype)
+  ]
+  if not parts:
+    return pd.DataFrame(columns=['variable', 'code', 'label', 'ordered'])
+  return pd.concat(parts, ignore_index=True)
+
+
+def write_lookup(db: sqlite3.Connection, df: pd.DataFrame) -> None:
+  """Record the categories of the categorical columns of `df` (e.g. an empty
+  frame with the schema of 'main') in the lookup table."""
+  db.execute(
+    'CREATE TABLE IF NOT EXISTS {} (variable TEXT, code INTEGER, '
+    'label TEXT, ordered INTEGER, PRIMARY KEY (variable, code));'.format(
+      LOOKUP_TABLE
+    )
+  )
+
+  lut = lookup_table(df)
+  for var in lut['variable'].unique():
+    db.execute(
+      'DELETE FROM {} WHERE variable = ?;'.format(LOOKUP_TABLE), (var, )
+    )
+  db.executemany(
+    'INSERT INTO {} VALUES (?, ?, ?, ?);'.format(LOOKUP_TABLE),
+    lut.astype(object).values.tolist()
+  )
+  db.commit()
+
+
+def read_lookup(
+  db: sqlite3.Connection,
+  known: [Dict[str, pd.CategoricalDtype], None] = None
+) -> Dict[str, pd.CategoricalDtype]:
+  """Categories of the variables stored as codes.
+
+  Args:
+      db (sqlite3.Connection): Database with the lookup table.
+      known (dict, None, optional): Categories to use where their labels
+        match the stored ones (the stored labels are text).
+
+  Returns:
+      dict: Variable -> categories.
+  """
+  lut = pd.read_sql(
+    'SELECT variable, code, label, ordered FROM {} '
+    'ORDER BY variable, code;'.format(LOOKUP_TABLE), db
+  )
+
+  out = {}
+  for var, grp in lut.groupby('variable', sort=False):
+    labels = grp['label'].tolist()
+    dtype = (known or {}).get(var)
+    if dtype is None or [str(c) for c in dtype.categories] != labels:
+      dtype = pd.CategoricalDtype(labels, ordered=bool(grp['ordered'].iat[0]))
+    out[var] = dtype
+  return out
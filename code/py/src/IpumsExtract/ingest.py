@@ -0,0 +1,208 @@
+"""Parallel ingest of fixed-width extracts into SQLite.
+
+The main process splits the (decompressed) extract into blocks of whole
+records, a process pool parses each block into a frame and a single writer
+thread inserts the rows with `executemany` inside large transactions.
+"""
+import collections, itertools, os, queue, sqlite3, threading
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+from .categories import encode, write_lookup
+from .parser import FixedWidthParser
+
+# Applied to the writer's connection for the duration of the load. (The
+# page size is left alone: it cannot change once the database has tables or
+# is in WAL mode.)
+LOAD_PRAGMAS = [
+  'PRAGMA journal_mode = WAL;',
+  'PRAGMA synchronous = OFF;',
+  'PRAGMA temp_store = MEMORY;',
+  'PRAGMA cache_size = -262144;',
+]
+
+# Set once per worker process by `_init_worker`.
+_worker = {}
+
+
+def _init_worker(
+  extract, reclen: int, toCategories: bool, recodes: bool
+) -> None:
+  parser = FixedWidthParser(extract.names, extract.columns, extract.dtypes)
+  parser.reclen = reclen
+
+  _worker.update(
+    extract=extract,
+    parser=parser,
+    toCategories=toCategories,
+    recodes=recodes
+  )
+
+
+def _parse_block(start: int, block: bytes) -> tuple:
+  """Parse one block in a worker process.
+
+  Args:
+      start (int): Row number of the first record in the block.
+      block (bytes): Whole records.
+
+  Returns:
+      tuple: (empty frame with the output schema, list of row tuples).
+        Categorical columns are written as their codes (see
+        `categories.encode`).
+  """
+  extract = _worker['extract']
+  df = _worker['parser'].parse(block)
+  df.index = pd.RangeIndex(start, start + len(df))
+
+  if _worker['recodes']:
+    df = extract.recodes(df)
+
+  if _worker['toCategories']:
+    df = extract.convertToCategories(df)
+
+  df = df.reset_index()
+  codes = encode(df)
+
+  # sqlite3 only binds python scalars (and None), which `Series.tolist`
+  # returns.
+  cols = [
+    codes[col].astype(object).where(df[col].notna(), None).tolist()
+    if isinstance(df[col].dtype, pd.CategoricalDtype) else
+    codes[col].astype(object).tolist() for col in df.columns
+  ]
+
+  return df.head(0), list(zip(*cols))
+
+
+def _write(
+  db_filename: str, results: queue.Queue, pbar, errors: list,
+  commit_every: int
+) -> None:
+  """Writer thread: insert parsed blocks as they arrive on `results`."""
+  db = sqlite3.connect(db_filename)
+  try:
+    for pragma in LOAD_PRAGMAS:
+      db.execute(pragma)
+
+    insert = None
+    pending = 0
+    while True:
+      item = results.get()
+      if item is None:
+        break
+      if errors:
+        # Keep draining so that the reader never blocks.
+        continue
+
+      schema, rows = item
+      try:
+        if insert is None:
+          write_lookup(db, schema)
+          encode(schema).to_sql('main', db, if_exists='append', index=False)
+          insert = 'INSERT INTO main VALUES ({})'.format(
+            ', '.join('?' * len(schema.columns))
+          )
+
+        db.executemany(insert, rows)
+        pending += 1
+        if pending >= commit_every:
+          db.commit()
+          pending = 0
+
+        pbar.update(len(rows))
+      except Exception as e:
+        errors.append(e)
+
+    db.commit()
+    db.execute('PRAGMA synchronous = NORMAL;')
+    # WAL mode persists in the file, and would leave readers needing write
+    # access to the directory (for the -wal/-shm files).
+    db.execute('PRAGMA journal_mode = DELETE;')
+  finally:
+    db.close()
+
+
+def parallel_to_sql(
+  extract,
+  processes: [int, None] = None,
+  chunksize: int = 100000,
+  toCategories: bool = False,
+  recodes: bool = False,
+  verbose: bool = True,
+  compression: [str, None] = 'infer',
+  commit_every: int = 20
+) -> int:
+  """Load an extract into the 'main' table of `extract.db_filename`.
+
+  Rows get the same 'index' column as the serial `IpumsExtract.to_sql`.
+
+  Args:
+      extract (IpumsExtract): Extract to load. Its 'main' table should
+        already have been dropped if it is to be replaced.
+      processes (int, None, optional): Number of parser processes (defaults
+        to the number of CPUs).
+      chunksize (int, optional): Records per block.
+      toCategories (bool, optional): Apply `convertToCategories` to each
+        block.
+      recodes (bool, optional): Apply `recodes` to each block.
+      verbose (bool, optional): Report progress with tqdm.
+      compression (str, None, optional): See `FixedWidthParser.open`.
+      commit_every (int, optional): Blocks inserted per transaction.
+
+  Returns:
+      int: Number of rows inserted.
+  """
+  parser = FixedWidthParser(extract.names, extract.columns, extract.dtypes)
+
+  results = queue.Queue(maxsize=4)
+  errors = []
+  pbar = tqdm(unit='rows', disable=not verbose)
+  writer = threading.Thread(
+    target=_write,
+    args=(extract.db_filename, results, pbar, errors, commit_every)
+  )
+
+  with parser.open(extract.filename, compression) as file:
+    blocks = parser.iter_blocks(file, rows=chunksize)
+
+    # Read the first block so that the record length is known before the
+    # workers start.
+    first = next(blocks, None)
+    nrows = 0
+    if first is None:
+      pbar.close()
+      return nrows
+
+    writer.start()
+    try:
+      with ProcessPoolExecutor(
+        processes,
+        initializer=_init_worker,
+        initargs=(extract, parser.reclen, toCategories, recodes)
+      ) as pool:
+        window = 2 * (processes or os.cpu_count() or 1)
+        pending = collections.deque()
+
+        for block in itertools.chain([first], blocks):
+          if errors:
+            break
+
+          pending.append(pool.submit(_parse_block, nrows, block))
+          nrows += len(block) // parser.reclen
+
+          if len(pending) >= window:
+            results.put(pending.popleft().result())
+
+        while pending:
+          results.put(pending.popleft().result())
+    finally:
+      results.put(None)
+      writer.join()
+      pbar.close()
+
+  if errors:
+    raise errors[0]
+
+  return nrows
@@ -3,23 +3,99 @@ import pandas as pd
 import numpy as np
 from warnings import warn
 from tqdm import tqdm
-
+from typing import Iterator
+
+from ..Profiling import instrumented
+from .aggregates import (
+  AGGREGATES_TABLE, DEFAULT_AGGREGATES, build_aggregate, create_indexes,
+  get_aggregates, rewrite_query
+)
+from .cache import ColumnarCache
+from .categories import (
+  LOOKUP_TABLE, CategoryRegistry, decode, encode, read_lookup, write_lookup
+)
+from .ingest import parallel_to_sql
+from .parser import FixedWidthParser, compact_dtype
 from .recodes import getRecodes
-from .utils import OrderedSet
+from .replicates import estimate
+from .stream import aggregate
+from .schema import (
+  SCHEMA_FIELDS, default_schema_file, read_schema, write_schema
+)
+
+ENGINES = ('numpy', 'pandas')
+
+
+# Files read by the instrumented methods (see `src.Profiling`).
+def _raw(self) -> str:
+  return self.filename
+
+
+def _db(self) -> str:
+  return self.db_filename
+
+
+def _schemaProperty(field: str) -> property:
+  # Attributes parsed from the `.do` file are only loaded when first used.
+  def get(self):
+    if self._schema is None:
+      self.loadSchema()
+    return self._schema[field]
+
+  def set(self, value):
+    if self._schema is None:
+      self.loadSchema()
+    self._schema[field] = value
+
+  return property(get, set)
 
 
 class IpumsExtract(object):
+  names = _schemaProperty('names')
+  columns = _schemaProperty('columns')
+  labels = _schemaProperty('labels')
+  levels = _schemaProperty('levels')
+  dtypes = _schemaProperty('dtypes')
+  stataTypes = _schemaProperty('stataTypes')
+
   def __init__(
-    self, filename: str, doFile: str, db_filename: [str, None] = None
+    self,
+    filename: str,
+    doFile: str,
+    db_filename: [str, None] = None,
+    engine: str = 'numpy',
+    cache_dir: [str, None] = None,
+    schemaFile: [str, None] = None
   ):
+    """
+    Args:
+        filename (str): Path to the fixed-width extract (`.dat` or `.dat.gz`).
+        doFile (str): Path to the Stata `.do` file describing the extract.
+        db_filename (str, None, optional): Path to a SQLite database.
+        engine (str, optional): Parser used to read the extract. 'numpy'
+          slices raw byte blocks with `FixedWidthParser`; 'pandas' uses
+          `pd.read_fwf`.
+        cache_dir (str, None, optional): Root directory of the columnar
+          (Parquet) cache used by `load(columns=..., filters=...)`. See
+          `ColumnarCache`.
+        schemaFile (str, None, optional): Where to cache the schema parsed
+          from `doFile`. Defaults to '<doFile name>_schema.pkl' next to it.
+    """
+    if engine not in ENGINES:
+      raise ValueError(
+        'engine must be one of {}, not {!r}'.format(ENGINES, engine)
+      )
+
     self.filename = filename
     self.doFile = doFile
+    self.engine = engine
+    self.schemaFile = schemaFile or default_schema_file(doFile)
+
+    # Loaded on first use. See `loadSchema`.
+    self._schema = None
 
-    self.columns = []
-    self.names = []
-    self.labels = {}
-    self.levels = {}
-    self.dtypes = {}
+    # Built on first use by `recodes`/`convertToCategories`.
+    self._categories = None
 
     if db_filename is not None:
       self.db_filename = db_filename
@@ -29,7 +105,29 @@ class IpumsExtract(object):
       if 'main' in self.db_tables:
         self.db_loaded = True
 
-    self.parseDoFile()
+    self.cache = ColumnarCache(self, cache_dir)
+
+  def __getstate__(self) -> dict:
+    # The database connection cannot be pickled (e.g. to send the extract to
+    # worker processes).
+    state = self.__dict__.copy()
+    state.pop('db', None)
+    return state
+
+  def loadSchema(self) -> dict:
+    """Load the schema from its cache, parsing the `.do` file if the cache
+    is missing or stale.
+
+    Returns:
+        dict: The schema (see `schema.SCHEMA_FIELDS`).
+    """
+    self._schema = read_schema(self.doFile, self.schemaFile)
+
+    if self._schema is None:
+      self.parseDoFile()
+      write_schema(self.doFile, self.schemaFile, self._schema)
+
+    return self._schema
 
   def parseDoFile(self) -> None:
 
@@ -43,15 +141,21 @@ class IpumsExtract(object):
       r'(label define)(\s)([\w\_]+)(\s)([\w\d]+)(\s)(\`\")((?![\"\']).*)(\"\')((\,\sadd)?)(\n)'
     )
 
+    self._schema = {field: {} for field in SCHEMA_FIELDS}
+    self._schema['names'] = []
+    self._schema['columns'] = []
+
     with open(self.doFile) as file:
       for line in file:
 
         # If it defines a variable
         f = varDef.match(line)
         if f is not None:
-          self.names.append(f.group(4))
-          self.dtypes[f.group(4)] = str
-          self.columns.append((int(f.group(6)) - 1, int(f.group(8))))
+          name, start, stop = f.group(4), int(f.group(6)) - 1, int(f.group(8))
+          self.names.append(name)
+          self.stataTypes[name] = f.group(2)
+          self.dtypes[name] = compact_dtype(f.group(2), stop - start)
+          self.columns.append((start, stop))
 
         # If it defines a label
         f = labelDef.match(line)
@@ -65,30 +169,90 @@ class IpumsExtract(object):
           if var not in self.levels.keys():
             self.levels[var] = {}
           self.levels[var][int(f.group(5))] = f.group(8)
-          self.dtypes[var] = str
 
     return None
 
-  def convertToCategories(self, df: pd.DataFrame) -> pd.DataFrame:
-    df.replace(self.levels, inplace=True)
+  @instrumented(_raw)
+  def read(self, **kwds) -> [pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Read the raw extract with the selected engine.
+
+    Args:
+        **kwds: Passed to `pd.read_fwf` (engine 'pandas') or
+          `FixedWidthParser.read` (engine 'numpy'; only `compression`,
+          `chunksize` and `nrows` are used).
+
+    Returns:
+        pd.DataFrame, Iterator[pd.DataFrame]: Frame, or iterator of frames if
+          `chunksize` is given.
+    """
+    if self.engine == 'pandas':
+      df = pd.read_fwf(
+        self.filename, names=self.names, colspecs=self.columns, **kwds
+      )
+      if 'chunksize' in kwds.keys():
+        return (self.applySchema(chunk) for chunk in df)
+      return self.applySchema(df)
+
+    ignored = set(kwds) - {'compression', 'chunksize', 'nrows'}
+    if ignored:
+      warn(
+        'Ignoring arguments not supported by the numpy engine: {}'.format(
+          sorted(ignored)
+        )
+      )
+
+    parser = FixedWidthParser(self.names, self.columns, self.dtypes)
+    return parser.read(
+      self.filename,
+      compression=kwds.get('compression', 'infer'),
+      chunksize=kwds.get('chunksize'),
+      nrows=kwds.get('nrows')
+    )
+
+  def applySchema(self, df: pd.DataFrame) -> pd.DataFrame:
+    """Cast columns to the compact dtypes in `self.dtypes`.
+
+    Integer columns with missing values are left as they are.
+
+    Args:
+        df (pd.DataFrame): Frame with (some of) the extract's variables.
+
+    Returns:
+        pd.DataFrame: The same frame with downcast columns.
+    """
+    for col, dtype in self.dtypes.items():
+      if col not in df.columns or df[col].dtype == dtype:
+        continue
+      if dtype is not object and df[col].isnull().any():
+        continue
+      df[col] = df[col].astype(dtype)
+
+    return df
 
-    for col, lvl in self.levels.items():
-      df[col] = df[col].astype('category')
-      # df[col] = df[col].cat.set_categories(list(lvl.values()), ordered=False)
+  @property
+  def categories(self) -> CategoryRegistry:
+    """Fixed categories of the labelled and recoded variables, shared by
+    every chunk (and worker process) so that chunks concatenate without
+    re-encoding."""
+    if self._categories is None:
+      self._categories = CategoryRegistry(self.levels, getRecodes())
+    return self._categories
+
+  def convertToCategories(self, df: pd.DataFrame) -> pd.DataFrame:
+    for col in self.levels:
+      if col not in df.columns:
+        continue
+      df[col] = self.categories.levelRecoder(col)(df[col].values)
 
     return df
 
   def recodes(self, df: pd.DataFrame) -> pd.DataFrame:
-    recodeDict = getRecodes()
-
-    for var, rc in recodeDict.items():
+    for var, rc in self.categories.recoders.items():
       if var in df.columns:
-        for rvar, lvl in rc.items():
-          df[rvar] = df[var].copy()
-          df[rvar] = df[rvar].replace(lvl)
-          df[rvar] = df[rvar].astype('category')
-          ulvl = OrderedSet(lvl.values())
-          df[rvar] = df[rvar].cat.set_categories(ulvl, ordered=True)
+        # Values are taken before any recode that overwrites `var`.
+        values = df[var].values
+        for rvar, recoder in rc.items():
+          df[rvar] = recoder(values)
 
           # Pop if the recode has the same name
           # as a pre-existing recode. This is done
@@ -99,11 +263,18 @@ class IpumsExtract(object):
     return df
 
   def loadFull(
-    self, toCategories: bool, recodes: bool, ageToInt: bool, **kwds
+    self,
+    toCategories: bool,
+    recodes: bool,
+    ageToInt: bool,
+    columns: [list, None] = None,
+    filters: [list, None] = None,
+    **kwds
   ) -> pd.DataFrame:
-    df = pd.read_fwf(
-      self.filename, names=self.names, colspecs=self.columns, **kwds
-    )
+    if columns is None and filters is None:
+      df = self.read(**kwds)
+    else:
+      df = self.cache.read(columns=columns, filters=filters)
 
     if ageToInt:
       self.levels.pop('age', None)
@@ -117,11 +288,20 @@ class IpumsExtract(object):
     return df
 
   def loadChunk(
-    self, toCategories: bool, recodes: bool, ageToInt: bool, **kwds
+    self,
+    toCategories: bool,
+    recodes: bool,
+    ageToInt: bool,
+    columns: [list, None] = None,
+    filters: [list, None] = None,
+    **kwds
   ):
-    dfc = pd.read_fwf(
-      self.filename, names=self.names, colspecs=self.columns, **kwds
-    )
+    if columns is None and filters is None:
+      dfc = self.read(**kwds)
+    else:
+      dfc = self.cache.read_chunks(
+        kwds['chunksize'], columns=columns, filters=filters
+      )
 
     if ageToInt:
       self.levels.pop('age', None)
@@ -138,28 +318,209 @@ class IpumsExtract(object):
 
     return nextChunk
 
-  def to_sql(self, overwrite=True, chunksize=1000, verbose=True, **kwds):
+  @instrumented(_raw)
+  def to_sql(
+    self,
+    overwrite: bool = True,
+    chunksize: int = 1000,
+    verbose: bool = True,
+    processes: [int, None] = 1,
+    toCategories: bool = False,
+    recodes: bool = False,
+    index: bool = True,
+    **kwds
+  ):
+    """Load the extract into the 'main' table of the database.
+
+    Args:
+        overwrite (bool, optional): Drop an existing 'main' table first.
+        chunksize (int, optional): Records parsed/inserted at a time.
+        verbose (bool, optional): Report progress with tqdm.
+        processes (int, None, optional): If 1, parse and insert serially.
+          Otherwise parse blocks in a pool of this many processes (None for
+          one per CPU) while a single thread inserts them. See
+          `ingest.parallel_to_sql`.
+        toCategories (bool, optional): Apply `convertToCategories` first.
+        recodes (bool, optional): Apply `recodes` first. Categorical columns
+          are stored as their integer codes (NULL if missing) with the labels
+          in the `categories.LOOKUP_TABLE` table. See
+          `read_sql(categories=True)`.
+        index (bool, optional): Create indexes and (re)build the declared
+          aggregates once loaded. See `create_indexes` and
+          `refresh_aggregates`.
+        **kwds: Passed to `read` (e.g. `compression`).
+    """
 
     if overwrite:
       self.db.execute('DROP TABLE IF EXISTS main;')
+      self.db.execute('DROP TABLE IF EXISTS {};'.format(LOOKUP_TABLE))
+
+    # Aggregates are stale once 'main' changes. Their declarations are kept so
+    # that `refresh_aggregates` can rebuild them.
+    for name in get_aggregates(self.db):
+      self.db.execute('DROP TABLE IF EXISTS {};'.format(name))
+    self.db.commit()
+
+    if processes != 1:
+      parallel_to_sql(
+        self,
+        processes=processes,
+        chunksize=chunksize,
+        toCategories=toCategories,
+        recodes=recodes,
+        verbose=verbose,
+        compression=kwds.get('compression', 'infer')
+      )
+    else:
+      chunks = self.read(chunksize=chunksize, **kwds)
+
+      if verbose:
+        chunks = tqdm(chunks)
+
+      for ii, chunk in enumerate(chunks):
+        if recodes:
+          chunk = self.recodes(chunk)
 
-    chunks = pd.read_fwf(
-      self.filename,
-      names=self.names,
-      colspecs=self.columns,
-      chunksize=chunksize,
-      **kwds
-    )
+        if toCategories:
+          chunk = self.convertToCategories(chunk)
 
-    if verbose:
-      chunks = tqdm(chunks)
+        if ii == 0:
+          write_lookup(self.db, chunk)
 
-    for chunk in chunks:
-      chunk.to_sql('main', self.db, if_exists='append')
+        encode(chunk).to_sql('main', self.db, if_exists='append')
 
     self.db_loaded = True
+    self._get_db_table_names()
+
+    if index:
+      self.create_indexes()
+      self.refresh_aggregates()
+
     return None
 
+  @instrumented(_raw)
+  def aggregate(
+    self,
+    by: list,
+    weight: [str, None] = 'perwt',
+    values: [list, None] = None,
+    stats: list = ['count', 'sum'],
+    filters: [list, None] = None,
+    scale: float = 1.,
+    recodes: bool = False,
+    chunksize: int = 500000,
+    processes: [int, None] = 1,
+    verbose: bool = True,
+    **kwds
+  ) -> pd.DataFrame:
+    """Weighted counts, sums and means by group, streamed from the raw
+    extract (no database needed).
+
+    Only the variables used are parsed and each chunk is reduced to partial
+    sums before the next is read, so memory is bounded by the number of
+    groups. E.g. the industry-by-PUMA worker counts in `read_sql` form are
+
+      ie.aggregate(['indnaics', 'puma', 'statefip'], scale=0.01)
+
+    Args:
+        by (list): Columns to group by. Missing keys form their own group.
+        weight (str, None, optional): Weight column. None counts records.
+        values (list, None, optional): Columns to sum/average (weighted).
+        stats (list, optional): Any of 'count' (records, column 'n'), 'sum'
+          (of the weights, and '<x>_sum' of each value) and 'mean'
+          ('<x>_mean' of each value, ignoring missing values).
+        filters (list, None, optional): Only aggregate rows matching these
+          (column, op, value) filters, e.g. `[('age', '>=', 16)]`. See
+          `stream.apply_filters`.
+        scale (float, optional): Multiplies the weights (0.01 for the implied
+          decimals of 'perwt').
+        recodes (bool, optional): Apply `recodes` to each chunk first (to
+          group by recoded variables). Parses every variable.
+        chunksize (int, optional): Records per chunk.
+        processes (int, None, optional): If not 1, parse and reduce chunks in
+          a pool of this many processes (None for one per CPU).
+        verbose (bool, optional): Report progress with tqdm.
+        **kwds: `compression`, `nrows` and `merge_every` (partials kept
+          before merging). See `stream.aggregate`.
+
+    Returns:
+        pd.DataFrame: Statistics indexed by the (sorted) group keys.
+    """
+    return aggregate(
+      self,
+      by,
+      weight=weight,
+      values=values,
+      stats=stats,
+      filters=filters,
+      scale=scale,
+      recodes=recodes,
+      chunksize=chunksize,
+      processes=processes,
+      verbose=verbose,
+      **kwds
+    )
+
+  @instrumented(_raw)
+  def estimate(
+    self,
+    by: list,
+    weight: str = 'perwt',
+    replicates: [list, None] = None,
+    share_of: [list, None] = None,
+    filters: [list, None] = None,
+    scale: float = 1.,
+    chunksize: int = 500000,
+    processes: [int, None] = 1,
+    verbose: bool = True,
+    **kwds
+  ) -> pd.DataFrame:
+    """Weighted totals (and shares) by group with successive difference
+    replicate standard errors, streamed from the raw extract.
+
+    Every chunk is reduced with one (groups x persons) by (persons x 81)
+    sparse product of group indicators and the full and replicate weights.
+    E.g. workers by industry and PUMA, with each industry's share of its
+    PUMA, are
+
+      ie.estimate(
+        ['statefip', 'puma', 'indnaics'], share_of=['statefip', 'puma'],
+        scale=0.01
+      )
+
+    Args:
+        by (list): Columns to group by.
+        weight (str, optional): Full-sample weight.
+        replicates (list, None, optional): Replicate weights. Defaults to
+          the extract's 'repwtp<i>' variables.
+        share_of (list, None, optional): Also estimate each group's share of
+          the groups with these keys (a subset of `by`; [] for the total).
+        filters (list, None, optional): See `aggregate`.
+        scale (float, optional): Multiplies all weights (0.01 for the
+          implied decimals of IPUMS weights).
+        chunksize (int, optional): Records per chunk.
+        processes (int, None, optional): See `aggregate`.
+        verbose (bool, optional): Report progress with tqdm.
+        **kwds: See `stream.stream`.
+
+    Returns:
+        pd.DataFrame: 'total', 'total_se' (and 'share', 'share_se') indexed
+          by the (sorted) group keys.
+    """
+    return estimate(
+      self,
+      by,
+      weight=weight,
+      replicates=replicates,
+      share_of=share_of,
+      filters=filters,
+      scale=scale,
+      chunksize=chunksize,
+      processes=processes,
+      verbose=verbose,
+      **kwds
+    )
+
   def _get_db_table_names(self) -> list:
     """Get the names of the tables in the database.
 
@@ -172,22 +533,126 @@ class IpumsExtract(object):
     ]
     return self.db_tables
 
-  def read_sql(self, script: str, **kwds):
+  def create_indexes(self, indexes: [list, None] = None) -> None:
+    """Create indexes on the 'main' table.
+
+    Args:
+        indexes (list, None, optional): (name, columns) of each index.
+          Defaults to `aggregates.DEFAULT_INDEXES`.
+    """
+    if indexes is None:
+      create_indexes(self.db)
+    else:
+      create_indexes(self.db, indexes)
+
+    return None
+
+  def declare_aggregate(self, keys: list, sums: list = ['perwt']) -> str:
+    """Materialize `SUM(...)`s of 'main' grouped by `keys`.
+
+    The aggregate is recorded in the database, kept up to date by `to_sql`
+    and used by `read_sql` for matching queries.
+
+    Args:
+        keys (list): Columns to group by.
+        sums (list, optional): Columns to sum.
+
+    Returns:
+        str: Name of the aggregate table.
+    """
+    name = build_aggregate(self.db, keys, sums)
+    self._get_db_table_names()
+    return name
+
+  def refresh_aggregates(self) -> None:
+    """Rebuild all declared aggregates (or the defaults if none are)."""
+    declared = list(get_aggregates(self.db).values())
+
+    for keys, sums in declared or DEFAULT_AGGREGATES:
+      build_aggregate(self.db, keys, sums)
+
+    self._get_db_table_names()
+    return None
+
+  @instrumented(_db)
+  def read_sql(
+    self,
+    script: str,
+    useAggregates: bool = True,
+    categories: bool = False,
+    **kwds
+  ):
+    """Run a query against the database.
+
+    Args:
+        script (str): SQL query.
+        useAggregates (bool, optional): Answer `SELECT ... FROM main GROUP BY
+          ...` queries from a declared aggregate where possible. See
+          `aggregates.rewrite_query`.
+        categories (bool, optional): Convert result columns named after a
+          variable stored as codes back to categoricals (with the same
+          categories as `load`).
+        **kwds: Passed to `pd.read_sql`.
+
+    Returns:
+        pd.DataFrame: Query result.
+    """
 
     if not self.db_loaded:
       raise ValueError('The DB table(s) must be loaded in order to use it!')
 
-    return pd.read_sql(script, self.db, **kwds)
+    if useAggregates and AGGREGATES_TABLE in self.db_tables:
+      aggs = {
+        name: agg
+        for name, agg in get_aggregates(self.db).items()
+        if name in self.db_tables
+      }
+      script = rewrite_query(script, aggs) or script
+
+    df = pd.read_sql(script, self.db, **kwds)
+
+    if categories and LOOKUP_TABLE in self.db_tables:
+      df = decode(df, read_lookup(self.db, self.categories.dtypes))
 
+    return df
+
+  @instrumented(_raw)
   def load(
     self,
     toCategories: bool = True,
     recode: bool = True,
     ageToInt: bool = True,
+    columns: [list, None] = None,
+    filters: [list, None] = None,
     **kwds
   ) -> pd.DataFrame:
+    """Load the extract.
+
+    Args:
+        toCategories (bool, optional): Convert labelled variables to
+          categories.
+        recode (bool, optional): Apply the recodes in `getRecodes`.
+        ageToInt (bool, optional): Keep age as an integer.
+        columns (list, None, optional): Only load these columns.
+        filters (list, None, optional): Only load rows matching these
+          `pyarrow.parquet` filters, e.g. `[('statefip', 'in', [17, 18])]`.
+        **kwds: Passed to `read` (e.g. `chunksize`, `compression`).
+
+    Returns:
+        pd.DataFrame: The extract (or a function yielding chunks of it if
+          `chunksize` is given).
+
+    NOTE: If `columns` or `filters` is given, the data is read (or streamed,
+    with `chunksize`) from the columnar cache (`self.cache`), which is built
+    on first use.
+    """
 
     if 'chunksize' in kwds.keys():
-      return self.loadChunk(toCategories, recode, ageToInt, **kwds)
+      return self.loadChunk(
+        toCategories, recode, ageToInt, columns=columns, filters=filters,
+        **kwds
+      )
 
-    return self.loadFull(toCategories, recode, ageToInt, **kwds)
+    return self.loadFull(
+      toCategories, recode, ageToInt, columns=columns, filters=filters, **kwds
+    )
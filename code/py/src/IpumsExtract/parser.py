@@ -0,0 +1,266 @@
+"""Fixed-width parser for IPUMS extracts.
+
+Reads the extract as raw byte blocks of whole records, views each block as a
+(records x record length) array of bytes and converts every column straight
+to a NumPy dtype. This avoids the python-level fixed-width path and type
+inference in `pd.read_fwf`.
+"""
+import gzip
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Tuple
+
+# Stata storage type -> NumPy dtype.
+#
+# NOTE: IPUMS writes implied decimals (see the `replace ... / 100` lines in
+# the `.do` file), so `float` and `double` fields only ever hold digits.
+STATA_DTYPES = {
+  'byte': np.int64,
+  'int': np.int64,
+  'long': np.int64,
+  'float': np.float64,
+  'double': np.float64,
+  'str': object
+}
+
+# Widest integer each Stata type can hold.
+STATA_INT_DTYPES = {'byte': np.int8, 'int': np.int16, 'long': np.int32}
+
+DIGIT_0 = ord('0')
+DIGIT_9 = ord('9')
+
+
+def compact_dtype(stataType: str, width: int):
+  """Smallest NumPy dtype that holds a fixed-width field.
+
+  Integer types are chosen from both the declared Stata type and the number of
+  digits in the field, so e.g. a 2-digit `int` is stored as int8. Since IPUMS
+  writes implied decimals, `double` fields (weights, serials) are integers
+  and are sized by width alone.
+
+  Args:
+      stataType (str): One of `int|long|double|byte|float|str`.
+      width (int): Width of the field in characters.
+
+  Returns:
+      NumPy dtype (or `object` for strings).
+  """
+  if stataType == 'str':
+    return object
+  if stataType == 'float':
+    return np.float32
+
+  if width <= 2:
+    dtype = np.int8
+  elif width <= 4:
+    dtype = np.int16
+  elif width <= 9:
+    dtype = np.int32
+  else:
+    dtype = np.int64
+
+  if stataType in STATA_INT_DTYPES:
+    narrow = STATA_INT_DTYPES[stataType]
+    if np.dtype(narrow).itemsize < np.dtype(dtype).itemsize:
+      dtype = narrow
+
+  return dtype
+
+
+class FixedWidthParser(object):
+  """Parses fixed-width IPUMS records with NumPy byte views.
+
+  Attributes:
+      names (list): Variable names (in file order).
+      columns (list): (start, stop) byte offsets of each variable.
+      dtypes (dict): NumPy dtype for each variable.
+      blocksize (int): Approximate number of bytes read per block.
+  """
+
+  def __init__(
+    self,
+    names: List[str],
+    columns: List[Tuple[int, int]],
+    types: Dict[str, str],
+    blocksize: int = 2**24
+  ):
+    """
+    Args:
+        names (list): Variable names (in file order).
+        columns (list): (start, stop) byte offsets of each variable, as
+          produced by `IpumsExtract.parseDoFile`.
+        types (dict): Stata type (`int|long|double|byte|float|str`) or NumPy
+          dtype for each variable.
+        blocksize (int, optional): Approximate number of bytes to read per
+          block when `chunksize` is not given.
+    """
+    self.names = names
+    self.columns = columns
+    self.dtypes = {
+      name: STATA_DTYPES.get(types.get(name, 'str'), types.get(name))
+      for name in names
+    }
+    self.blocksize = blocksize
+
+  @staticmethod
+  def open(filename: str, compression: [str, None] = 'infer'):
+    """Open the extract for binary reading.
+
+    Args:
+        filename (str): Path to the extract.
+        compression (str, None, optional): 'gzip', None or 'infer' (gzip
+          if `filename` ends with '.gz').
+
+    Returns:
+        file: Binary file object.
+    """
+    if compression == 'infer':
+      compression = 'gzip' if filename.endswith('.gz') else None
+
+    if compression == 'gzip':
+      return gzip.open(filename, 'rb')
+    elif compression is None:
+      return open(filename, 'rb')
+
+    raise ValueError('Unsupported compression: {}'.format(compression))
+
+  def iter_blocks(self, file, rows: [int, None] = None,
+                  nrows: [int, None] = None) -> Iterator[bytes]:
+    """Yield blocks of whole records from an open binary file.
+
+    Args:
+        file (file): Binary file object.
+        rows (int, None, optional): Records per block. Defaults to however
+          many records fit in `self.blocksize` bytes.
+        nrows (int, None, optional): Stop after this many records.
+
+    Yields:
+        bytes: Block holding a whole number of records.
+    """
+    head = file.readline()
+    if not head:
+      return
+
+    self.reclen = len(head)
+    if rows is None:
+      rows = max(1, self.blocksize // self.reclen)
+
+    block = head + file.read(self.reclen * (rows - 1))
+    seen = 0
+    while block:
+      # The last record may lack a trailing newline.
+      if len(block) % self.reclen == self.reclen - 1:
+        block += head[-1:]
+
+      if nrows is not None and seen + len(block) // self.reclen > nrows:
+        block = block[:(nrows - seen) * self.reclen]
+
+      yield block
+
+      seen += len(block) // self.reclen
+      if nrows is not None and seen >= nrows:
+        return
+
+      block = file.read(self.reclen * rows)
+
+  def parse(self, block: bytes) -> pd.DataFrame:
+    """Parse a block of whole records.
+
+    Args:
+        block (bytes): Records, each of length `self.reclen`.
+
+    Returns:
+        pd.DataFrame: One column per variable with dtype `self.dtypes`.
+    """
+    if len(block) % self.reclen != 0:
+      raise ValueError(
+        'Block of {} bytes is not a whole number of {}-byte records.'.format(
+          len(block), self.reclen
+        )
+      )
+
+    buf = np.frombuffer(block, dtype=np.uint8).reshape(-1, self.reclen)
+
+    data = {}
+    for name, (start, stop) in zip(self.names, self.columns):
+      data[name] = self._convert(buf[:, start:stop], self.dtypes[name])
+
+    return pd.DataFrame(data, columns=self.names)
+
+  def read(
+    self,
+    filename: str,
+    compression: [str, None] = 'infer',
+    chunksize: [int, None] = None,
+    nrows: [int, None] = None
+  ) -> [pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Read an extract, mirroring the `pd.read_fwf` call signature.
+
+    Args:
+        filename (str): Path to the extract.
+        compression (str, None, optional): See `FixedWidthParser.open`.
+        chunksize (int, None, optional): If given, return an iterator of
+          frames with this many rows each.
+        nrows (int, None, optional): Number of records to read.
+
+    Returns:
+        pd.DataFrame, Iterator[pd.DataFrame]: Parsed records.
+    """
+    if chunksize is not None:
+      return self._iter_chunks(filename, compression, chunksize, nrows)
+
+    with self.open(filename, compression) as file:
+      frames = [
+        self.parse(block) for block in self.iter_blocks(file, nrows=nrows)
+      ]
+
+    if not frames:
+      return pd.DataFrame(columns=self.names)
+
+    return pd.concat(frames, ignore_index=True)
+
+  def _iter_chunks(self, filename, compression, chunksize, nrows):
+    with self.open(filename, compression) as file:
+      start = 0
+      for block in self.iter_blocks(file, rows=chunksize, nrows=nrows):
+        df = self.parse(block)
+        df.index = pd.RangeIndex(start, start + len(df))
+        start += len(df)
+        yield df
+
+  @staticmethod
+  def _convert(field: np.ndarray, dtype) -> np.ndarray:
+    """Convert an (n x width) array of ASCII bytes to `dtype`.
+
+    Args:
+        field (np.ndarray): uint8 view of one column.
+        dtype: Target NumPy dtype (or `object` for strings).
+
+    Returns:
+        np.ndarray: Converted column.
+    """
+    width = field.shape[1]
+
+    if dtype is object:
+      out = np.char.strip(np.ascontiguousarray(field).view('S%d' % width))
+      out = out.ravel().astype('U%d' % width).astype(object)
+      out[out == ''] = np.nan
+      return out
+
+    # Fast path: every byte is a digit, so accumulate one digit at a time.
+    if ((field >= DIGIT_0) & (field <= DIGIT_9)).all():
+      out = np.zeros(field.shape[0], dtype=np.int64)
+      for jj in range(width):
+        out *= 10
+        out += field[:, jj]
+        out -= DIGIT_0
+      return out.astype(dtype, copy=False)
+
+    # Slow path: signs, blanks or decimal points.
+    raw = np.ascontiguousarray(field).view('S%d' % width).ravel()
+    out = pd.to_numeric(
+      pd.Series(raw).str.decode('ascii').str.strip(), errors='coerce'
+    )
+    if np.issubdtype(np.dtype(dtype), np.integer) and out.isnull().any():
+      return out.values.astype(np.float64)
+    return out.values.astype(dtype)
@@ -0,0 +1,122 @@
+"""Precompiled recodes.
+
+Each code -> label mapping (from `getRecodes` or the `.do` file's value
+labels) is compiled once into a lookup array from (code - offset) to a
+category code, so that recoding a column is a single array gather followed by
+`pd.Categorical.from_codes`.
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict
+from warnings import warn
+
+from .utils import OrderedSet
+
+# Most unlabelled codes kept as categories of their own (see `Recoder`).
+MAX_UNMAPPED = 4096
+
+
+class Recoder(object):
+  """Maps integer codes to a fixed set of categories.
+
+  Codes without a label become missing, unless `keepUnmapped`: then codes
+  between the smallest and largest labelled codes are kept as categories of
+  their own (their raw values, after the labels), as `DataFrame.replace`
+  would keep them (up to `MAX_UNMAPPED` of them). Other codes cannot be known
+  in advance (the categories are fixed), so they still become missing, with a
+  warning.
+
+  Attributes:
+      dtype (pd.CategoricalDtype): Categories, in the order that they first
+        appear in the mapping.
+      offset (int): Smallest mapped code.
+      lut (np.ndarray): Category code of each (code - offset), -1 if the code
+        is unmapped.
+  """
+
+  def __init__(
+    self, mapping: dict, ordered: bool = False, keepUnmapped: bool = False
+  ):
+    """
+    Args:
+        mapping (dict): Integer code -> label.
+        ordered (bool, optional): Whether the categories are ordered.
+        keepUnmapped (bool, optional): Keep unlabelled codes (see above).
+    """
+    keys = np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+    self.offset = int(keys.min())
+    self.keepUnmapped = keepUnmapped
+
+    if keepUnmapped:
+      gaps = np.setdiff1d(np.arange(self.offset, keys.max() + 1), keys)
+      if len(gaps) <= MAX_UNMAPPED:
+        mapping = {**mapping, **{int(v): int(v) for v in gaps}}
+
+    categories = list(OrderedSet(mapping.values()))
+    position = {cat: ii for ii, cat in enumerate(categories)}
+    keys = np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+
+    self.dtype = pd.CategoricalDtype(categories, ordered=ordered)
+    self.lut = np.full(
+      int(keys.max()) - self.offset + 1,
+      -1,
+      dtype=np.int8 if len(categories) < 127 else np.int32
+    )
+    self.lut[keys - self.offset] = [position[v] for v in mapping.values()]
+
+  def codes(self, values: np.ndarray) -> np.ndarray:
+    """Category codes of `values` (-1 where missing or unmapped)."""
+    values = np.asarray(values)
+
+    if values.dtype.kind in 'iu':
+      idx = values.astype(np.int64, copy=False) - self.offset
+      valid = (idx >= 0) & (idx < len(self.lut))
+    else:
+      # e.g. floats with NaNs from the 'pandas' engine.
+      values = pd.to_numeric(values, errors='coerce')
+      idx = np.where(np.isfinite(values), values - self.offset, -1)
+      idx = idx.astype(np.int64)
+      valid = (idx >= 0) & (idx < len(self.lut))
+
+    if valid.all():
+      codes = self.lut[idx]
+    else:
+      codes = np.full(len(values), -1, dtype=self.lut.dtype)
+      codes[valid] = self.lut[idx[valid]]
+
+    if self.keepUnmapped:
+      present = np.isfinite(values) if values.dtype.kind == 'f' else True
+      lost = np.unique(values[(codes < 0) & present])
+      if len(lost):
+        warn(
+          'Unlabelled codes set to missing: {}'.format(lost[:10].tolist())
+        )
+
+    return codes
+
+  def __call__(self, values: np.ndarray) -> pd.Categorical:
+    """Recode `values`.
+
+    Args:
+        values (np.ndarray): Integer codes.
+
+    Returns:
+        pd.Categorical: Labels, with dtype `self.dtype`.
+    """
+    return pd.Categorical.from_codes(self.codes(values), dtype=self.dtype)
+
+
+def compileRecodes(recodeDict: dict) -> Dict[str, Dict[str, Recoder]]:
+  """Compile the mappings in `getRecodes()`.
+
+  Args:
+      recodeDict (dict): source variable -> new variable -> mapping
+
+  Returns:
+      dict: source variable -> new variable -> `Recoder` (ordered)
+  """
+  return {
+    var: {rvar: Recoder(lvl, ordered=True)
+          for rvar, lvl in rc.items()}
+    for var, rc in recodeDict.items()
+  }
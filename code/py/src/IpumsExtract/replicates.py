@@ -0,0 +1,154 @@
+"""Replicate-weight standard errors.
+
+The ACS ships 80 replicate person weights ('repwtp1'-'repwtp80') next to
+'perwt'. An estimate is recomputed with each replicate weight and its
+successive difference replicate (SDR) variance is
+
+  Var(X) = 4/80 * sum_r (X_r - X)^2.
+
+Each chunk is reduced with a single sparse product of a (groups x persons)
+indicator matrix and the (persons x 81) matrix of the full and replicate
+weights, and the chunks are merged as in `stream.aggregate`.
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from typing import List, Tuple
+
+from .stream import Aggregation, apply_filters, stream
+
+REPLICATE_PREFIX = 'repwtp'
+N_REPLICATES = 80
+
+# Multiplier of the sum of squared deviations in the SDR variance.
+SDR_FACTOR = 4. / N_REPLICATES
+
+
+def replicate_names(names: List[str], prefix: str = REPLICATE_PREFIX
+                    ) -> List[str]:
+  """Replicate weight variables of an extract, in replicate order."""
+  pattern = r'^{}(\d+)$'.format(prefix)
+  found = pd.Series(names).str.extract(pattern)[0].dropna()
+  return [prefix + num for num in sorted(found, key=int)]
+
+
+def sdr_se(est: np.ndarray, reps: np.ndarray) -> np.ndarray:
+  """SDR standard error of estimates `est` from replicates `reps` (last
+  axis)."""
+  factor = SDR_FACTOR * N_REPLICATES / reps.shape[-1]
+  return np.sqrt(factor * ((reps - est[..., None])**2).sum(axis=-1))
+
+
+class ReplicateAggregation(Aggregation):
+  """Weighted totals under the full weight and every replicate weight.
+
+  Partials are indexed by the group keys with one column of summed weights
+  per weight ('w' for the full weight, then the replicates).
+  """
+
+  def __init__(
+    self,
+    by: List[str],
+    weight: str = 'perwt',
+    replicates: List[str] = [],
+    filters: [List[Tuple], None] = None,
+    scale: float = 1.
+  ):
+    super().__init__(by, weight=weight, filters=filters, scale=scale)
+    self.replicates = list(replicates)
+
+  @property
+  def needed(self) -> List[str]:
+    return list(dict.fromkeys(super().needed + self.replicates))
+
+  def partial(self, df: pd.DataFrame) -> pd.DataFrame:
+    df = apply_filters(df, self.filters)
+
+    W = df[[self.weight] + self.replicates].values.astype(np.float64)
+    W *= self.scale
+
+    gb = pd.DataFrame({col: df[col] for col in self.by}).groupby(
+      self.by, sort=False, dropna=False, observed=True
+    )
+    codes = gb.ngroup().values
+    groups = gb.size().index
+
+    G = scipy.sparse.csr_matrix(
+      (np.ones(len(codes)), (codes, np.arange(len(codes)))),
+      shape=(len(groups), len(codes))
+    )
+
+    return pd.DataFrame(
+      G @ W, index=groups, columns=['w'] + self.replicates
+    )
+
+  def result(self, total: pd.DataFrame,
+             share_of: [List[str], None] = None) -> pd.DataFrame:
+    """Totals (and shares) with SDR standard errors.
+
+    Args:
+        total (pd.DataFrame): Merged partials.
+        share_of (list, None, optional): Keys (a subset of `by`) of the
+          groups that shares are taken within, e.g. `['statefip', 'puma']`
+          for each industry's share of a PUMA's workers. [] for shares of
+          the overall total.
+
+    Returns:
+        pd.DataFrame: Indexed by the (sorted) group keys with columns
+          'total' and 'total_se' (and 'share' and 'share_se').
+    """
+    total = total.sort_index()
+    est = total['w'].values
+    reps = total[self.replicates].values
+
+    out = pd.DataFrame(
+      {'total': est, 'total_se': sdr_se(est, reps)}, index=total.index
+    )
+
+    if share_of is not None:
+      if share_of:
+        parent = total.groupby(
+          level=share_of, sort=False, dropna=False
+        ).transform('sum')
+      else:
+        parent = pd.DataFrame(
+          np.broadcast_to(total.sum().values, total.shape),
+          index=total.index,
+          columns=total.columns
+        )
+
+      with np.errstate(invalid='ignore', divide='ignore'):
+        share = est / parent['w'].values
+        rep_share = reps / parent[self.replicates].values
+
+      out['share'] = share
+      out['share_se'] = sdr_se(share, rep_share)
+
+    out.index.names = self.by
+    return out
+
+
+def estimate(
+  extract,
+  by: List[str],
+  weight: str = 'perwt',
+  replicates: [List[str], None] = None,
+  share_of: [List[str], None] = None,
+  filters: [List[Tuple], None] = None,
+  scale: float = 1.,
+  **kwds
+) -> pd.DataFrame:
+  """Weighted totals/shares with replicate standard errors.
+
+  See `IpumsExtract.estimate`.
+  """
+  if replicates is None:
+    replicates = replicate_names(extract.names)
+  if not replicates:
+    raise KeyError(
+      'The extract has no replicate weights ({}1-{}{}). Request them with '
+      'the extract.'.format(REPLICATE_PREFIX, REPLICATE_PREFIX, N_REPLICATES)
+    )
+
+  agg = ReplicateAggregation(by, weight, replicates, filters, scale)
+  return agg.result(stream(extract, agg, **kwds), share_of)
@@ -0,0 +1,78 @@
+"""On-disk cache of the schema parsed from a `.do` file.
+
+The cache is a pickle holding the parsed schema together with the size,
+mtime and SHA-1 of the `.do` file it came from. It is reused if the size and
+mtime match or, failing that, if the file's contents hash to the same value.
+"""
+import os, pickle
+from typing import Union
+
+from .utils import file_digest
+
+# Attributes of `IpumsExtract` that come from the `.do` file.
+SCHEMA_FIELDS = (
+  'names', 'columns', 'labels', 'levels', 'dtypes', 'stataTypes'
+)
+
+# Bump when the parsed representation changes.
+SCHEMA_VERSION = 1
+
+
+def default_schema_file(doFile: str) -> str:
+  return os.path.splitext(doFile)[0] + '_schema.pkl'
+
+
+def read_schema(doFile: str, schemaFile: str) -> Union[dict, None]:
+  """Read a cached schema if it is still valid for `doFile`.
+
+  Args:
+      doFile (str): Path to the `.do` file.
+      schemaFile (str): Path to the cached schema.
+
+  Returns:
+      dict, None: The schema (see `SCHEMA_FIELDS`), or None.
+  """
+  if not os.path.exists(schemaFile):
+    return None
+
+  try:
+    with open(schemaFile, 'rb') as f:
+      cached = pickle.load(f)
+  except (OSError, EOFError, pickle.UnpicklingError):
+    return None
+
+  if cached.get('version') != SCHEMA_VERSION:
+    return None
+
+  st = os.stat(doFile)
+  if (cached['size'], cached['mtime']) == (st.st_size, st.st_mtime_ns):
+    return cached['schema']
+
+  if cached['size'] == st.st_size and cached['digest'] == file_digest(doFile):
+    write_schema(doFile, schemaFile, cached['schema'], cached['digest'])
+    return cached['schema']
+
+  return None
+
+
+def write_schema(
+  doFile: str, schemaFile: str, schema: dict, digest: [str, None] = None
+) -> None:
+  """Cache a schema parsed from `doFile`.
+
+  Failure to write (e.g. a read-only data directory) is not an error.
+  """
+  st = os.stat(doFile)
+  cached = {
+    'version': SCHEMA_VERSION,
+    'size': st.st_size,
+    'mtime': st.st_mtime_ns,
+    'digest': digest or file_digest(doFile),
+    'schema': schema
+  }
+
+  try:
+    with open(schemaFile, 'wb') as f:
+      pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+  except OSError:
+    pass
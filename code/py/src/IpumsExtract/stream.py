@@ -0,0 +1,306 @@
+"""Streaming (weighted) aggregation of fixed-width extracts.
+
+The extract is read a block at a time, only the variables that are needed
+are parsed, and each block is reduced to per-group partial sums with a
+vectorized groupby. Partials are merged as they arrive, so memory is bounded
+by the number of groups rather than the size of the extract, and no SQLite
+copy of the extract is needed. Blocks can be parsed and reduced in a process
+pool.
+"""
+import collections, itertools, os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+from typing import List, Tuple
+
+from .parser import FixedWidthParser
+
+STATS = ('count', 'sum', 'mean')
+
+FILTER_OPS = {
+  '=': lambda s, v: s == v,
+  '==': lambda s, v: s == v,
+  '!=': lambda s, v: s != v,
+  '<': lambda s, v: s < v,
+  '<=': lambda s, v: s <= v,
+  '>': lambda s, v: s > v,
+  '>=': lambda s, v: s >= v,
+  'in': lambda s, v: s.isin(v),
+  'not in': lambda s, v: ~s.isin(v),
+}
+
+# Set once per worker process by `_init_worker`.
+_worker = {}
+
+
+def apply_filters(df: pd.DataFrame, filters: [List[Tuple], None]
+                  ) -> pd.DataFrame:
+  """Keep the rows of `df` matching every filter.
+
+  Args:
+      df (pd.DataFrame): Frame.
+      filters (list, None): (column, op, value) tuples in the
+        `pyarrow.parquet` format (see `FILTER_OPS`), e.g.
+        `[('statefip', 'in', [17, 18]), ('age', '>=', 16)]`.
+
+  Returns:
+      pd.DataFrame: Matching rows.
+  """
+  if not filters:
+    return df
+
+  keep = np.ones(len(df), dtype=bool)
+  for col, op, value in filters:
+    keep &= FILTER_OPS[op](df[col], value).values
+
+  return df.loc[keep]
+
+
+class Aggregation(object):
+  """Specification and partial results of a streaming aggregation.
+
+  Partials are indexed by the group keys and hold the number of records
+  ('n'), the sum of the weights ('w') and, for each value column `x`, the
+  weighted sum of `x` ('wx_<x>') and the weights of its non-missing records
+  ('w_<x>').
+
+  Attributes:
+      by (list): Columns to group by.
+      weight (str, None): Weight column (None weighs every record by 1).
+      values (list): Columns to sum/average.
+      filters (list, None): See `apply_filters`.
+      scale (float): Multiplies the weights (e.g. 0.01 for the implied
+        decimals of 'perwt').
+  """
+
+  def __init__(
+    self,
+    by: List[str],
+    weight: [str, None] = 'perwt',
+    values: [List[str], None] = None,
+    filters: [List[Tuple], None] = None,
+    scale: float = 1.
+  ):
+    self.by = list(by)
+    self.weight = weight
+    self.values = list(values or [])
+    self.filters = filters
+    self.scale = scale
+
+  @property
+  def needed(self) -> List[str]:
+    """Columns of the extract that the aggregation reads."""
+    cols = self.by + self.values + [col for col, _, _ in self.filters or []]
+    if self.weight is not None:
+      cols.append(self.weight)
+    return list(dict.fromkeys(cols))
+
+  def partial(self, df: pd.DataFrame) -> pd.DataFrame:
+    """Reduce a chunk to partial sums."""
+    df = apply_filters(df, self.filters)
+
+    if self.weight is None:
+      w = np.ones(len(df))
+    else:
+      w = df[self.weight].values.astype(np.float64) * self.scale
+
+    parts = {'n': np.ones(len(df)), 'w': w}
+    for col in self.values:
+      x = df[col].values.astype(np.float64)
+      valid = ~np.isnan(x)
+      parts['wx_' + col] = np.where(valid, w * x, 0.)
+      parts['w_' + col] = np.where(valid, w, 0.)
+
+    parts = pd.DataFrame(parts, index=df.index)
+    keys = [df[col] for col in self.by]
+    return parts.groupby(keys, sort=False, dropna=False, observed=True).sum()
+
+  def merge(self, partials: List[pd.DataFrame]) -> pd.DataFrame:
+    """Combine partial sums."""
+    if len(partials) == 1:
+      return partials[0]
+    return pd.concat(partials).groupby(
+      level=list(range(len(self.by))), sort=False, dropna=False
+    ).sum()
+
+  def result(self, total: pd.DataFrame, stats: List[str]) -> pd.DataFrame:
+    """Final statistics from the merged partial sums.
+
+    Returns:
+        pd.DataFrame: Indexed by the (sorted) group keys with columns 'n'
+          ('count'), the weight column (its sum, 'sum'), '<x>_sum' ('sum')
+          and '<x>_mean' ('mean', weighted by `weight`) for each value
+          column `x`.
+    """
+    out = pd.DataFrame(index=total.index)
+
+    if 'count' in stats:
+      out['n'] = total['n'].astype(np.int64)
+    if 'sum' in stats:
+      out[self.weight or 'w'] = total['w']
+
+    for col in self.values:
+      if 'sum' in stats:
+        out[col + '_sum'] = total['wx_' + col]
+      if 'mean' in stats:
+        with np.errstate(invalid='ignore', divide='ignore'):
+          out[col + '_mean'] = total['wx_' + col] / total['w_' + col]
+
+    out.index.names = self.by
+    return out.sort_index()
+
+
+def _init_worker(
+  names: list, columns: list, dtypes: dict, reclen: int, extract,
+  agg: Aggregation, recodes: bool
+) -> None:
+  parser = FixedWidthParser(names, columns, dtypes)
+  parser.reclen = reclen
+  _worker.update(parser=parser, extract=extract, agg=agg, recodes=recodes)
+
+
+def _aggregate_block(block: bytes) -> pd.DataFrame:
+  df = _worker['parser'].parse(block)
+  if _worker['recodes']:
+    df = _worker['extract'].recodes(df)
+  return _worker['agg'].partial(df)
+
+
+def stream(
+  extract,
+  agg: Aggregation,
+  recodes: bool = False,
+  chunksize: int = 500000,
+  processes: [int, None] = 1,
+  merge_every: int = 16,
+  verbose: bool = True,
+  compression: [str, None] = 'infer',
+  nrows: [int, None] = None
+) -> pd.DataFrame:
+  """Reduce an extract to the merged partial sums of an aggregation.
+
+  Args:
+      extract (IpumsExtract): Extract to read.
+      agg (Aggregation): Aggregation (anything with `needed`, `partial` and
+        `merge`).
+      recodes (bool, optional): Apply `extract.recodes` to each chunk.
+      chunksize (int, optional): Records per chunk.
+      processes (int, None, optional): If not 1, reduce chunks in a pool of
+        this many processes (None for one per CPU).
+      merge_every (int, optional): Partials kept before they are merged.
+      verbose (bool, optional): Report progress with tqdm.
+      compression (str, None, optional): See `FixedWidthParser.open`.
+      nrows (int, None, optional): Stop after this many records.
+
+  Returns:
+      pd.DataFrame: Merged partial sums.
+  """
+  # Only parse the variables that are used (recodes may use any).
+  if recodes:
+    names = list(extract.names)
+  else:
+    missing = set(agg.needed) - set(extract.names)
+    if missing:
+      raise KeyError('Not in the extract: {}'.format(sorted(missing)))
+    names = [name for name in extract.names if name in agg.needed]
+  columns = [extract.columns[extract.names.index(name)] for name in names]
+  dtypes = {name: extract.dtypes[name] for name in names}
+
+  parser = FixedWidthParser(names, columns, dtypes)
+  pbar = tqdm(unit='rows', disable=not verbose)
+
+  partials = []
+
+  def add(partial):
+    partials.append(partial)
+    if len(partials) >= merge_every:
+      partials[:] = [agg.merge(partials)]
+
+  with parser.open(extract.filename, compression) as file:
+    blocks = parser.iter_blocks(file, rows=chunksize, nrows=nrows)
+
+    if processes == 1:
+      for block in blocks:
+        df = parser.parse(block)
+        if recodes:
+          df = extract.recodes(df)
+        add(agg.partial(df))
+        pbar.update(len(df))
+    else:
+      # The record length is known once the first block is read.
+      first = next(blocks, None)
+      blocks = itertools.chain([first], blocks) if first is not None else []
+
+      with ProcessPoolExecutor(
+        processes,
+        initializer=_init_worker,
+        initargs=(
+          names, columns, dtypes, getattr(parser, 'reclen', 0), extract, agg,
+          recodes
+        )
+      ) as pool:
+        window = 2 * (processes or os.cpu_count() or 1)
+        pending = collections.deque()
+
+        for block in blocks:
+          pending.append((
+            pool.submit(_aggregate_block, block), len(block) // parser.reclen
+          ))
+          if len(pending) >= window:
+            future, rows = pending.popleft()
+            add(future.result())
+            pbar.update(rows)
+
+        while pending:
+          future, rows = pending.popleft()
+          add(future.result())
+          pbar.update(rows)
+
+  pbar.close()
+
+  if not partials:
+    partials = [agg.partial(pd.DataFrame(columns=names))]
+
+  return agg.merge(partials)
+
+
+def aggregate(
+  extract,
+  by: List[str],
+  weight: [str, None] = 'perwt',
+  values: [List[str], None] = None,
+  stats: List[str] = ['count', 'sum'],
+  filters: [List[Tuple], None] = None,
+  scale: float = 1.,
+  recodes: bool = False,
+  chunksize: int = 500000,
+  processes: [int, None] = 1,
+  merge_every: int = 16,
+  verbose: bool = True,
+  compression: [str, None] = 'infer',
+  nrows: [int, None] = None
+) -> pd.DataFrame:
+  """Aggregate an extract in one pass over the raw file.
+
+  See `IpumsExtract.aggregate`.
+  """
+  bad = set(stats) - set(STATS)
+  if bad:
+    raise ValueError(
+      'stats must be in {}, not {}'.format(STATS, sorted(bad))
+    )
+
+  agg = Aggregation(by, weight, values, filters, scale)
+  total = stream(
+    extract,
+    agg,
+    recodes=recodes,
+    chunksize=chunksize,
+    processes=processes,
+    merge_every=merge_every,
+    verbose=verbose,
+    compression=compression,
+    nrows=nrows
+  )
+  return agg.result(total, stats)
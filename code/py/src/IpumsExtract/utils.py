@@ -1,7 +1,7 @@
-import collections
+import collections.abc, hashlib
 
 
-class OrderedSet(collections.MutableSet):
+class OrderedSet(collections.abc.MutableSet):
   def __init__(self, iterable=None):
     self.end = end = []
     end += [None, end, end] # sentinel node for doubly linked list
@@ -56,4 +56,20 @@ class OrderedSet(collections.MutableSet):
   def __eq__(self, other):
     if isinstance(other, OrderedSet):
       return len(self) == len(other) and list(self) == list(other)
-    return set(self) == set(other)
\ No newline at end of file
+    return set(self) == set(other)
+
+def file_digest(filename: str, blocksize: int = 2**20) -> str:
+  """SHA-1 hex digest of a file's contents.
+
+  Args:
+      filename (str): Path to the file.
+      blocksize (int, optional): Bytes read at a time.
+
+  Returns:
+      str: Hex digest.
+  """
+  h = hashlib.sha1()
+  with open(filename, 'rb') as f:
+    for block in iter(lambda: f.read(blocksize), b''):
+      h.update(block)
+  return h.hexdigest()
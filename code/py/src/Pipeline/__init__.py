@@ -0,0 +1 @@
+from .dag import Pipeline, Stage
\ No newline at end of file
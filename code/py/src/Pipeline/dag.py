@@ -0,0 +1,297 @@
+"""Dependency-aware runner for the scripts that build `data/int`.
+
+Each `Stage` declares the files that it reads and writes. A stage depends on
+the stages that write its inputs, and stages whose dependencies are done run
+concurrently in a process pool. A stage is skipped if its outputs exist and
+neither its inputs nor its code have changed (by hash) since it last
+succeeded, so a change to one input only rebuilds the stages downstream of
+it. The code of a stage is its module and the project modules that it
+(transitively) imports, e.g. `src.IOTables` for a script that uses it.
+"""
+import importlib, json, os, runpy, time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Union
+
+from ..ResultCache import ResultCache
+from ..ResultCache.sources import module_file, module_sources
+
+STATE_FILE = 'stages.json'
+
+
+class Stage(object):
+  """A step of the pipeline.
+
+  Attributes:
+      name (str): Name of the stage.
+      target (str): 'package.module:function' to call the function, or
+        'package.module' to run the module as a script (as with
+        `python -m`).
+      inputs (list): Files read by the stage.
+      outputs (list): Files written by the stage.
+      code (list): Modules (or files) that the stage runs besides the ones
+        found in its imports (see `sources`), e.g. modules that it imports
+        dynamically.
+      kwds (dict): Keyword arguments of the function.
+  """
+
+  def __init__(
+    self,
+    name: str,
+    target: str,
+    inputs: List[str] = [],
+    outputs: List[str] = [],
+    code: List[str] = [],
+    **kwds
+  ):
+    self.name = name
+    self.target = target
+    self.inputs = list(inputs)
+    self.outputs = list(outputs)
+    self.code = list(code)
+    self.kwds = kwds
+
+  def __repr__(self) -> str:
+    return 'Stage({!r}, {!r})'.format(self.name, self.target)
+
+  @property
+  def module(self) -> str:
+    return self.target.split(':')[0]
+
+  @property
+  def source(self) -> Union[str, None]:
+    """File holding the code of the stage (an implicit input)."""
+    return module_file(self.module)
+
+  def sources(self) -> List[str]:
+    """Files holding the code of the stage (implicit inputs).
+
+    These are the stage's module, the modules of the project (under the
+    directory holding the stage's top-level package) that it imports,
+    directly or through other project modules, and `code`. See
+    `src.ResultCache.sources`.
+    """
+    if self.source is None:
+      return []
+    return module_sources(self.module, self.code)
+
+  def run(self) -> None:
+    if ':' not in self.target:
+      runpy.run_module(self.module, run_name='__main__', alter_sys=True)
+      return
+
+    func = getattr(
+      importlib.import_module(self.module), self.target.split(':')[1]
+    )
+    func(**self.kwds)
+
+
+def _run_stage(stage: Stage) -> float:
+  # Worker: run a stage, returning its wall time.
+  t0 = time.perf_counter()
+  stage.run()
+  return time.perf_counter() - t0
+
+
+class Pipeline(object):
+  """Stages and the record of their last successful runs.
+
+  Attributes:
+      stages (dict): Name -> `Stage`, in the order given.
+      deps (dict): Name -> names of the stages that write its inputs.
+      state_dir (str): Where the digests of the inputs of each stage's last
+        successful run are kept.
+  """
+
+  def __init__(self, stages: List[Stage], state_dir: str):
+    self.stages = {stage.name: stage for stage in stages}
+    self.state_dir = state_dir
+    self.digests = ResultCache(state_dir)
+
+    writer = {}
+    for stage in stages:
+      for fn in stage.outputs:
+        fn = os.path.abspath(fn)
+        if fn in writer:
+          raise ValueError(
+            '{} is written by both {!r} and {!r}'.format(
+              fn, writer[fn], stage.name
+            )
+          )
+        writer[fn] = stage.name
+
+    self.deps = {
+      stage.name: sorted({
+        writer[os.path.abspath(fn)]
+        for fn in stage.inputs if os.path.abspath(fn) in writer
+      } - {stage.name})
+      for stage in stages
+    }
+    self.order()
+
+  def order(self) -> List[str]:
+    """Names of the stages in dependency order (raises on cycles)."""
+    done, out = set(), []
+    visiting = set()
+
+    def visit(name):
+      if name in done:
+        return
+      if name in visiting:
+        raise ValueError('Dependency cycle through {!r}'.format(name))
+      visiting.add(name)
+      for dep in self.deps[name]:
+        visit(dep)
+      visiting.discard(name)
+      done.add(name)
+      out.append(name)
+
+    for name in self.stages:
+      visit(name)
+    return out
+
+  def downstream(self, names: List[str]) -> List[str]:
+    """`names` and every stage that (indirectly) depends on them."""
+    out = set(names)
+    for name in self.order():
+      if set(self.deps[name]) & out:
+        out.add(name)
+    return [name for name in self.order() if name in out]
+
+  def _state_file(self) -> str:
+    return os.path.join(self.state_dir, STATE_FILE)
+
+  def _load_state(self) -> Dict[str, dict]:
+    if not os.path.exists(self._state_file()):
+      return {}
+    try:
+      with open(self._state_file()) as f:
+        return json.load(f)
+    except ValueError:
+      return {}
+
+  def _save_state(self, state: Dict[str, dict]) -> None:
+    os.makedirs(self.state_dir, exist_ok=True)
+    tmp = self._state_file() + '.tmp'
+    with open(tmp, 'w') as f:
+      json.dump(state, f, indent=2)
+    os.replace(tmp, self._state_file())
+
+  def fingerprint(self, name: str) -> Dict[str, str]:
+    """Digests of the inputs and code (see `Stage.sources`) of a stage."""
+    stage = self.stages[name]
+    files = stage.inputs + stage.sources()
+    out = {os.path.abspath(fn): self.digests.digest(fn) for fn in files}
+    out['target'] = json.dumps(
+      [stage.target, stage.kwds], sort_keys=True, default=str
+    )
+    return out
+
+  def is_current(self, name: str, state: [dict, None] = None) -> bool:
+    """Whether the outputs of a stage exist and its inputs and code are as
+    when it last succeeded."""
+    state = self._load_state() if state is None else state
+    stage = self.stages[name]
+    return name in state and \
+      all(os.path.exists(fn) for fn in stage.outputs) and \
+      state[name] == self.fingerprint(name)
+
+  def run(
+    self,
+    stages: [List[str], None] = None,
+    processes: [int, None] = None,
+    force: Union[bool, List[str]] = False,
+    verbose: bool = True
+  ) -> Dict[str, str]:
+    """Bring the outputs of the pipeline up to date.
+
+    Args:
+        stages (list, None, optional): Only run these stages (and the stages
+          that they depend on). Defaults to all.
+        processes (int, None, optional): Stages run at once (None for one
+          per CPU). 1 runs the stages in this process.
+        force (bool, list, optional): Rebuild every stage, or these stages
+          (and everything downstream of them), even if up to date.
+        verbose (bool, optional): Report each stage as it finishes.
+
+    Returns:
+        dict: Name -> 'skipped', 'done', 'failed' or 'not run' (a
+          dependency failed).
+    """
+    wanted = set(stages or self.stages)
+    for name in list(wanted):
+      wanted |= set(self._ancestors(name))
+    order = [name for name in self.order() if name in wanted]
+
+    if force is True:
+      forced = set(order)
+    else:
+      forced = set(self.downstream(list(force or [])))
+
+    state = self._load_state()
+    status = {}
+    pending = list(order)
+    running = {}
+
+    def report(name, result, detail):
+      status[name] = result
+      if verbose:
+        print('{:<32} {} {}'.format(name, result, detail))
+
+    def finish(name, fingerprint, seconds=None, error=None):
+      if error is not None:
+        report(name, 'failed', '({!r})'.format(error))
+        return
+      # The inputs as they were when the stage started.
+      state[name] = fingerprint
+      self._save_state(state)
+      report(name, 'done', '({:.1f} s)'.format(seconds))
+
+    pool = None if processes == 1 else ProcessPoolExecutor(processes)
+    try:
+      while pending or running:
+        # Start (or skip) every stage whose dependencies are done.
+        for name in list(pending):
+          deps = [dep for dep in self.deps[name] if dep in wanted]
+          if any(status.get(dep) in ('failed', 'not run') for dep in deps):
+            pending.remove(name)
+            report(name, 'not run', '(a dependency failed)')
+            continue
+          if not all(status.get(dep) in ('done', 'skipped') for dep in deps):
+            continue
+
+          pending.remove(name)
+          if name not in forced and self.is_current(name, state):
+            report(name, 'skipped', '(up to date)')
+            continue
+
+          fingerprint = self.fingerprint(name)
+          if pool is None:
+            try:
+              finish(name, fingerprint, _run_stage(self.stages[name]))
+            except Exception as e:
+              finish(name, fingerprint, error=e)
+          else:
+            future = pool.submit(_run_stage, self.stages[name])
+            running[future] = (name, fingerprint)
+
+        if not running:
+          continue
+
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+          name, fingerprint = running.pop(future)
+          try:
+            finish(name, fingerprint, future.result())
+          except Exception as e:
+            finish(name, fingerprint, error=e)
+    finally:
+      if pool is not None:
+        pool.shutdown()
+
+    return status
+
+  def _ancestors(self, name: str) -> List[str]:
+    out = []
+    for dep in self.deps[name]:
+      out += [dep] + self._ancestors(dep)
+    return out
@@ -0,0 +1 @@
+from .profiler import Profiler, instrumented, profiling, span
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""Opt-in timing and memory instrumentation.
+
+Methods decorated with `instrumented` (and blocks wrapped in `span`) are
+recorded only while a `Profiler` is active (see `profiling`), and otherwise
+cost a single check. Each record holds the wall and CPU time, the growth of
+the peak RSS of the process and, if the profiler traces memory, the peak
+`tracemalloc` allocation while the span ran, together with the rows of the
+result and the bytes of the input files, and so the throughput.
+
+Spans nest. The records are written as a JSON report (`Profiler.save`) and
+as a Chrome trace (`Profiler.save_trace`, open it in chrome://tracing or
+https://ui.perfetto.dev).
+"""
+import contextlib, functools, json, os, threading, time, tracemalloc
+import numpy as np
+import pandas as pd
+from typing import Callable, Iterator, Union
+
+try:
+  import resource
+except ImportError:  # Windows
+  resource = None
+
+# The active profiler (see `profiling`).
+_active = None
+
+
+def _max_rss_mb() -> [float, None]:
+  if resource is None:
+    return None
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Bytes on macOS, kilobytes elsewhere.
+  return rss / 2**20 if os.uname().sysname == 'Darwin' else rss / 2**10
+
+
+def _rows(value) -> [int, None]:
+  if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+    return len(value)
+  if isinstance(value, np.ndarray) and value.ndim:
+    return value.shape[0]
+  return None
+
+
+class Profiler(object):
+  """Records of the spans run while the profiler is active.
+
+  Attributes:
+      memory (bool): Trace allocations with `tracemalloc` (slows down
+        allocation-heavy code).
+      records (list): One dict per finished span, in the order that they
+        finished.
+  """
+
+  def __init__(self, memory: bool = True):
+    self.memory = memory
+    self.records = []
+    self._stack = []
+    self._t0 = time.perf_counter()
+    self._started_tracing = False
+
+  def start(self) -> 'Profiler':
+    if self.memory and not tracemalloc.is_tracing():
+      tracemalloc.start()
+      self._started_tracing = True
+    return self
+
+  def stop(self) -> 'Profiler':
+    if self._started_tracing:
+      tracemalloc.stop()
+      self._started_tracing = False
+    return self
+
+  @contextlib.contextmanager
+  def span(self, name: str, nbytes: [int, None] = None, **meta) -> Iterator:
+    """Record the enclosed block.
+
+    Args:
+        name (str): Name of the span (e.g. a method's qualified name).
+        nbytes (int, None, optional): Bytes processed (for bytes/s).
+        **meta: Extra fields of the record.
+
+    Yields:
+        dict: The record. Set its 'rows' to report the rows processed.
+    """
+    tracing = self.memory and tracemalloc.is_tracing()
+
+    record = dict(
+      name=name,
+      depth=len(self._stack),
+      thread=threading.get_ident(),
+      rows=None,
+      bytes=nbytes,
+      **meta
+    )
+    frame = {'peak': 0}
+    if tracing:
+      current, peak = tracemalloc.get_traced_memory()
+      if self._stack:
+        self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+      tracemalloc.reset_peak()
+      frame['base'] = current
+    self._stack.append(frame)
+
+    rss0 = _max_rss_mb()
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    try:
+      yield record
+    finally:
+      wall = time.perf_counter() - t0
+      cpu = time.process_time() - cpu0
+      rss1 = _max_rss_mb()
+
+      self._stack.pop()
+      if tracing and tracemalloc.is_tracing():
+        peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        if self._stack:
+          self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+        record['traced_peak_mb'] = (peak - frame['base']) / 2**20
+
+      record.update(
+        start=t0 - self._t0,
+        wall=wall,
+        cpu=cpu,
+        rss_peak_mb=rss1,
+        rss_growth_mb=None if rss0 is None else rss1 - rss0
+      )
+      if record['rows'] is not None and wall > 0:
+        record['rows_per_s'] = record['rows'] / wall
+      if record['bytes'] is not None and wall > 0:
+        record['bytes_per_s'] = record['bytes'] / wall
+
+      self.records.append(record)
+
+  def spans(self) -> pd.DataFrame:
+    """The records, in the order that the spans started."""
+    return pd.DataFrame(self.records).sort_values('start').reset_index(
+      drop=True
+    )
+
+  def summary(self) -> pd.DataFrame:
+    """Calls, total wall/CPU time and largest memory peaks by span name,
+    slowest first."""
+    df = pd.DataFrame(self.records)
+    if df.empty:
+      return df
+
+    total = lambda x: pd.to_numeric(x).sum(min_count=1)
+    agg = {'calls': ('wall', 'size'), 'wall': ('wall', 'sum'),
+           'cpu': ('cpu', 'sum'), 'rows': ('rows', total),
+           'bytes': ('bytes', total)}
+    for col in ['traced_peak_mb', 'rss_growth_mb']:
+      if col in df.columns:
+        agg[col] = (col, 'max')
+
+    out = df.groupby('name', sort=False).agg(**agg)
+    with np.errstate(invalid='ignore', divide='ignore'):
+      out['rows_per_s'] = out['rows'] / out['wall']
+      out['bytes_per_s'] = out['bytes'] / out['wall']
+    return out.sort_values('wall', ascending=False)
+
+  def save(self, filename: str) -> None:
+    """Write the records and the summary to a JSON report."""
+    summary = self.summary()
+    report = {
+      'spans': self.spans().to_dict(orient='records') if self.records else [],
+      'summary': summary.reset_index().to_dict(orient='records')
+    }
+    with open(filename, 'w') as f:
+      json.dump(report, f, indent=2, default=_json_default)
+
+  def save_trace(self, filename: str) -> None:
+    """Write the spans as a Chrome trace ('complete' events)."""
+    keys = ('rows', 'bytes', 'cpu', 'traced_peak_mb', 'rss_growth_mb')
+    events = [{
+      'name': rec['name'],
+      'ph': 'X',
+      'ts': rec['start'] * 1e6,
+      'dur': rec['wall'] * 1e6,
+      'pid': os.getpid(),
+      'tid': rec['thread'],
+      'args': {k: rec[k] for k in keys if rec.get(k) is not None}
+    } for rec in self.records]
+
+    with open(filename, 'w') as f:
+      json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f,
+                default=_json_default)
+
+
+def _json_default(value):
+  if isinstance(value, np.generic):
+    return value.item()
+  if value is pd.NA or value is pd.NaT:
+    return None
+  return str(value)
+
+
+@contextlib.contextmanager
+def profiling(
+  report: [str, None] = None,
+  trace: [str, None] = None,
+  memory: bool = True
+) -> Iterator[Profiler]:
+  """Activate a profiler for the enclosed block.
+
+  Args:
+      report (str, None, optional): Write the JSON report here on exit.
+      trace (str, None, optional): Write a Chrome trace here on exit.
+      memory (bool, optional): Trace allocations (see `Profiler`).
+
+  Yields:
+      Profiler: The active profiler.
+  """
+  global _active
+  previous, _active = _active, Profiler(memory=memory).start()
+  prof = _active
+  try:
+    yield prof
+  finally:
+    _active = previous
+    prof.stop()
+    if report is not None:
+      prof.save(report)
+    if trace is not None:
+      prof.save_trace(trace)
+
+
+@contextlib.contextmanager
+def span(name: str, nbytes: [int, None] = None, **meta) -> Iterator:
+  """`Profiler.span` of the active profiler (does nothing if none is)."""
+  if _active is None:
+    yield {}
+  else:
+    with _active.span(name, nbytes=nbytes, **meta) as record:
+      yield record
+
+
+def instrumented(*inputs: Union[str, Callable]) -> Callable:
+  """Record a method (or function) while a profiler is active.
+
+  The rows of the result (frames, series and arrays) and the size of the
+  input files are recorded.
+
+  Args:
+      *inputs (str, Callable): Files that the method reads, or functions of
+        the object returning one (e.g. `lambda self: self.filename`).
+
+  Returns:
+      Callable: Decorator.
+  """
+
+  def decorator(method: Callable) -> Callable:
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwds):
+      if _active is None:
+        return method(*args, **kwds)
+
+      files = [fn(args[0]) if callable(fn) else fn for fn in inputs]
+      sizes = [os.path.getsize(fn) for fn in files if os.path.exists(fn)]
+
+      with _active.span(
+        method.__qualname__, nbytes=sum(sizes) if sizes else None
+      ) as record:
+        value = method(*args, **kwds)
+        record['rows'] = _rows(value)
+      return value
+
+    return wrapper
+
+  return decorator
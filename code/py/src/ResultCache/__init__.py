@@ -0,0 +1 @@
+from .store import ResultCache, cached
\ No newline at end of file
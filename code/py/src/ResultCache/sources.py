@@ -0,0 +1,94 @@
+"""Files holding the code that a module runs.
+
+A module's code is its own file and the modules of the project (under the
+directory holding its top-level package) that it imports, directly or
+through other project modules. Imports are found by parsing the files, so
+nothing is imported.
+"""
+import ast, importlib.util, os
+from typing import Iterable, List, Union
+
+
+def module_file(module: str) -> Union[str, None]:
+  """File of a module (the `__init__.py` of a package), or None."""
+  try:
+    spec = importlib.util.find_spec(module)
+  except (ImportError, ValueError):
+    return None
+  return None if spec is None else spec.origin
+
+
+def module_sources(
+  module: str, code: Iterable[str] = (), filename: [str, None] = None
+) -> List[str]:
+  """Files holding the code of a module and the project modules it imports.
+
+  Args:
+      module (str): Absolute name of the module.
+      code (iterable, optional): Other modules (or files) to include, with
+        their imports, e.g. modules that are imported dynamically.
+      filename (str, None, optional): File of the module, if it cannot be
+        found from its name (e.g. a script run as `__main__`).
+
+  Returns:
+      list: Absolute paths, sorted. Empty if the module is not found.
+  """
+  source = filename or module_file(module)
+  if source is None:
+    return []
+  source = os.path.abspath(source)
+
+  top = module_file(module.split('.')[0]) or source
+  root = os.path.dirname(os.path.dirname(os.path.abspath(top)))
+  if not os.path.basename(top).startswith('__init__.'):
+    # A top-level module rather than a package.
+    root = os.path.dirname(os.path.abspath(top))
+
+  found = set()
+  todo = [(module, source)]
+  for name in code:
+    if os.path.exists(name):
+      found.add(os.path.abspath(name))
+    else:
+      todo.append((name, module_file(name)))
+
+  while todo:
+    name, fn = todo.pop()
+    if fn is None or fn in found or not fn.endswith('.py'):
+      continue
+    found.add(fn)
+    for imported in _imports(name, fn):
+      origin = module_file(imported)
+      if origin is not None and \
+        os.path.abspath(origin).startswith(root + os.sep):
+        todo.append((imported, os.path.abspath(origin)))
+
+  return sorted(found)
+
+
+def _imports(module: str, filename: str) -> List[str]:
+  # Modules (absolute names) imported by a module, including the candidate
+  # submodules of `from package import name`.
+  with open(filename, 'rb') as f:
+    tree = ast.parse(f.read(), filename)
+
+  is_package = os.path.basename(filename).startswith('__init__.')
+  package = module if is_package else module.rpartition('.')[0]
+
+  out = []
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Import):
+      out += [alias.name for alias in node.names]
+    elif isinstance(node, ast.ImportFrom):
+      base = node.module or ''
+      if node.level:
+        parent = package.split('.')
+        parent = parent[:len(parent) - node.level + 1]
+        base = '.'.join(parent + ([base] if base else []))
+      if base:
+        out.append(base)
+      out += [
+        '{}.{}'.format(base, alias.name) if base else alias.name
+        for alias in node.names if alias.name != '*'
+      ]
+  return out
@@ -0,0 +1,360 @@
+"""On-disk memoization of method results.
+
+Each result is pickled to `<cache_dir>/<name>-<key>.pkl`, where the key
+hashes the method's arguments together with the contents of the input files
+that it (directly or indirectly) reads, the object's settings that it
+depends on and the code of the method's module and of the project modules
+that it imports. Changing an input file (or the code) therefore changes the
+key, and the stale entries are eventually evicted: the cache is kept under
+`max_bytes` by removing the least recently used entries.
+"""
+import functools, hashlib, inspect, json, os, pickle, sys
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from typing import Callable, Dict, Iterable, Tuple
+
+from ..IpumsExtract.utils import file_digest
+from .sources import module_sources
+
+DIGESTS_FILE = 'digests.json'
+SUFFIX = '.pkl'
+
+
+def code_version(func: Callable) -> str:
+  """Hash of the code that a function runs, so that editing it invalidates
+  its cached results.
+
+  This covers the function's module and the project modules that it imports
+  (see `module_sources`), or the function's own bytecode if its module's
+  file cannot be found.
+  """
+  module = sys.modules.get(func.__module__)
+  spec = getattr(module, '__spec__', None)
+  try:
+    filename = inspect.getsourcefile(func)
+  except TypeError:
+    filename = None
+
+  # A script run with `python -m` is `__main__`, but its spec has its name.
+  name = func.__module__ if spec is None else spec.name
+  version = _module_version(name, filename)
+  if version is not None:
+    return version
+
+  code = func.__code__.co_code + repr(func.__code__.co_consts).encode()
+  return hashlib.sha1(code).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _module_version(module: str, filename: [str, None]) -> [str, None]:
+  # Hash of the files of a module and the project modules it imports.
+  files = module_sources(module, filename=filename)
+  if not files:
+    return None
+
+  h = hashlib.sha1()
+  for fn in files:
+    h.update(os.path.basename(fn).encode())
+    h.update(file_digest(fn).encode())
+  return h.hexdigest()
+
+
+def _hash_value(h, value) -> None:
+  # Feed `value` to the hash `h`, covering the types passed to the scripts'
+  # methods (pandas objects, arrays, containers and scalars) and the objects
+  # that they keep (crosswalks, engines), by their public attributes.
+  h.update(type(value).__name__.encode())
+
+  if isinstance(value, (pd.DataFrame, pd.Series)):
+    h.update(pd.util.hash_pandas_object(value).values.tobytes())
+    if isinstance(value, pd.DataFrame):
+      _hash_value(h, list(value.columns))
+  elif isinstance(value, pd.Index):
+    h.update(pd.util.hash_pandas_object(value).values.tobytes())
+  elif isinstance(value, np.ndarray):
+    h.update('{}{}'.format(value.dtype.str, value.shape).encode())
+    h.update(np.ascontiguousarray(value).tobytes())
+  elif isinstance(value, dict):
+    for k in sorted(value, key=repr):
+      _hash_value(h, k)
+      _hash_value(h, value[k])
+  elif isinstance(value, (list, tuple)):
+    h.update(str(len(value)).encode())
+    for v in value:
+      _hash_value(h, v)
+  elif isinstance(value, (set, frozenset)):
+    _hash_value(h, sorted(value, key=repr))
+  elif scipy.sparse.issparse(value):
+    value = scipy.sparse.csr_matrix(value)
+    _hash_value(h, [value.shape, value.data, value.indices, value.indptr])
+  elif hasattr(value, '__dict__') and not callable(value):
+    _hash_value(h, {
+      k: v for k, v in vars(value).items() if not k.startswith('_')
+    })
+  else:
+    h.update(repr(value).encode())
+
+
+class ResultCache(object):
+  """Size-bounded, content-addressed store of pickled results.
+
+  Attributes:
+      cache_dir (str): Directory holding the cached results.
+      max_bytes (int): Entries are evicted (least recently used first) once
+        the cache grows beyond this size.
+  """
+
+  def __init__(self, cache_dir: str, max_bytes: int = 2**30):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+
+  def digest(self, filename: str) -> str:
+    """Hash of an input file.
+
+    Digests are remembered (by file size and mtime) so that large inputs
+    (e.g. the ACS database) are only hashed when they change.
+
+    Returns:
+        str: Hex digest, or 'missing' if the file does not exist (e.g. an
+          input that is only read for some arguments).
+    """
+    fn = os.path.abspath(filename)
+    if not os.path.exists(fn):
+      return 'missing'
+    st = os.stat(fn)
+    digests_file = os.path.join(self.cache_dir, DIGESTS_FILE)
+
+    digests = {}
+    if os.path.exists(digests_file):
+      try:
+        with open(digests_file) as f:
+          digests = json.load(f)
+      except ValueError:
+        pass
+
+    size, mtime, digest = digests.get(fn, (None, None, None))
+    if (size, mtime) != (st.st_size, st.st_mtime_ns):
+      digest = file_digest(fn)
+      digests[fn] = (st.st_size, st.st_mtime_ns, digest)
+      os.makedirs(self.cache_dir, exist_ok=True)
+      with open(digests_file, 'w') as f:
+        json.dump(digests, f)
+
+    return digest
+
+  def key(
+    self,
+    name: str,
+    arguments: Dict[str, object],
+    inputs: Iterable[str] = (),
+    state: Dict[str, object] = {},
+    version: str = ''
+  ) -> str:
+    """Key of a result.
+
+    Args:
+        name (str): Name of the computation (e.g. a method's qualified name).
+        arguments (dict): Arguments of the computation.
+        inputs (iterable, optional): Files that the computation reads.
+        state (dict, optional): Other values that the result depends on
+          (e.g. attributes of the object).
+        version (str, optional): Version of the computation's code (see
+          `code_version`).
+
+    Returns:
+        str: '<name>-<hex digest>'.
+    """
+    # Pickles (and some results) differ between pandas versions.
+    h = hashlib.sha1(pd.__version__.encode())
+    _hash_value(h, name)
+    _hash_value(h, version)
+    _hash_value(h, arguments)
+    _hash_value(h, state)
+    for fn in inputs:
+      h.update(self.digest(fn).encode())
+
+    return '{}-{}'.format(name, h.hexdigest())
+
+  def _path(self, key: str) -> str:
+    return os.path.join(self.cache_dir, key + SUFFIX)
+
+  def get(self, key: str) -> Tuple[bool, object]:
+    """Look up a result.
+
+    Entries that cannot be read, including pickles of classes that have
+    since been moved, renamed or removed, are misses.
+
+    Returns:
+        tuple: (whether the result was cached, the result or None)
+    """
+    path = self._path(key)
+    try:
+      with open(path, 'rb') as f:
+        value = pickle.load(f)
+    except (
+      OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError,
+      IndexError, TypeError, ValueError
+    ):
+      return False, None
+
+    # Mark as recently used (unless another process just evicted it).
+    try:
+      os.utime(path)
+    except FileNotFoundError:
+      pass
+    return True, value
+
+  def put(self, key: str, value: object) -> None:
+    """Store a result, then evict old entries if the cache is too large.
+
+    Failure to write (e.g. a read-only data directory) is not an error.
+    """
+    path = self._path(key)
+    try:
+      os.makedirs(self.cache_dir, exist_ok=True)
+      with open(path + '.tmp', 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(path + '.tmp', path)
+    except OSError:
+      return
+
+    self.evict()
+
+  def entries(self) -> pd.DataFrame:
+    """Cached entries.
+
+    Returns:
+        pd.DataFrame: key, bytes and last-used time of each entry, most
+          recently used first.
+    """
+    rows = []
+    if os.path.isdir(self.cache_dir):
+      for fn in os.listdir(self.cache_dir):
+        if not fn.endswith(SUFFIX):
+          continue
+        try:
+          st = os.stat(os.path.join(self.cache_dir, fn))
+        except FileNotFoundError:
+          continue
+        rows.append((fn[:-len(SUFFIX)], st.st_size, st.st_mtime))
+
+    df = pd.DataFrame(rows, columns=['key', 'bytes', 'used'])
+    df['used'] = pd.to_datetime(df['used'], unit='s')
+    return df.sort_values('used', ascending=False).reset_index(drop=True)
+
+  def evict(self, max_bytes: [int, None] = None) -> int:
+    """Remove the least recently used entries until the cache fits.
+
+    Args:
+        max_bytes (int, None, optional): Defaults to `self.max_bytes`.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    if max_bytes is None:
+      max_bytes = self.max_bytes
+
+    entries = self.entries()
+    excess = entries['bytes'].cumsum() > max_bytes
+    removed = 0
+    for key in entries.loc[excess, 'key']:
+      removed += self._remove(key)
+
+    return removed
+
+  def invalidate(self, name: [str, None] = None) -> int:
+    """Remove cached results.
+
+    Args:
+        name (str, None, optional): Only remove the results of this
+          computation (e.g. 'DownstreamTariffExposure.get_acs_data'). Removes
+          everything if None.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    entries = self.entries()
+    if name is not None:
+      names = entries['key'].str.rsplit('-', n=1).str[0]
+      entries = entries.loc[names == name]
+
+    return sum(self._remove(key) for key in entries['key'])
+
+  def _remove(self, key: str) -> bool:
+    # Whether the entry was removed (rather than already gone, e.g. evicted
+    # by another process sharing the cache).
+    try:
+      os.remove(self._path(key))
+    except FileNotFoundError:
+      return False
+    return True
+
+
+def cached(
+  *inputs: str, attr: [str, None] = None, state: Iterable[str] = ()
+) -> Callable:
+  """Memoize a method in its object's `cache` (a `ResultCache`).
+
+  The method is called as usual if the object has no cache (`cache` is
+  missing or None). Otherwise results are keyed on the method's arguments
+  (with defaults filled in, `inplace` excluded), the contents of `inputs`,
+  the contents of the attributes named in `state` and the method's code (see
+  `code_version`).
+
+  Args:
+      *inputs (str): Files that the method (directly or indirectly) reads.
+      attr (str, None, optional): For `get_*` methods with an `inplace`
+        argument, the attribute that `inplace=True` sets to the result. It is
+        set on cache hits too.
+      state (iterable, optional): Attributes of the object that the method
+        (directly or indirectly) depends on besides `inputs`: settings, and
+        data that was given rather than loaded from `inputs`. They must be
+        set when the object is created, not loaded as needed, so that the
+        key does not depend on which methods were called before.
+
+  Returns:
+      Callable: Decorator.
+  """
+  state = tuple(state)
+
+  def decorator(method: Callable) -> Callable:
+    sig = inspect.signature(method)
+    version = code_version(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwds):
+      cache = getattr(self, 'cache', None)
+      if cache is None:
+        return method(self, *args, **kwds)
+
+      bound = sig.bind(self, *args, **kwds)
+      bound.apply_defaults()
+
+      arguments = dict(bound.arguments)
+      del arguments['self']
+      inplace = arguments.pop('inplace', False)
+
+      key = cache.key(
+        method.__qualname__,
+        arguments,
+        inputs,
+        state={name: getattr(self, name) for name in state},
+        version=version
+      )
+      hit, value = cache.get(key)
+
+      if not hit:
+        if attr is not None and 'inplace' in bound.arguments:
+          bound.arguments['inplace'] = False
+        value = method(*bound.args, **bound.kwargs)
+        cache.put(key, value)
+
+      if inplace and attr is not None:
+        setattr(self, attr, value)
+
+      return value
+
+    return wrapper
+
+  return decorator